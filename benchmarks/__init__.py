@@ -0,0 +1,5 @@
+"""Micro-benchmarks of the API.
+
+Run a benchmark as a module from the root directory, e.g.
+`python -m benchmarks.serialization`.
+"""
@@ -0,0 +1,360 @@
+"""Load benchmark of the API with mixes of realistic requests.
+
+Generates a seeded dataset with `repost.dataset`, then sends a mix of
+requests to the app, either in-process or to a uvicorn server on
+localhost, and reports the throughput and the p50, p95 and p99 latency
+of every route, and the number of database queries per request from
+the Server-Timing header.
+
+Results are saved as JSON with `--output`, and compared with the results
+of another run with `--compare`, e.g. before and after a change:
+
+    python -m benchmarks.load --mix read --output before.json
+    python -m benchmarks.load --mix read --compare before.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+# Request to send as (route, method, path, keyword arguments of requests)
+Request = Tuple[str, str, str, Dict[str, Any]]
+
+# Number of queries in the db metric of the Server-Timing header
+_queries_pattern = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class Dataset:
+    """Items of the benchmark database that requests are sent for.
+
+    Items are ordered by popularity, so that picking them with `pick`
+    sends most requests for a few popular items.
+    """
+
+    def __init__(self, db, tokens: List[Dict[str, str]], seed: int):
+        from repost import config, models
+
+        self.client_id = config.client_id
+        self.rng = random.Random(seed)
+        self.tokens = tokens
+        self.resubs = [name for name, in db.query(models.Resub.name).order_by(models.Resub.id)]
+        self.usernames = [username for username, in db.query(models.User.username).order_by(models.User.id)]
+        self.posts = [post_id for post_id, in db.query(models.Post.id).order_by(models.Post.score.desc())]
+        self.comments = [comment_id for comment_id, in
+                         db.query(models.Comment.id).order_by(models.Comment.score.desc())]
+
+    def pick(self, items: List[Any]) -> Any:
+        """Pick an item, where the k-th item is picked about 1 / k as often
+        as the first.
+        """
+        return items[min(int(len(items) ** self.rng.random()) - 1, len(items) - 1)]
+
+    def auth(self) -> Dict[str, Any]:
+        return {'headers': self.rng.choice(self.tokens)}
+
+
+def list_posts(data: Dataset) -> Request:
+    sort = data.rng.choice(('new', 'hot', 'top'))
+    return 'GET /resubs/{resub}/posts', 'GET', f'/api/resubs/{data.pick(data.resubs)}/posts', {
+        'params': {'sort': sort, 'page_size': 25}}
+
+
+def get_resub(data: Dataset) -> Request:
+    return 'GET /resubs/{resub}', 'GET', f'/api/resubs/{data.pick(data.resubs)}', {}
+
+
+def get_post(data: Dataset) -> Request:
+    return 'GET /posts/{post_id}', 'GET', f'/api/posts/{data.pick(data.posts)}', {}
+
+
+def get_comment_tree(data: Dataset) -> Request:
+    return 'GET /posts/{post_id}/comments/tree', 'GET', f'/api/posts/{data.pick(data.posts)}/comments/tree', {}
+
+
+def get_user(data: Dataset) -> Request:
+    return 'GET /users/{username}', 'GET', f'/api/users/{data.pick(data.usernames)}', {}
+
+
+def vote_post(data: Dataset) -> Request:
+    vote = data.rng.choice((-1, 0, 1, 1, 1))
+    return 'PATCH /posts/{post_id}/vote/{vote}', 'PATCH', f'/api/posts/{data.pick(data.posts)}/vote/{vote}', \
+        data.auth()
+
+
+def vote_comment(data: Dataset) -> Request:
+    vote = data.rng.choice((-1, 0, 1, 1, 1))
+    return 'PATCH /comments/{comment_id}/vote/{vote}', 'PATCH', \
+        f'/api/comments/{data.pick(data.comments)}/vote/{vote}', data.auth()
+
+
+def vote_batch(data: Dataset) -> Request:
+    votes = {'posts': [{'id': data.pick(data.posts), 'vote': 1} for _ in range(10)],
+             'comments': [{'id': data.pick(data.comments), 'vote': 1} for _ in range(10)]}
+    return 'POST /votes/batch', 'POST', '/api/votes/batch', {'json': votes, **data.auth()}
+
+
+def create_comment(data: Dataset) -> Request:
+    return 'POST /posts/{post_id}/comments', 'POST', f'/api/posts/{data.pick(data.posts)}/comments', {
+        'json': {'content': 'Benchmark comment'}, **data.auth()}
+
+
+def create_reply(data: Dataset) -> Request:
+    return 'POST /comments/{comment_id}', 'POST', f'/api/comments/{data.pick(data.comments)}', {
+        'json': {'content': 'Benchmark reply'}, **data.auth()}
+
+
+def login(data: Dataset) -> Request:
+    return 'POST /auth/token', 'POST', '/api/auth/token', {
+        'data': {'username': data.pick(data.usernames), 'password': 'password', 'client_id': data.client_id}}
+
+
+# Weights of the requests in every mix
+mixes: Dict[str, List[Tuple[int, Callable[[Dataset], Request]]]] = {
+    'read': [(50, list_posts), (15, get_post), (20, get_comment_tree), (5, get_user), (9, get_resub), (1, login)],
+    'vote': [(40, vote_post), (25, vote_comment), (10, vote_batch), (24, list_posts), (1, login)],
+    'comment': [(30, create_comment), (25, create_reply), (30, get_comment_tree), (14, list_posts), (1, login)],
+}
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def summarize(latencies: Dict[str, List[float]], queries: Dict[str, List[int]], errors: Dict[str, int],
+              elapsed: float) -> Dict[str, Any]:
+    """Summarize the latencies in seconds and query counts by route."""
+    routes = {}
+    for route, values in sorted(latencies.items()):
+        values = sorted(values)
+        routes[route] = {
+            'requests': len(values),
+            'errors': errors.get(route, 0),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+        }
+        if route in queries:
+            routes[route]['queries_per_request'] = round(sum(queries[route]) / len(queries[route]), 2)
+
+    total = sum(len(values) for values in latencies.values())
+    return {'requests': total, 'seconds': round(elapsed, 3), 'requests_per_second': round(total / elapsed, 1),
+            'routes': routes}
+
+
+def queries_from_header(response: requests.Response) -> Optional[int]:
+    """Get the number of queries from the Server-Timing header."""
+    match = _queries_pattern.search(response.headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def run_mix(mix: str, data: Dataset, send: Callable[[Request], requests.Response], requests_count: int,
+            concurrency: int) -> Dict[str, Any]:
+    """Send the requests of the mix and summarize the results."""
+    routes, weights = zip(*((request, weight) for weight, request in mixes[mix]))
+    planned = [data.rng.choices(routes, weights)[0](data) for _ in range(requests_count)]
+
+    latencies = defaultdict(list)
+    queries = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def run(request: Request):
+        route = request[0]
+        start = time.perf_counter()
+        response = send(request)
+        latency = time.perf_counter() - start
+        query_count = queries_from_header(response)
+        with lock:
+            latencies[route].append(latency)
+            if query_count is not None:
+                queries[route].append(query_count)
+            if response.status_code >= 400:
+                errors[route] += 1
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        for request in planned:
+            run(request)
+    else:
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(run, planned))
+
+    return summarize(latencies, queries, errors, time.perf_counter() - start)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url: str) -> Tuple[subprocess.Popen, str]:
+    """Start uvicorn with the benchmark database, and get the process and
+    its base URL.
+    """
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'repost:app', '--port', str(port),
+                                '--log-level', 'warning'], env={**os.environ, 'REPOST_DATABASE_URL': database_url})
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(base_url + '/api/resubs/', timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError('uvicorn did not start')
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print the change in throughput and latency from the baseline."""
+    def change(new: float, old: float) -> str:
+        return f'{(new - old) / old * 100:+6.1f}%' if old else '   n/a'
+
+    for mix, result in results['mixes'].items():
+        old = baseline['mixes'].get(mix)
+        if old is None:
+            continue
+
+        print(f'\n{mix} mix: {change(result["requests_per_second"], old["requests_per_second"])} requests/s')
+        for route, stats in result['routes'].items():
+            old_stats = old['routes'].get(route)
+            if old_stats:
+                print(f'  {route:42} p50 {change(stats["p50_ms"], old_stats["p50_ms"])}  '
+                      f'p95 {change(stats["p95_ms"], old_stats["p95_ms"])}  '
+                      f'p99 {change(stats["p99_ms"], old_stats["p99_ms"])}')
+
+
+def print_results(results: Dict[str, Any]):
+    for mix, result in results['mixes'].items():
+        print(f'\n{mix} mix: {result["requests"]} requests, {result["requests_per_second"]} requests/s')
+        for route, stats in result['routes'].items():
+            queries = stats.get('queries_per_request', '-')
+            print(f'  {route:42} {stats["requests"]:6}  p50 {stats["p50_ms"]:8.2f} ms  p95 {stats["p95_ms"]:8.2f} ms  '
+                  f'p99 {stats["p99_ms"]:8.2f} ms  queries {queries:>5}  errors {stats["errors"]}')
+
+
+def _commit() -> str:
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        return output.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', choices=[*mixes, 'all'], default='all', help='Mix of requests to send')
+    parser.add_argument('--requests', type=int, default=2000, help='Number of requests in every mix')
+    parser.add_argument('--warmup', type=int, default=200, help='Number of requests sent before measuring')
+    parser.add_argument('--database-url', help='Database to benchmark, instead of a new SQLite database')
+    parser.add_argument('--skip-generate', action='store_true', help='Use the data already in the database')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--resubs', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--comments', type=int, default=25000)
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the dataset and the requests')
+    parser.add_argument('--server', action='store_true', help='Send requests to uvicorn instead of in-process')
+    parser.add_argument('--concurrency', type=int, default=1, help='Requests sent at once to the server')
+    parser.add_argument('--output', help='Save the results as JSON to this file')
+    parser.add_argument('--compare', help='Compare with the results saved in this file')
+    args = parser.parse_args()
+    if args.concurrency > 1 and not args.server:
+        parser.error('--concurrency requires --server, since in-process requests are sent one at a time')
+
+    directory = tempfile.TemporaryDirectory()
+    database_url = args.database_url or f'sqlite:///{directory.name}/benchmark.db'
+
+    # The database is set up when the app is imported
+    os.environ['REPOST_DATABASE_URL'] = database_url
+    from starlette.testclient import TestClient
+
+    from repost import app, config, crud, models
+    from repost.database import SessionLocal, engine
+    from repost.dataset import generate_dataset
+
+    db = SessionLocal()
+    if not args.skip_generate:
+        loader = crud.BulkLoader(db, password='password')
+        generate_dataset(loader, users=args.users, resubs=args.resubs, posts=args.posts, comments=args.comments,
+                         seed=args.seed)
+
+    process = None
+    if args.server:
+        process, base_url = start_server(database_url)
+        sessions = threading.local()
+
+        def send(request: Request) -> requests.Response:
+            if not hasattr(sessions, 'session'):
+                sessions.session = requests.Session()
+            _, method, path, kwargs = request
+            return sessions.session.request(method, base_url + path, **kwargs)
+    else:
+        client = TestClient(app)
+
+        def send(request: Request) -> requests.Response:
+            _, method, path, kwargs = request
+            return client.request(method, path, **kwargs)
+
+    try:
+        # Log in as a few users before measuring, since logging in is slow
+        tokens = []
+        for username, in db.query(models.User.username).order_by(models.User.id).limit(10):
+            response = send(('', 'POST', '/api/auth/token', {
+                'data': {'username': username, 'password': 'password', 'client_id': config.client_id}}))
+            tokens.append({'Authorization': f'Bearer {response.json()["access_token"]}'})
+
+        data = Dataset(db, tokens, args.seed)
+        results = {
+            'commit': _commit(),
+            'time': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': engine.dialect.name,
+            'server': 'uvicorn' if args.server else 'in-process',
+            'concurrency': args.concurrency,
+            'dataset': None if args.skip_generate else {'users': args.users, 'resubs': args.resubs, 'posts': args.posts,
+                                                        'comments': args.comments, 'seed': args.seed},
+            'response_cache': config.response_cache,
+            'vote_write_behind': config.vote_write_behind,
+            'mixes': {},
+        }
+        for mix in mixes if args.mix == 'all' else [args.mix]:
+            run_mix(mix, data, send, args.warmup, args.concurrency)
+            results['mixes'][mix] = run_mix(mix, data, send, args.requests, args.concurrency)
+    finally:
+        db.close()
+        if process is not None:
+            process.terminate()
+            process.wait()
+        directory.cleanup()
+
+    print_results(results)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
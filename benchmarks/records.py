@@ -0,0 +1,90 @@
+"""Benchmark loading pages of posts as ORM entities and as records.
+
+Measures the time and the peak memory of loading a page of posts in a
+resub, either as `repost.models.Post` entities or as records from
+`repost.records`, and serializing it.
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+import tracemalloc
+from typing import Callable
+
+os.environ.setdefault('REPOST_DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from repost import models
+from repost.api.schemas import Post
+from repost.api.serialization import serialize
+from repost.crud.pagination import paginate
+from repost.records import post_records
+
+
+def create_database(url: str, count: int) -> sessionmaker:
+    """Create a database with a resub of posts."""
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)
+
+    db = session()
+    user = models.User(username='user', hashed_password='')
+    resub = models.Resub(name='resub', description='Description of the resub', owner=user)
+    db.add_all([user, resub])
+    db.flush()
+    db.bulk_insert_mappings(models.Post, [
+        dict(title=f'Post {i}', content='Content of the post ' * 50, author_id=user.id, parent_resub_id=resub.id)
+        for i in range(count)])
+    db.commit()
+    db.close()
+
+    return session
+
+
+def load_entities(db: Session, limit: int):
+    query = db.query(models.Post).filter_by(parent_resub_id=1)
+    return serialize(Post, paginate(query, models.Post, models.Post.created, limit=limit))
+
+
+def load_records(db: Session, limit: int):
+    query = db.query(models.Post).filter_by(parent_resub_id=1)
+    return serialize(Post, paginate(post_records(query), models.Post, models.Post.created, limit=limit))
+
+
+def measure(session: sessionmaker, load: Callable, limit: int, repeat: int):
+    """Get the time per page in milliseconds and the peak memory in KiB."""
+    def run():
+        db = session()
+        try:
+            load(db, limit)
+        finally:
+            db.close()
+
+    elapsed = timeit.timeit(run, number=repeat)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed / repeat * 1000, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--page-size', type=int, default=100, help='Number of posts in a page')
+    parser.add_argument('--repeat', type=int, default=100, help='Number of pages loaded')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        session = create_database(f'sqlite:///{directory}/benchmark.db', args.page_size)
+        for name, load in (('entities', load_entities), ('records', load_records)):
+            elapsed, peak = measure(session, load, args.page_size, args.repeat)
+            print(f'{name:8} {elapsed:7.3f} ms/page   peak memory: {peak:8.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
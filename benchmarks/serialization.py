@@ -0,0 +1,71 @@
+"""Benchmark serializing pages of posts and comments.
+
+Compares validating ORM objects with the response models and encoding
+them with FastAPI, against the compiled serializers in
+`repost.api.serialization`.
+"""
+
+import argparse
+import json
+import os
+import timeit
+from datetime import datetime, timezone
+from typing import List
+
+os.environ.setdefault('REPOST_DATABASE_URL', 'sqlite://')
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from repost import models
+from repost.api.schemas import Post, Comment, Resub, User
+from repost.api.serialization import orm_response
+
+
+def create_objects(count: int) -> dict:
+    """Create unsaved ORM objects for every schema."""
+    now = datetime.now(timezone.utc)
+    user = models.User(id=1, username='user', bio='Bio of the user', created=now)
+    resub = models.Resub(id=1, name='resub', description='Description of the resub', owner=user, created=now)
+
+    posts = [models.Post(id=i, title=f'Post {i}', url='https://example.com', content='Content of the post ' * 10,
+                         author=user, parent_resub=resub, created=now, edited=now, score=i, upvotes=i, downvotes=0)
+             for i in range(count)]
+    comments = [models.Comment(id=i, content='Content of the comment ' * 5, author=user, parent_resub=resub,
+                               parent_post_id=1, parent_comment_id=None, created=now, score=i, upvotes=i,
+                               downvotes=0)
+                for i in range(count)]
+
+    return {Post: posts, Comment: comments, Resub: [resub] * count, User: [user] * count}
+
+
+def serialize_with_models(schema: BaseModel, objects: List) -> bytes:
+    """Serialize the objects like FastAPI does with a response model."""
+    return JSONResponse(jsonable_encoder([schema.from_orm(obj) for obj in objects])).body
+
+
+def serialize_compiled(schema: BaseModel, objects: List) -> bytes:
+    """Serialize the objects with a compiled serializer."""
+    return orm_response(schema, objects).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--page-size', type=int, default=100, help='Number of objects in a page')
+    parser.add_argument('--repeat', type=int, default=200, help='Number of pages serialized')
+    args = parser.parse_args()
+
+    for schema, objects in create_objects(args.page_size).items():
+        if json.loads(serialize_with_models(schema, objects)) != json.loads(serialize_compiled(schema, objects)):
+            raise SystemExit(f'{schema.__name__}: serialized JSON differs')
+
+        models_time = timeit.timeit(lambda: serialize_with_models(schema, objects), number=args.repeat)
+        compiled_time = timeit.timeit(lambda: serialize_compiled(schema, objects), number=args.repeat)
+        print(f'{schema.__name__:8} response model: {models_time / args.repeat * 1000:7.3f} ms/page   '
+              f'compiled: {compiled_time / args.repeat * 1000:7.3f} ms/page   '
+              f'speedup: {models_time / compiled_time:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Benchmark of concurrent writes to SQLite with each SQLite profile.
+
+Runs threads that, like routes in the threadpool, each open a session
+with `repost.database.open_session`, and either read a post and its
+comments, or vote or comment on a post. Every profile in `--profiles`
+runs in its own process with `REPOST_SQLITE_PROFILE` set, and reports the
+operations per second, the p50, p95 and p99 latency of reads and writes,
+and the number of failed operations, such as those failing with
+"database is locked":
+
+    python -m benchmarks.sqlite_writes --threads 16
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+from benchmarks.load import percentile
+
+profiles = ('default', 'wal')
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_profile(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the benchmark with the profile in the config, and get the
+    results of every kind of operation.
+    """
+    from repost import crud, models
+    from repost.database import SessionLocal, engine, open_session
+    from repost.dataset import generate_dataset
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    generate_dataset(crud.BulkLoader(db, password='password'), users=args.users, resubs=1, posts=args.posts,
+                     comments=args.posts * 5, seed=args.seed)
+    user_ids = [user_id for user_id, in db.query(models.User.id)]
+    posts = db.query(models.Post.id, models.Post.parent_resub_id).all()
+    db.close()
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, Counter] = defaultdict(Counter)
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def operate(rng: random.Random):
+        post_id, resub_id = rng.choice(posts)
+        kind = 'write' if rng.random() < args.writes else 'read'
+        start = time.perf_counter()
+        try:
+            db = open_session(read_only=kind == 'read')
+            try:
+                if kind == 'read':
+                    crud.get_post(db, post_id=post_id)
+                    crud.get_comments(db, post_id)
+                elif rng.random() < 0.5:
+                    crud.vote_post(db, post_id=post_id, author_id=rng.choice(user_ids), vote=rng.choice((-1, 1)))
+                else:
+                    crud.create_comment(db, author_id=rng.choice(user_ids), parent_post_id=post_id,
+                                        parent_resub_id=resub_id, content='Benchmark comment')
+            finally:
+                db.close()
+        except Exception as error:
+            with lock:
+                errors[kind][str(getattr(error, 'orig', error))] += 1
+            return
+
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[kind].append(elapsed)
+
+    def work(seed: int):
+        rng = random.Random(seed)
+        while time.monotonic() < deadline:
+            operate(rng)
+
+    threads = [threading.Thread(target=work, args=(args.seed + i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    for kind in ('read', 'write'):
+        values = sorted(latencies[kind])
+        results[kind] = {
+            'operations': len(values),
+            'operations_per_second': round(len(values) / elapsed, 1),
+            'errors': dict(errors[kind]),
+        }
+        if values:
+            results[kind].update({'p50_ms': round(percentile(values, 50) * 1000, 3),
+                                  'p95_ms': round(percentile(values, 95) * 1000, 3),
+                                  'p99_ms': round(percentile(values, 99) * 1000, 3)})
+
+    return results
+
+
+def print_results(profile: str, results: Dict[str, Any]):
+    print(f'\n{profile} profile')
+    for kind, stats in results.items():
+        latency = (f'p50 {stats["p50_ms"]:8.2f} ms  p95 {stats["p95_ms"]:8.2f} ms  p99 {stats["p99_ms"]:8.2f} ms'
+                   if stats['operations'] else 'no operations')
+        print(f'  {kind:5} {stats["operations"]:6} ({stats["operations_per_second"]:7.1f}/s)  {latency}  '
+              f'errors {sum(stats["errors"].values())}')
+        for error, count in stats['errors'].items():
+            print(f'        {count:6} {error}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', choices=profiles, default=list(profiles),
+                        help='SQLite profiles to compare')
+    parser.add_argument('--threads', type=int, default=16, help='Number of threads operating at once')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds every profile runs for')
+    parser.add_argument('--writes', type=float, default=0.5, help='Fraction of operations that write')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Save the results as JSON to this file')
+    parser.add_argument('--run', choices=profiles, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Each profile runs in its own process, since the database is set up
+    # when repost is imported
+    if args.run:
+        json.dump(run_profile(args), sys.stdout)
+        return
+
+    results = {}
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, REPOST_DATABASE_URL=f'sqlite:///{directory}/benchmark.db',
+                       REPOST_SQLITE_PROFILE=profile, REPOST_RESPONSE_CACHE='none',
+                       REPOST_VOTE_WRITE_BEHIND='false')
+            output = subprocess.check_output([sys.executable, '-m', 'benchmarks.sqlite_writes', *sys.argv[1:],
+                                              '--run', profile], env=env, cwd=_root)
+        results[profile] = json.loads(output.decode().splitlines()[-1])
+        print_results(profile, results[profile])
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Admission control of API requests.
+
+Requests are sorted into classes, each with a limit of requests that run
+at once in a worker. Requests over the limit wait in a bounded queue,
+and are rejected with `503 Service Unavailable` and `Retry-After` when
+the queue is full or they have waited too long. Rejecting early keeps a
+worker whose database is slow from piling up requests that wait for a
+connection until they time out anyway.
+
+With adaptive limits, the limit of every class follows the latency of
+its requests: it is cut when requests are slower than the target, and
+grows again while they are not (AIMD).
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from repost import config
+from repost.metrics import add_time, admission_limiters, admission_rejections
+
+# Factor the limit is cut by when requests are slower than the target
+_decrease_factor = 0.9
+
+
+class Limiter:
+    """Limit of concurrent requests of a class, with a bounded queue of
+    waiting requests.
+
+    Limiters are only used from the event loop, so they need no locks. A
+    finished request hands its slot to the next waiting request, so the
+    queue is served in order.
+    """
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float, adaptive: bool = False,
+                 latency_target: float = 0.0):
+        self.limit = limit
+        self.max_limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.latency_target = latency_target
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._successes = 0
+        self._last_decrease = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Wait for a slot, and get whether one was acquired before the
+        queue was full or the wait timed out.
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            return False
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except BaseException:
+            # Pass on a slot that was handed over to a cancelled request
+            if waiter.done():
+                self.active -= 1
+                self._wake()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+        if waiter.done():
+            return True
+
+        self._waiters.remove(waiter)
+        return False
+
+    def release(self, seconds: float, started: float):
+        """Release the slot of a request that started at the given time and
+        took the given seconds, and adapt the limit to its latency.
+        """
+        if self.adaptive:
+            self._adapt(seconds, started)
+
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.active < self.limit:
+            waiter = self._waiters.popleft()
+            self.active += 1
+            waiter.set_result(None)
+
+    def _adapt(self, seconds: float, started: float):
+        if seconds > self.latency_target:
+            # Cut the limit once for requests that ran under the same limit
+            if started >= self._last_decrease:
+                self.limit = max(int(self.limit * _decrease_factor), 1)
+                self._last_decrease = time.monotonic()
+                self._successes = 0
+            return
+
+        # Grow the limit by one for every limit of fast requests
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._successes = 0
+            self._wake()
+
+
+def _create_limiter(limit: int) -> Limiter:
+    return Limiter(limit, config.admission_queue_size, config.admission_queue_timeout,
+                   adaptive=config.admission_adaptive, latency_target=config.admission_latency_target)
+
+
+def request_class(scope: Scope) -> Optional[str]:
+    """Get the class of the request, or None when it is always admitted."""
+    path, method = scope['path'], scope['method']
+    if not path.startswith('/api/') or path.startswith('/api/metrics'):
+        return None
+
+    # Logging in and signing up wait for password hashing
+    if path.startswith('/api/auth/') or (method == 'POST' and path.rstrip('/') == '/api/users'):
+        return 'auth'
+
+    return 'read' if method in ('GET', 'HEAD') else 'write'
+
+
+class AdmissionMiddleware:
+    """Limit the requests of every class that run at once, and reject
+    requests when the queue of the class is full.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.limiters: Dict[str, Limiter] = {
+            'read': _create_limiter(config.admission_read_limit),
+            'write': _create_limiter(config.admission_write_limit),
+            'auth': _create_limiter(config.admission_auth_limit),
+        }
+        admission_limiters.update(self.limiters)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        name = request_class(scope) if scope['type'] == 'http' and config.admission_control else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters[name]
+        start = time.perf_counter()
+        if not await limiter.acquire():
+            admission_rejections.inc(request_class=name)
+            response = JSONResponse(status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                                    headers={'Retry-After': str(config.admission_retry_after)},
+                                    content={'detail': 'The server is overloaded, try again later'})
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        add_time('queue', time.perf_counter() - start)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.monotonic() - started, started)
@@ -2,7 +2,7 @@
 
 from fastapi import APIRouter
 
-from repost.api.routes import users, auth, resubs, posts, comments
+from repost.api.routes import users, auth, resubs, posts, comments, votes, search, metrics
 
 api_router = APIRouter()
 api_router.include_router(auth.router, prefix='/auth', tags=['auth'])
@@ -10,3 +10,6 @@ api_router.include_router(users.router, prefix='/users', tags=['users'])
 api_router.include_router(resubs.router, prefix='/resubs', tags=['resubs'])
 api_router.include_router(posts.router, prefix='/posts', tags=['posts'])
 api_router.include_router(comments.router, prefix='/comments', tags=['comments'])
+api_router.include_router(votes.router, prefix='/votes', tags=['votes'])
+api_router.include_router(search.router, prefix='/search', tags=['search'])
+api_router.include_router(metrics.router, prefix='/metrics', tags=['metrics'])
@@ -0,0 +1,125 @@
+"""Response caching of public GET endpoints.
+
+Routes opt in with the `cache_response` dependency, which names the tags
+of the data in the response. `ResponseCacheMiddleware` serves cached
+responses before routing, and stores the responses of routes that opted
+in. The crud functions invalidate the tags of everything they write.
+"""
+
+from typing import Callable
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from repost import config
+from repost.api.etags import etag_matches
+from repost.cache import response_cache
+
+cache_header = 'X-Cache'
+_state_key = 'response_cache'
+
+
+def cache_response(*tags: str, ttl: float = None) -> Callable:
+    """Create a dependency that caches the response of a GET route.
+
+    Tags are formatted with the path parameters, e.g. 'post:{post_id}'.
+    The response is cached for the given TTL in seconds, or the TTL set
+    in the config by default. It must come before an ETag dependency of
+    the route, so that a write after the ETag is read invalidates the
+    entry that is stored with the ETag.
+    """
+    def dependency(request: Request):
+        if response_cache is None:
+            return
+
+        tag_versions = response_cache.miss([tag.format(**request.path_params) for tag in tags])
+        setattr(request.state, _state_key, (tag_versions, config.response_cache_ttl if ttl is None else ttl))
+
+    return dependency
+
+
+def _cache_key(scope: Scope) -> str:
+    return scope['path'] + '?' + scope['query_string'].decode('latin-1')
+
+
+class ResponseCacheMiddleware:
+    """Serve cached responses, and cache responses of routes using
+    `cache_response`.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if response_cache is None or scope['type'] != 'http' or scope['method'] != 'GET':
+            await self.app(scope, receive, send)
+            return
+
+        key = _cache_key(scope)
+        if response_cache.backend.blocking:
+            entry = await run_in_threadpool(response_cache.get, key)
+        else:
+            entry = response_cache.get(key)
+
+        if entry is not None:
+            await self._send_entry(entry, scope, send)
+            return
+
+        start = {}
+        body = []
+
+        # Only the bodies of cacheable responses are kept, so that other
+        # responses (e.g. streamed exports) are not held in memory
+        async def send_and_store(message: Message):
+            if message['type'] == 'http.response.start':
+                if message['status'] == 200 and _state_key in scope.get('state', {}):
+                    start.update(message)
+                    message['headers'] = list(message['headers']) + [(cache_header.lower().encode(), b'MISS')]
+            elif message['type'] == 'http.response.body' and start:
+                body.append(message.get('body', b''))
+                if not message.get('more_body', False):
+                    await self._store(scope, start, b''.join(body))
+
+            await send(message)
+
+        await self.app(scope, receive, send_and_store)
+
+    @staticmethod
+    async def _send_entry(entry: dict, scope: Scope, send: Send):
+        headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in entry['headers']]
+        headers.append((cache_header.lower().encode(), b'HIT'))
+
+        # Respond with 304 Not Modified when the client has the cached ETag
+        etag = next((value for name, value in entry['headers'] if name == 'etag'), None)
+        if_none_match = next((value.decode('latin-1') for name, value in scope['headers']
+                              if name == b'if-none-match'), None)
+        if etag is not None and etag_matches(if_none_match, etag):
+            headers = [(b'etag', etag.encode('latin-1')), (cache_header.lower().encode(), b'HIT')]
+            await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        await send({'type': 'http.response.start', 'status': entry['status'], 'headers': headers})
+        await send({'type': 'http.response.body', 'body': entry['body'].encode('latin-1')})
+
+    @staticmethod
+    async def _store(scope: Scope, start: Message, body: bytes):
+        """Store the response if the route uses `cache_response`."""
+        state = scope.get('state', {}).get(_state_key)
+        if state is None or start.get('status') != 200:
+            return
+
+        tag_versions, ttl = state
+        entry = {
+            'status': start['status'],
+            'headers': [(name.decode('latin-1'), value.decode('latin-1')) for name, value in start['headers']
+                        if name.lower() != cache_header.lower().encode()],
+            'body': body.decode('latin-1'),
+            'tags': tag_versions,
+        }
+
+        if response_cache.backend.blocking:
+            await run_in_threadpool(response_cache.set, _cache_key(scope), entry, ttl)
+        else:
+            response_cache.set(_cache_key(scope), entry, ttl)
@@ -0,0 +1,97 @@
+"""ETags and conditional GET requests.
+
+The ETag dependencies get a cheap version of the response before any
+rows are loaded. When the request's If-None-Match header includes the
+ETag, `NotModified` is raised and the response is 304 Not Modified.
+Otherwise `ETagMiddleware` adds the ETag to the response.
+
+NOTE: the header is not set on the dependency's response parameter,
+since FastAPI duplicates headers set by a dependency once for every
+dependency solved after it.
+"""
+
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Depends, Path, Request
+from sqlalchemy.orm import Session
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from repost import crud
+from repost.api.resolvers import get_db
+
+_state_key = 'etag'
+
+
+class NotModified(Exception):
+    """Raised when the client already has the current response."""
+
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+def make_etag(*values: Any) -> str:
+    """Create a strong ETag from the given values."""
+    return '"' + hashlib.sha1(repr(values).encode()).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check if the If-None-Match header includes the ETag."""
+    if not if_none_match:
+        return False
+
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def check_etag(request: Request, version: Any):
+    """Set the ETag of the response from the version of its data.
+
+    The ETag includes the URL, so that every page of a listing has its
+    own ETag. Nothing is set when the version is None, and the resolvers
+    of the route respond with 404 Not Found instead.
+    """
+    if version is None:
+        return
+
+    etag = make_etag(request.url.path, request.url.query, version)
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        raise NotModified(etag)
+
+    setattr(request.state, _state_key, etag)
+
+
+def post_etag(request: Request, post_id: int = Path(...), db: Session = Depends(get_db)):
+    """ETag of a post."""
+    check_etag(request, crud.get_post_version(db, post_id=post_id))
+
+
+def post_comments_etag(request: Request, post_id: int = Path(...), db: Session = Depends(get_db)):
+    """ETag of the comments in a post."""
+    check_etag(request, crud.get_comments_version(db, post_id=post_id))
+
+
+def replies_etag(request: Request, comment_id: int = Path(...), db: Session = Depends(get_db)):
+    """ETag of the replies to a comment."""
+    check_etag(request, crud.get_replies_version(db, comment_id=comment_id))
+
+
+class ETagMiddleware:
+    """Add the ETag set by an ETag dependency to successful responses."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_etag(message: Message):
+            etag = scope.get('state', {}).get(_state_key)
+            if message['type'] == 'http.response.start' and message['status'] == 200 and etag is not None:
+                message['headers'] = list(message['headers']) + [(b'etag', etag.encode('latin-1'))]
+
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
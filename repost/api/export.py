@@ -0,0 +1,61 @@
+"""Streaming exports of posts and comments as newline-delimited JSON.
+
+Every line is an object with the `type` of the item, its `data` in the
+same format as the item's endpoints, and the `cursor` to resume the
+export after the item, e.g. when the connection is lost.
+"""
+
+from typing import Any, Iterator, Optional, Tuple
+
+import ujson
+from fastapi import HTTPException, Query, status
+from starlette.responses import StreamingResponse
+
+from repost import crud
+from repost.api.pagination import decode_cursor, encode_cursor
+from repost.api.schemas import Comment, Post
+from repost.api.serialization import serialize
+
+media_type = 'application/x-ndjson'
+
+# Response schema of every type of exported item
+_schemas = {'post': Post, 'comment': Comment}
+
+# Number of lines sent at once
+_lines_per_chunk = 100
+
+
+def export_cursor(cursor: str = Query(None, description='Cursor of the last received item to resume the export after')
+                  ) -> Optional[crud.ExportCursor]:
+    """Dependency for the cursor of an export."""
+    if cursor is None:
+        return None
+
+    after = decode_cursor(cursor)
+    if after[0] not in crud.export_types:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid cursor \'{cursor}\'')
+
+    return after
+
+
+def _lines(items: Iterator[Tuple[str, Any]]) -> Iterator[str]:
+    chunk = []
+    for item_type, record in items:
+        chunk.append(ujson.dumps({'type': item_type, 'cursor': encode_cursor((item_type, record.id)),
+                                  'data': serialize(_schemas[item_type], record)}) + '\n')
+        if len(chunk) >= _lines_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+def export_response(items: Iterator[Tuple[str, Any]]) -> StreamingResponse:
+    """Stream the exported (type, record) pairs as NDJSON.
+
+    The items are read while the response is sent, so the session they
+    are read with must stay open until then, which the session of
+    `get_db` does.
+    """
+    return StreamingResponse(_lines(items), media_type=media_type)
@@ -0,0 +1,74 @@
+"""Per-request metrics and the Server-Timing header."""
+
+import time
+from typing import Callable, Dict
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from repost.metrics import RequestTimings, current_timings, observe_request
+
+# Route template of requests that match no route
+unmatched_route = 'unmatched'
+
+
+def server_timing(timings: RequestTimings, seconds: float) -> str:
+    """Format the timings of a request as a Server-Timing header."""
+    parts = [f'db;dur={timings.seconds["db"] * 1000:.2f};desc="{timings.queries} queries"']
+    for part in ('queue', 'pool', 'serialize'):
+        if part in timings.seconds:
+            parts.append(f'{part};dur={timings.seconds[part] * 1000:.2f}')
+    parts.append(f'app;dur={seconds * 1000:.2f}')
+    return ', '.join(parts)
+
+
+class MetricsMiddleware:
+    """Record the metrics of every request by route template, and add
+    them to the response in the Server-Timing header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes: Dict[Callable, str] = {}
+
+    def _route(self, scope: Scope) -> str:
+        """Get the route template of the request."""
+        # The router sets the endpoint of the route, unless the response
+        # was sent before routing, e.g. from the response cache
+        endpoint = scope.get('endpoint')
+        if endpoint is not None and endpoint in self._routes:
+            return self._routes[endpoint]
+
+        for route in scope['app'].routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                self._routes[child_scope['endpoint']] = route.path
+                return route.path
+
+        return unmatched_route
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                header = server_timing(timings, time.perf_counter() - start)
+                message['headers'] = list(message['headers']) + [(b'server-timing', header.encode('latin-1'))]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timings.reset(token)
+            observe_request(timings, time.perf_counter() - start, method=scope['method'], route=self._route(scope),
+                            status=status_code)
@@ -0,0 +1,65 @@
+"""Pagination of list endpoints."""
+
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Any, Callable, List
+
+from fastapi import HTTPException, Query, Response, status
+
+from repost.crud.pagination import Keyset
+
+# NOTE: this header must be exposed to browsers in the CORS middleware
+next_cursor_header = 'X-Next-Cursor'
+
+
+def encode_cursor(keyset: Keyset) -> str:
+    """Encode a keyset as an opaque cursor."""
+    return urlsafe_b64encode(json.dumps(keyset, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Keyset:
+    """Decode an opaque cursor into a keyset."""
+    try:
+        value, item_id = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid cursor \'{cursor}\'')
+
+    if type(item_id) is not int:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid cursor \'{cursor}\'')
+
+    return value, item_id
+
+
+def attribute_keyset(name: str) -> Callable[[Any], Keyset]:
+    """Keyset of items ordered by the given attribute."""
+    return lambda item: (getattr(item, name), item.id)
+
+
+# Keyset of items ordered by when they were created
+created_keyset = attribute_keyset('created')
+
+
+class Pagination:
+    """Dependency for paginated list endpoints.
+
+    When a page is full, the cursor for the next page is returned in
+    the X-Next-Cursor header. Pages selected by cursor do not slow down
+    the deeper they are, unlike pages selected by number.
+    """
+
+    def __init__(self, response: Response,
+                 cursor: str = Query(None, description='Cursor from the X-Next-Cursor header of the previous page'),
+                 page: int = Query(0, description='Page number, ignored when a cursor is given'),
+                 page_size: int = 100):
+        self.response = response
+        self.after = decode_cursor(cursor) if cursor else None
+        self.offset = 0 if cursor else page * page_size
+        self.limit = page_size
+
+    def paginate(self, items: List[Any], keyset: Callable[[Any], Keyset] = created_keyset) -> List[Any]:
+        """Set the cursor for the page after the given items."""
+        if items and len(items) >= self.limit:
+            self.response.headers[next_cursor_header] = encode_cursor(keyset(items[-1]))
+
+        return items
@@ -1,17 +1,37 @@
 """Dependencies for resolving and verifying paths and ownership."""
 
+import time
+
 from fastapi import Path, Depends, HTTPException, status, Security
 from sqlalchemy.orm import Session
+from starlette.requests import Request
 
 from repost import crud
 from repost import models
 from repost.api.security import authorize_user
-from repost.database import SessionLocal
+from repost.database import open_session
+from repost.metrics import add_time
+
+
+def get_db(request: Request):
+    """Dependency for database connections.
 
+    Sessions block while querying, so every dependency and route that
+    uses one is a regular function, which FastAPI runs in a threadpool
+    instead of on the event loop. Routes that await on the event loop,
+    such as for password hashing, run their queries with
+    `run_in_threadpool` instead.
 
-def get_db():
-    """Dependency for database connections."""
-    session = SessionLocal()
+    GET and HEAD requests read from a replica when replicas are
+    configured. Every dependency of a request shares its session, so the
+    lookups of other requests read from the primary what they write to.
+
+    The connection is checked out from the pool up front, so that the
+    wait for a connection is measured in the request's metrics.
+    """
+    start = time.perf_counter()
+    session = open_session(read_only=request.method in ('GET', 'HEAD'))
+    add_time('pool', time.perf_counter() - start)
 
     try:
         yield session
@@ -31,18 +51,27 @@ def resolve_user(username: str = Path(...), db: Session = Depends(get_db)) -> mo
     return db_user
 
 
-async def resolve_current_user(username: str = Security(authorize_user, scopes=['user']),
-                               db: Session = Depends(get_db)) -> models.User:
-    """Resolve the currently authorized User."""
-    db_user = crud.get_user(db, username=username)
-    if not db_user:
+def resolve_current_user(claims: dict = Security(authorize_user, scopes=['user']),
+                         db: Session = Depends(get_db)) -> crud.UserIdentity:
+    """Resolve the identity of the currently authorized User.
+
+    The user is found by the ID in the token, and must have been created
+    before the token was issued, so that a token of a purged user never
+    resolves to a new user with the same username or ID.
+    """
+    if 'uid' not in claims:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail='The JSON Web Token has no user ID, log in again')
+
+    identity = crud.get_user_identity(db, user_id=claims['uid'])
+    if not identity or identity.created > claims.get('iat', 0):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail=f'The owner of this JSON Web Token no longer exists')
 
-    return db_user
+    return identity
 
 
-async def resolve_resub(resub: str = Path(...), db: Session = Depends(get_db)) -> models.Resub:
+def resolve_resub(resub: str = Path(...), db: Session = Depends(get_db)) -> models.Resub:
     """Verify the resub from path parameter."""
     db_resub = crud.get_resub(db, name=resub)
     if not db_resub:
@@ -51,16 +80,16 @@ async def resolve_resub(resub: str = Path(...), db: Session = Depends(get_db)) -
     return db_resub
 
 
-async def resolve_user_owned_resub(resub: models.Resub = Depends(resolve_resub),
-                                   current_user: models.User = Depends(resolve_current_user)) -> models.Resub:
+def resolve_user_owned_resub(resub: models.Resub = Depends(resolve_resub),
+                             current_user: crud.UserIdentity = Depends(resolve_current_user)) -> models.Resub:
     """Verify that the authorized user owns the resub before returning."""
-    if resub.owner != current_user:
+    if resub.owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='You are not the owner of this resub')
 
     return resub
 
 
-async def resolve_post(post_id: int = Path(...), db: Session = Depends(get_db)) -> models.Post:
+def resolve_post(post_id: int = Path(...), db: Session = Depends(get_db)) -> models.Post:
     """Resolve the post from the path parameter."""
     db_post = crud.get_post(db, post_id=post_id)
     if not db_post:
@@ -69,8 +98,8 @@ async def resolve_post(post_id: int = Path(...), db: Session = Depends(get_db))
     return db_post
 
 
-async def resolve_user_owned_post(post: models.Post = Depends(resolve_post),
-                                  current_user: models.User = Depends(resolve_current_user)) -> models.Post:
+def resolve_user_owned_post(post: models.Post = Depends(resolve_post),
+                            current_user: crud.UserIdentity = Depends(resolve_current_user)) -> models.Post:
     """Verify that the authorized user owns the post before returning."""
     if post.author_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='You are not the author of this post')
@@ -78,18 +107,18 @@ async def resolve_user_owned_post(post: models.Post = Depends(resolve_post),
     return post
 
 
-async def resolve_post_for_post_owner_or_resub_owner(post: models.Post = Depends(resolve_post),
-                                                     current_user: models.User = Depends(
-                                                         resolve_current_user)) -> models.Post:
+def resolve_post_for_post_owner_or_resub_owner(post: models.Post = Depends(resolve_post),
+                                               current_user: crud.UserIdentity = Depends(
+                                                   resolve_current_user)) -> models.Post:
     """Verify that the authorized user owns the post or owns the resub before returning."""
-    if current_user not in (post.author, post.parent_resub.owner):
+    if current_user.id not in (post.author_id, post.parent_resub.owner_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail='You are not the author of this post or the owner of this resub')
 
     return post
 
 
-async def resolve_comment(comment_id: int = Path(...), db: Session = Depends(get_db)) -> models.Comment:
+def resolve_comment(comment_id: int = Path(...), db: Session = Depends(get_db)) -> models.Comment:
     """ Resolve the comment from the path parameter. """
     db_comment = crud.get_comment(db, comment_id=comment_id)
     if not db_comment:
@@ -98,20 +127,20 @@ async def resolve_comment(comment_id: int = Path(...), db: Session = Depends(get
     return db_comment
 
 
-async def resolve_user_owned_comment(comment: models.Comment = Depends(resolve_comment),
-                                     current_user: models.User = Depends(resolve_current_user)) -> models.Comment:
+def resolve_user_owned_comment(comment: models.Comment = Depends(resolve_comment),
+                               current_user: crud.UserIdentity = Depends(resolve_current_user)) -> models.Comment:
     """ Verify that the authorized user owns the comment before returning. """
-    if comment.author != current_user:
+    if comment.author_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='You are not the author of this comment')
 
     return comment
 
 
-async def resolve_comment_for_comment_owner_or_resub_owner(comment: models.Comment = Depends(resolve_comment),
-                                                           current_user: models.User = Depends(
-                                                               resolve_current_user)) -> models.Comment:
+def resolve_comment_for_comment_owner_or_resub_owner(comment: models.Comment = Depends(resolve_comment),
+                                                     current_user: crud.UserIdentity = Depends(
+                                                         resolve_current_user)) -> models.Comment:
     """ Verify that the authorized user owns the comment or owns the resub before returning. """
-    if current_user not in (comment.author, comment.parent_resub.owner):
+    if current_user.id not in (comment.author_id, comment.parent_resub.owner_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail='You are not the author of this comment or the owner of this resub')
 
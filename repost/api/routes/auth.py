@@ -2,6 +2,7 @@
 from base64 import b64decode
 
 from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
@@ -15,10 +16,15 @@ router = APIRouter()
 
 
 @router.post('/token', response_model=OAuth2Token,
-             responses={status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse}})
+             responses={status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
+                        status.HTTP_503_SERVICE_UNAVAILABLE: {'model': ErrorResponse}})
 async def login(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends(),
                 authorization: str = Header(None)):
-    """Authorize using username and password."""
+    """Authorize using username and password.
+
+    The route awaits verifying the password on the event loop, and runs
+    the query in the threadpool.
+    """
     client_id = form_data.client_id
     if not client_id and authorization:
         http_basic_auth = b64decode(authorization.replace('Basic ', '')).decode('ascii')
@@ -27,10 +33,10 @@ async def login(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestF
     if not client_id or client_id != config.client_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid client')
 
-    db_user = crud.get_user(db, username=form_data.username)
-    if not db_user or not verify_password(form_data.password, db_user.hashed_password):
+    db_user = await run_in_threadpool(crud.get_user, db, username=form_data.username)
+    if not db_user or not await verify_password(form_data.password, db_user.hashed_password):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid login information')
 
     scopes = form_data.scopes or list(oauth2_scopes.keys())
-    return OAuth2Token(access_token=create_jwt_token(username=db_user.username, scopes=scopes),
-                       token_type='bearer', scope=' '.join(scopes))
+    access_token = create_jwt_token(username=db_user.username, user_id=db_user.id, scopes=scopes)
+    return OAuth2Token(access_token=access_token, token_type='bearer', scope=' '.join(scopes))
@@ -5,23 +5,44 @@ post, and as such every endpoint must resolve both a resub and a post.
 This is implemented in the resolvers in `repost.resolvers`.
 """
 
-from fastapi import APIRouter, Depends, Path, status
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
 from sqlalchemy.orm import Session
 
 from repost import models, crud
+from repost.api.etags import replies_etag
 from repost.api.resolvers import resolve_comment_for_comment_owner_or_resub_owner, resolve_comment, \
     resolve_user_owned_comment, resolve_current_user, get_db
-from repost.api.schemas import Comment, ErrorResponse, CreateComment, EditComment
+from repost.api.schemas import Comment, ErrorResponse, CreateComment, EditComment, build_comment_tree
+from repost.api.serialization import orm_response
 
 router = APIRouter()
 
+# Maximum number of comments to get at once
+max_ids = 100
+
+
+@router.get('/', response_model=List[Comment], responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse}})
+def get_comments(ids: List[int] = Query(..., description=f'IDs of at most {max_ids} comments'),
+                 db: Session = Depends(get_db)):
+    """Get many comments at once.
+
+    Comments are listed in the order of the IDs, and comments that do
+    not exist are left out.
+    """
+    if len(ids) > max_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'At most {max_ids} IDs are allowed')
+
+    return orm_response(Comment, crud.get_comments_by_ids(db, comment_ids=ids))
+
 
 @router.post('/{comment_id}', response_model=Comment, status_code=status.HTTP_201_CREATED,
              responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
                         status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                         status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def create_reply(*, comment: models.Comment = Depends(resolve_comment), created_comment: CreateComment,
-                       current_user: models.User = Depends(resolve_current_user), db: Session = Depends(get_db)):
+def create_reply(*, comment: models.Comment = Depends(resolve_comment), created_comment: CreateComment,
+                 current_user: crud.UserIdentity = Depends(resolve_current_user), db: Session = Depends(get_db)):
     """Create a reply to a comment in a post."""
     return crud.create_comment(db, author_id=current_user.id, parent_resub_id=comment.parent_resub_id,
                                parent_post_id=comment.parent_post_id, parent_comment_id=comment.id,
@@ -33,8 +54,8 @@ async def create_reply(*, comment: models.Comment = Depends(resolve_comment), cr
                           status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                           status.HTTP_403_FORBIDDEN: {'model': ErrorResponse},
                           status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def delete_comment(comment: models.Comment = Depends(resolve_comment_for_comment_owner_or_resub_owner),
-                         db: Session = Depends(get_db)):
+def delete_comment(comment: models.Comment = Depends(resolve_comment_for_comment_owner_or_resub_owner),
+                   db: Session = Depends(get_db)):
     """Delete a comment in a post.
 
     Only the author of a comment or the owner of a resub can delete
@@ -48,8 +69,8 @@ async def delete_comment(comment: models.Comment = Depends(resolve_comment_for_c
                          status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                          status.HTTP_403_FORBIDDEN: {'model': ErrorResponse},
                          status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def edit_comment(*, comment: models.Comment = Depends(resolve_user_owned_comment), edited_comment: EditComment,
-                       db: Session = Depends(get_db)):
+def edit_comment(*, comment: models.Comment = Depends(resolve_user_owned_comment), edited_comment: EditComment,
+                 db: Session = Depends(get_db)):
     """Edit a comment in a post.
 
     Only the author of a comment can edit the comment.
@@ -61,7 +82,26 @@ async def edit_comment(*, comment: models.Comment = Depends(resolve_user_owned_c
               responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
                          status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                          status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def vote_comment(*, comment: models.Comment = Depends(resolve_comment), vote: int = Path(..., ge=-1, le=1),
-                       current_user: models.User = Depends(resolve_current_user), db: Session = Depends(get_db)):
+def vote_comment(*, comment: models.Comment = Depends(resolve_comment), vote: int = Path(..., ge=-1, le=1),
+                 current_user: crud.UserIdentity = Depends(resolve_current_user), db: Session = Depends(get_db)):
     """Vote on a comment in a post."""
     return crud.vote_comment(db, comment_id=comment.id, author_id=current_user.id, vote=vote)
+
+
+# NOTE: there is no response model since FastAPI cannot clone recursive
+# models, but the returned trees are already CommentTree models from
+# repost.api.schemas
+@router.get('/{comment_id}/tree', dependencies=[Depends(replies_etag)],
+            responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
+def get_reply_tree(comment: models.Comment = Depends(resolve_comment), db: Session = Depends(get_db),
+                   depth: int = Query(5, ge=1, le=20, description='Number of levels of replies'),
+                   limit: int = Query(10, ge=1, le=100, description='Maximum replies to each comment'),
+                   offset: int = Query(0, ge=0, description='Number of direct replies to skip')):
+    """Get the threads of replies to a comment.
+
+    Use the offset to load more replies to a comment after the ones
+    included in a tree.
+    """
+    comments = crud.get_comment_tree(db, post_id=comment.parent_post_id, parent=comment, depth=depth, limit=limit,
+                                     offset=offset)
+    return build_comment_tree(comments, parent=comment, depth=depth)
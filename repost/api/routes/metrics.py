@@ -0,0 +1,14 @@
+"""Router for metrics of the API."""
+
+from fastapi import APIRouter
+from starlette.responses import PlainTextResponse
+
+from repost import metrics
+
+router = APIRouter()
+
+
+@router.get('/', response_class=PlainTextResponse)
+async def get_metrics():
+    """Get the metrics of this worker in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
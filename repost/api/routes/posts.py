@@ -7,22 +7,45 @@ resolvers in `repost.resolvers`.
 
 from typing import List
 
-from fastapi import APIRouter, Depends, Path, status
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
 from sqlalchemy.orm import Session
 
 from repost import crud, models
+from repost.api.caching import cache_response
+from repost.api.etags import post_etag, post_comments_etag
+from repost.api.pagination import Pagination
 from repost.api.resolvers import resolve_post, resolve_user_owned_post, resolve_post_for_post_owner_or_resub_owner, \
     resolve_current_user, get_db
-from repost.api.schemas import ErrorResponse, Post, EditPost, Comment, CreateComment
+from repost.api.schemas import ErrorResponse, Post, EditPost, Comment, CreateComment, build_comment_tree
+from repost.api.serialization import orm_response
+from repost.cache import deletions_tag
 
 router = APIRouter()
 
+# Maximum number of posts to get at once
+max_ids = 100
+
+
+@router.get('/', response_model=List[Post], responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse}})
+def get_posts(ids: List[int] = Query(..., description=f'IDs of at most {max_ids} posts'),
+              db: Session = Depends(get_db)):
+    """Get many posts at once.
+
+    Posts are listed in the order of the IDs, and posts that do not
+    exist are left out.
+    """
+    if len(ids) > max_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'At most {max_ids} IDs are allowed')
+
+    return orm_response(Post, crud.get_posts_by_ids(db, post_ids=ids))
+
 
 @router.get('/{post_id}', response_model=Post,
+            dependencies=[Depends(cache_response('post:{post_id}', deletions_tag)), Depends(post_etag)],
             responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def get_post(post: models.Post = Depends(resolve_post)):
+def get_post(post: models.Post = Depends(resolve_post)):
     """Get a specific post in a resub."""
-    return post
+    return orm_response(Post, post)
 
 
 @router.delete('/{post_id}', status_code=status.HTTP_204_NO_CONTENT,
@@ -30,8 +53,8 @@ async def get_post(post: models.Post = Depends(resolve_post)):
                           status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                           status.HTTP_403_FORBIDDEN: {'model': ErrorResponse},
                           status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def delete_post(post: models.Post = Depends(resolve_post_for_post_owner_or_resub_owner),
-                      db: Session = Depends(get_db)):
+def delete_post(post: models.Post = Depends(resolve_post_for_post_owner_or_resub_owner),
+                db: Session = Depends(get_db)):
     """Delete a post in a resub.
 
     Only the author of a post or the owner of the parent resub can
@@ -45,8 +68,8 @@ async def delete_post(post: models.Post = Depends(resolve_post_for_post_owner_or
                          status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                          status.HTTP_403_FORBIDDEN: {'model': ErrorResponse},
                          status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def edit_post(*, post: models.Post = Depends(resolve_user_owned_post), edited_post: EditPost,
-                    db: Session = Depends(get_db)):
+def edit_post(*, post: models.Post = Depends(resolve_user_owned_post), edited_post: EditPost,
+              db: Session = Depends(get_db)):
     """Edit a post in a resub.
 
     Only the author of a post can edit the post."""
@@ -57,27 +80,46 @@ async def edit_post(*, post: models.Post = Depends(resolve_user_owned_post), edi
               responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
                          status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                          status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def vote_post(*, post: models.Post = Depends(resolve_post), vote: int = Path(..., ge=-1, le=1),
-                    current_user: models.User = Depends(resolve_current_user), db: Session = Depends(get_db)):
+def vote_post(*, post: models.Post = Depends(resolve_post), vote: int = Path(..., ge=-1, le=1),
+              current_user: crud.UserIdentity = Depends(resolve_current_user), db: Session = Depends(get_db)):
     """Vote on a post in a resub."""
     return crud.vote_post(db, post_id=post.id, author_id=current_user.id, vote=vote)
 
 
-@router.get('/{post_id}/comments', response_model=List[Comment],
+@router.get('/{post_id}/comments', response_model=List[Comment], dependencies=[Depends(post_comments_etag)],
             responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def get_comments_in_post(post: models.Post = Depends(resolve_post), db: Session = Depends(get_db),
-                               page: int = 0, page_size: int = 100):
+def get_comments_in_post(post: models.Post = Depends(resolve_post), db: Session = Depends(get_db),
+                         pagination: Pagination = Depends()):
     """Get all comments in post."""
-    return crud.get_comments(db, post.id, offset=page * page_size, limit=page_size)
+    comments = crud.get_comments(db, post.id, after=pagination.after, offset=pagination.offset, limit=pagination.limit)
+    return orm_response(Comment, pagination.paginate(comments), pagination.response)
+
+
+# NOTE: there is no response model since FastAPI cannot clone recursive
+# models, but the returned trees are already CommentTree models from
+# repost.api.schemas
+@router.get('/{post_id}/comments/tree', dependencies=[Depends(post_comments_etag)],
+            responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
+def get_comment_tree_in_post(post: models.Post = Depends(resolve_post), db: Session = Depends(get_db),
+                             depth: int = Query(5, ge=1, le=20, description='Number of levels of replies'),
+                             limit: int = Query(10, ge=1, le=100, description='Maximum replies to each comment'),
+                             offset: int = Query(0, ge=0, description='Number of top level comments to skip')):
+    """Get the threads of comments in a post.
+
+    Comments that have more replies than are included can load them
+    from the tree of the comment.
+    """
+    comments = crud.get_comment_tree(db, post_id=post.id, depth=depth, limit=limit, offset=offset)
+    return build_comment_tree(comments, depth=depth)
 
 
 @router.post('/{post_id}/comments', response_model=Comment, status_code=status.HTTP_201_CREATED,
              responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
                         status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                         status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def create_comment_in_post(*, post: models.Post = Depends(resolve_post), created_comment: CreateComment,
-                                 current_user: models.User = Depends(resolve_current_user),
-                                 db: Session = Depends(get_db)):
+def create_comment_in_post(*, post: models.Post = Depends(resolve_post), created_comment: CreateComment,
+                           current_user: crud.UserIdentity = Depends(resolve_current_user),
+                           db: Session = Depends(get_db)):
     """Create a comment in a post."""
     return crud.create_comment(db, author_id=current_user.id, parent_resub_id=post.parent_resub_id,
                                parent_post_id=post.id, parent_comment_id=None, content=created_comment.content)
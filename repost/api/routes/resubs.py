@@ -4,42 +4,50 @@ A resub is a user-created community, where fans can create related
 posts.
 """
 
-from typing import List
+from datetime import datetime, timezone
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
 
 from repost import crud, models
+from repost.api.caching import cache_response
+from repost.api.export import export_cursor, export_response, media_type
+from repost.api.pagination import Pagination, attribute_keyset
 from repost.api.resolvers import resolve_resub, resolve_user_owned_resub, resolve_current_user, get_db, resolve_user
-from repost.api.schemas import Resub, CreateResub, EditResub, ErrorResponse, Post, CreatePost
+from repost.api.schemas import Resub, CreateResub, EditResub, ErrorResponse, Post, CreatePost, PostSort, TopWindow
+from repost.api.serialization import orm_response
+from repost.cache import deletions_tag
 
 router = APIRouter()
 
 
 @router.get('/', response_model=List[Resub])
-async def get_resubs(db: Session = Depends(get_db), page: int = 0, page_size: int = 100):
+def get_resubs(db: Session = Depends(get_db), pagination: Pagination = Depends()):
     """Get all resubs."""
-    return crud.get_resubs(db, offset=page * page_size, limit=page_size)
+    resubs = crud.get_resubs(db, after=pagination.after, offset=pagination.offset, limit=pagination.limit)
+    return orm_response(Resub, pagination.paginate(resubs), pagination.response)
 
 
 @router.post('/', response_model=Resub, status_code=status.HTTP_201_CREATED,
              responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
                         status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse}})
-async def create_resub(resub: CreateResub, current_user: models.User = Depends(resolve_current_user),
-                       db: Session = Depends(get_db)):
+def create_resub(resub: CreateResub, current_user: crud.UserIdentity = Depends(resolve_current_user),
+                 db: Session = Depends(get_db)):
     """Create a new resub."""
-    db_resub = crud.get_resub(db, name=resub.name)
+    db_resub = crud.get_resub(db, name=resub.name, include_deleted=True)
     if db_resub:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Resub \'{resub.name}\' already exists')
 
     return crud.create_resub(db, owner_id=current_user.id, name=resub.name, description=resub.description)
 
 
-@router.get('/{resub}', response_model=Resub,
+@router.get('/{resub}', response_model=Resub, dependencies=[Depends(cache_response('resub:{resub}'))],
             responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def get_resub(resub: models.Resub = Depends(resolve_resub)):
+def get_resub(resub: models.Resub = Depends(resolve_resub)):
     """Get a specific resub."""
-    return resub
+    return orm_response(Resub, resub)
 
 
 @router.delete('/{resub}', status_code=status.HTTP_204_NO_CONTENT,
@@ -47,7 +55,7 @@ async def get_resub(resub: models.Resub = Depends(resolve_resub)):
                           status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                           status.HTTP_403_FORBIDDEN: {'model': ErrorResponse},
                           status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def delete_resub(resub: models.Resub = Depends(resolve_user_owned_resub), db: Session = Depends(get_db)):
+def delete_resub(resub: models.Resub = Depends(resolve_user_owned_resub), db: Session = Depends(get_db)):
     """Delete a resub.
 
     Only the owner of a resub can delete the resub.
@@ -60,8 +68,8 @@ async def delete_resub(resub: models.Resub = Depends(resolve_user_owned_resub),
                          status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                          status.HTTP_403_FORBIDDEN: {'model': ErrorResponse},
                          status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def edit_resub(*, resub: models.Resub = Depends(resolve_user_owned_resub), edited_resub: EditResub,
-                     db: Session = Depends(get_db)):
+def edit_resub(*, resub: models.Resub = Depends(resolve_user_owned_resub), edited_resub: EditResub,
+               db: Session = Depends(get_db)):
     """Edit a resub.
 
     Only the owner of a resub can edit the resub.
@@ -76,21 +84,49 @@ async def edit_resub(*, resub: models.Resub = Depends(resolve_user_owned_resub),
     return crud.update_resub(db, name=resub.name, **updated)
 
 
+# Ranks and time windows change without writes, so listings are cached briefly
 @router.get('/{resub}/posts', response_model=List[Post],
+            dependencies=[Depends(cache_response('resub:{resub}', 'resub-posts:{resub}', deletions_tag, ttl=10))],
             responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def get_posts_in_resub(resub: models.Resub = Depends(resolve_resub), db: Session = Depends(get_db),
-                             page: int = 0, page_size: int = 100):
-    """Get all posts in a resub."""
-    return crud.get_posts(db, parent_resub_id=resub.id, offset=page * page_size, limit=page_size)
+def get_posts_in_resub(resub: models.Resub = Depends(resolve_resub), db: Session = Depends(get_db),
+                       pagination: Pagination = Depends(), sort: PostSort = PostSort.new,
+                       window: TopWindow = Query(TopWindow.all, description='Time window of top posts')):
+    """Get all posts in a resub.
+
+    Posts are sorted by new, hot, top or rising. Rising posts are new
+    posts that are quickly getting votes.
+    """
+    since = None
+    if sort == PostSort.top and window.delta:
+        since = datetime.now(timezone.utc) - window.delta
+
+    column = crud.post_sort_columns[sort.value]
+    posts = crud.get_posts(db, parent_resub_id=resub.id, sort=sort.value, since=since, after=pagination.after,
+                           offset=pagination.offset, limit=pagination.limit)
+    return orm_response(Post, pagination.paginate(posts, keyset=attribute_keyset(column.key)), pagination.response)
+
+
+@router.get('/{resub}/export', response_class=StreamingResponse,
+            responses={status.HTTP_200_OK: {'content': {media_type: {}}},
+                       status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
+                       status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
+def export_resub(resub: models.Resub = Depends(resolve_resub), db: Session = Depends(get_db),
+                 after: Optional[crud.ExportCursor] = Depends(export_cursor)):
+    """Export every post and comment in a resub as newline-delimited
+    JSON.
+
+    Every line includes a cursor to resume the export after the line.
+    """
+    return export_response(crud.export_resub(db, resub_id=resub.id, after=after))
 
 
 @router.post('/{resub}/posts', response_model=Post, status_code=status.HTTP_201_CREATED,
              responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
                         status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse},
                         status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def create_post_in_resub(*, resub: models.Resub = Depends(resolve_resub),
-                               post: CreatePost, current_user: models.User = Depends(resolve_current_user),
-                               db: Session = Depends(get_db)):
+def create_post_in_resub(*, resub: models.Resub = Depends(resolve_resub),
+                         post: CreatePost, current_user: crud.UserIdentity = Depends(resolve_current_user),
+                         db: Session = Depends(get_db)):
     """Create a new post in a resub."""
     post = crud.create_post(db, author_id=current_user.id, parent_resub_id=resub.id, title=post.title, url=post.url,
                             content=post.content)
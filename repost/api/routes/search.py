@@ -0,0 +1,50 @@
+"""Router for full-text search of posts and comments."""
+
+from typing import List, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from repost import crud
+from repost.api.pagination import Pagination
+from repost.api.resolvers import get_db
+from repost.api.schemas import Comment, ErrorResponse, Post, SearchType
+from repost.api.serialization import orm_response
+
+router = APIRouter()
+
+# Maximum length of a search query
+max_query_length = 200
+
+
+@router.get('/', response_model=Union[List[Post], List[Comment]],
+            responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
+                       status.HTTP_501_NOT_IMPLEMENTED: {'model': ErrorResponse}})
+def search(q: str = Query(..., min_length=1, max_length=max_query_length, description='Words to search for'),
+           resub: str = Query(None, description='Name of a resub to search in'),
+           search_type: SearchType = Query(SearchType.post, alias='type', description='Type of items to search'),
+           db: Session = Depends(get_db), pagination: Pagination = Depends()):
+    """Search posts or comments.
+
+    Posts and comments that contain every word of the query are ordered
+    by relevance, where words in the title of a post weigh more than
+    words in its content.
+    """
+    if not crud.supports_search(db):
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail='Search is not supported by this database')
+
+    if pagination.after is not None and type(pagination.after[0]) not in (int, float):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor for search results')
+
+    if search_type == SearchType.post:
+        search_items, schema = crud.search_posts, Post
+    else:
+        search_items, schema = crud.search_comments, Comment
+
+    results = search_items(db, query=q, resub_name=resub, after=pagination.after, offset=pagination.offset,
+                           limit=pagination.limit)
+
+    ranks = {item.id: rank for item, rank in results}
+    items = pagination.paginate([item for item, _ in results], keyset=lambda item: (ranks[item.id], item.id))
+    return orm_response(schema, items, pagination.response)
@@ -1,41 +1,54 @@
 """Router for user accounts."""
 
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
 
 from repost import crud, models
+from repost.api.caching import cache_response
+from repost.api.export import export_cursor, export_response, media_type
+from repost.api.pagination import Pagination
 from repost.api.resolvers import resolve_user, get_db, resolve_current_user
 from repost.api.schemas import User, CreateUser, Resub, Post, Comment, ErrorResponse, EditUser
+from repost.api.serialization import orm_response
+from repost.password import hash_password
 
 router = APIRouter()
 
 
 @router.post('/', response_model=User, status_code=status.HTTP_201_CREATED,
-             responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse}})
+             responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
+                        status.HTTP_503_SERVICE_UNAVAILABLE: {'model': ErrorResponse}})
 async def create_user(user: CreateUser, db: Session = Depends(get_db)):
-    """Create a new user."""
-    db_user = crud.get_user(db, username=user.username)
+    """Create a new user.
+
+    The route awaits hashing the password on the event loop, and runs
+    the queries in the threadpool.
+    """
+    db_user = await run_in_threadpool(crud.get_user, db, username=user.username, include_deleted=True)
     if db_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'User \'{user.username}\' already exists')
 
-    return crud.create_user(db, username=user.username, password=user.password)
+    hashed_password = await hash_password(user.password)
+    return await run_in_threadpool(crud.create_user, db, username=user.username, hashed_password=hashed_password)
 
 
 @router.get('/me', response_model=User,
             responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
                        status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse}})
-async def get_current_user(current_user: models.User = Depends(resolve_current_user)):
+def get_current_user(current_user: crud.UserIdentity = Depends(resolve_current_user), db: Session = Depends(get_db)):
     """Get the currently authorized user."""
-    return current_user
+    return orm_response(User, crud.get_user(db, username=current_user.username))
 
 
 @router.patch('/me', response_model=User,
               responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
                          status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse}})
-async def edit_current_user(*, current_user: models.User = Depends(get_current_user), edited_user: EditUser,
-                            db: Session = Depends(get_db)):
+def edit_current_user(*, current_user: crud.UserIdentity = Depends(resolve_current_user), edited_user: EditUser,
+                      db: Session = Depends(get_db)):
     """Edit the currently authorized user."""
     return crud.update_user(db, username=current_user.username, **edited_user.dict(exclude_unset=True))
 
@@ -43,37 +56,57 @@ async def edit_current_user(*, current_user: models.User = Depends(get_current_u
 @router.delete('/me', status_code=status.HTTP_204_NO_CONTENT,
                responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
                           status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse}})
-async def delete_current_user(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_current_user(current_user: crud.UserIdentity = Depends(resolve_current_user), db: Session = Depends(get_db)):
     """Delete the currently authorized user."""
     crud.delete_user(db, username=current_user.username)
 
 
-@router.get('/{username}', response_model=User,
+@router.get('/{username}', response_model=User, dependencies=[Depends(cache_response('user:{username}'))],
             responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def get_user(user: models.User = Depends(resolve_user)):
+def get_user(user: models.User = Depends(resolve_user)):
     """Get a specific user."""
-    return user
+    return orm_response(User, user)
 
 
 @router.get('/{username}/resubs', response_model=List[Resub],
             responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def get_resubs_owned_by_user(user: models.User = Depends(resolve_user), db: Session = Depends(get_db),
-                                   page: int = 0, page_size: int = 100):
+def get_resubs_owned_by_user(user: models.User = Depends(resolve_user), db: Session = Depends(get_db),
+                             pagination: Pagination = Depends()):
     """Get all resubs owned by a specific user."""
-    return crud.get_resubs_by_user(db, user_id=user.id, offset=page * page_size, limit=page_size)
+    resubs = crud.get_resubs_by_user(db, user_id=user.id, after=pagination.after, offset=pagination.offset,
+                                     limit=pagination.limit)
+    return orm_response(Resub, pagination.paginate(resubs), pagination.response)
 
 
 @router.get('/{username}/posts', response_model=List[Post],
             responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def get_posts_by_user(user: models.User = Depends(resolve_user), db: Session = Depends(get_db),
-                            page: int = 0, page_size: int = 100):
+def get_posts_by_user(user: models.User = Depends(resolve_user), db: Session = Depends(get_db),
+                      pagination: Pagination = Depends()):
     """Get all posts by a specific user."""
-    return crud.get_posts_by_user(db, user_id=user.id, offset=page * page_size, limit=page_size)
+    posts = crud.get_posts_by_user(db, user_id=user.id, after=pagination.after, offset=pagination.offset,
+                                   limit=pagination.limit)
+    return orm_response(Post, pagination.paginate(posts), pagination.response)
 
 
 @router.get('/{username}/comments', response_model=List[Comment],
             responses={status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
-async def get_comments_by_user(user: models.User = Depends(resolve_user), db: Session = Depends(get_db),
-                               page: int = 0, page_size: int = 100):
+def get_comments_by_user(user: models.User = Depends(resolve_user), db: Session = Depends(get_db),
+                         pagination: Pagination = Depends()):
     """Get all comments by a specific user."""
-    return crud.get_comments_by_user(db, user_id=user.id, offset=page * page_size, limit=page_size)
+    comments = crud.get_comments_by_user(db, user_id=user.id, after=pagination.after, offset=pagination.offset,
+                                         limit=pagination.limit)
+    return orm_response(Comment, pagination.paginate(comments), pagination.response)
+
+
+@router.get('/{username}/export', response_class=StreamingResponse,
+            responses={status.HTTP_200_OK: {'content': {media_type: {}}},
+                       status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
+                       status.HTTP_404_NOT_FOUND: {'model': ErrorResponse}})
+def export_user(user: models.User = Depends(resolve_user), db: Session = Depends(get_db),
+                after: Optional[crud.ExportCursor] = Depends(export_cursor)):
+    """Export every post and comment by a specific user as
+    newline-delimited JSON.
+
+    Every line includes a cursor to resume the export after the line.
+    """
+    return export_response(crud.export_user(db, user_id=user.id, after=after))
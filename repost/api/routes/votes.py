@@ -0,0 +1,25 @@
+"""Router for voting on many posts and comments at once."""
+
+from fastapi import APIRouter, Depends, status
+from sqlalchemy.orm import Session
+
+from repost import crud
+from repost.api.resolvers import resolve_current_user, get_db
+from repost.api.schemas import ErrorResponse, VoteBatch
+
+router = APIRouter()
+
+
+@router.post('/batch', status_code=status.HTTP_204_NO_CONTENT,
+             responses={status.HTTP_400_BAD_REQUEST: {'model': ErrorResponse},
+                        status.HTTP_401_UNAUTHORIZED: {'model': ErrorResponse}})
+def vote_batch(votes: VoteBatch, current_user: crud.UserIdentity = Depends(resolve_current_user),
+               db: Session = Depends(get_db)):
+    """Vote on many posts and comments at once.
+
+    Every vote is applied in one transaction. Votes on posts and
+    comments that do not exist are ignored, and the last vote on the
+    same post or comment is used.
+    """
+    crud.vote_batch(db, author_id=current_user.id, post_votes={vote.id: vote.vote for vote in votes.posts},
+                    comment_votes={vote.id: vote.vote for vote in votes.comments})
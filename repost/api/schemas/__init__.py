@@ -1,7 +1,9 @@
 from .generic import bind_orm_fields
 from .auth import OAuth2Token
-from .comment import Comment, CreateComment, EditComment
+from .comment import Comment, CommentTree, CreateComment, EditComment, build_comment_tree
 from .error import ErrorResponse
-from .post import Post, CreatePost, EditPost
+from .post import Post, CreatePost, EditPost, PostSort, TopWindow
 from .resub import Resub, CreateResub, EditResub
 from .user import User, CreateUser, EditUser
+from .vote import Vote, VoteBatch
+from .search import SearchType
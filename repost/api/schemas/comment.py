@@ -1,11 +1,12 @@
 """API schemas for comments."""
 
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Any, Dict, Iterable, Tuple
 
 from pydantic import BaseModel, Field
 
 from repost.api.schemas import bind_orm_fields
+from repost.crud.comments import comment_tree_base_depth
 
 
 class Comment(BaseModel):
@@ -18,12 +19,66 @@ class Comment(BaseModel):
     author_username: str = Field(..., description='Username of the author of the comment')
     created: datetime
     edited: Optional[datetime]
-    votes: int = 0
+    votes: int = Field(0, description='Sum of all votes')
+    upvotes: int = 0
+    downvotes: int = 0
 
     class Config:
         orm_mode = True
         getter_dict = bind_orm_fields(author_username='author.username', parent_resub_name='parent_resub.name',
-                                      votes=lambda comment: sum(v.vote for v in comment.votes))
+                                      votes='score')
+
+
+class CommentTree(Comment):
+    """Schema for a comment with its replies"""
+    replies: List['CommentTree'] = []
+    more_replies: int = Field(0, description='Number of replies not included, either because of the reply limit '
+                                             'or the depth limit')
+
+    class Config:
+        getter_dict = bind_orm_fields(author_username='author.username', parent_resub_name='parent_resub.name',
+                                      votes='score', replies=lambda comment: [])
+
+
+CommentTree.update_forward_refs()
+
+
+def build_comment_tree(comments: Iterable[Tuple[Any, int]], *, parent: Any = None, depth: int) -> List[CommentTree]:
+    """Assemble comments ordered by path into trees of replies.
+
+    The comments must be the page of replies to the parent comment, or
+    of comments in a post when there is no parent, from
+    `get_comment_tree` with the same depth, along with the number of
+    replies to the parent of every comment. The extra level of replies is
+    only counted in more_replies, and comments by deleted users are left
+    out with their replies.
+    """
+    parent_id = None if parent is None else parent.id
+    max_depth = comment_tree_base_depth(parent) + depth
+    top_level = []
+    nodes: Dict[int, CommentTree] = {}
+    replies: Dict[int, int] = {}
+
+    for comment, reply_count in comments:
+        if comment.parent_comment_id == parent_id:
+            nodes[comment.id] = CommentTree.from_orm(comment)
+            top_level.append(nodes[comment.id])
+            continue
+
+        # Replies to comments that were left out are left out as well
+        reply_parent = nodes.get(comment.parent_comment_id)
+        if reply_parent is None:
+            continue
+
+        replies[reply_parent.id] = reply_count
+        if comment.depth <= max_depth and comment.author.deleted is None:
+            nodes[comment.id] = CommentTree.from_orm(comment)
+            reply_parent.replies.append(nodes[comment.id])
+
+    for comment_id, reply_count in replies.items():
+        nodes[comment_id].more_replies = reply_count - len(nodes[comment_id].replies)
+
+    return top_level
 
 
 class CreateComment(BaseModel):
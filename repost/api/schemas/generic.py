@@ -33,6 +33,8 @@ def bind_orm_fields(**fields: Union[str, Callable]) -> Type[GetterDict]:
         from ORM objects, or needs to run a method to resolve any
         given attribute.
         """
+        # Used by repost.api.serialization to compile serializers
+        bound_fields = fields
 
         def __init__(self, obj):
             self.custom_fields = {}
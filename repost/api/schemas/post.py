@@ -1,6 +1,7 @@
 """API schemas for posts."""
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from enum import Enum
 from typing import Optional
 
 from pydantic import Field, BaseModel
@@ -18,12 +19,14 @@ class Post(BaseModel):
     author_username: str = Field(..., description='Username of the author of the post')
     created: datetime
     edited: Optional[datetime]
-    votes: int = 0
+    votes: int = Field(0, description='Sum of all votes')
+    upvotes: int = 0
+    downvotes: int = 0
 
     class Config:
         orm_mode = True
         getter_dict = bind_orm_fields(author_username='author.username', parent_resub_name='parent_resub.name',
-                                      votes=lambda post: sum(v.vote for v in post.votes))
+                                      votes='score')
 
 
 class CreatePost(BaseModel):
@@ -38,3 +41,27 @@ class EditPost(BaseModel):
     title: str = ''
     url: Optional[str] = None
     content: Optional[str] = None
+
+
+class PostSort(str, Enum):
+    """Sort order of posts in a resub"""
+    new = 'new'
+    hot = 'hot'
+    top = 'top'
+    rising = 'rising'
+
+
+class TopWindow(str, Enum):
+    """Time window of top posts"""
+    hour = 'hour'
+    day = 'day'
+    week = 'week'
+    month = 'month'
+    year = 'year'
+    all = 'all'
+
+    @property
+    def delta(self) -> Optional[timedelta]:
+        """Length of the time window, or None for all time."""
+        return {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1),
+                'month': timedelta(days=30), 'year': timedelta(days=365)}.get(self.value)
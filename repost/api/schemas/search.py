@@ -0,0 +1,9 @@
+"""API schemas for search."""
+
+from enum import Enum
+
+
+class SearchType(str, Enum):
+    """Type of items to search"""
+    post = 'post'
+    comment = 'comment'
@@ -0,0 +1,17 @@
+"""API schemas for votes."""
+
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class Vote(BaseModel):
+    """Schema for a vote on a post or comment"""
+    id: int = Field(..., description='ID of the post or comment')
+    vote: int = Field(..., ge=-1, le=1, description='1 to upvote, -1 to downvote or 0 to remove the vote')
+
+
+class VoteBatch(BaseModel):
+    """Schema for votes on many posts and comments"""
+    posts: List[Vote] = Field([], max_items=1000)
+    comments: List[Vote] = Field([], max_items=1000)
@@ -8,29 +8,42 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
 
 from repost import config
+from repost.cache import TTLCache
 
 oauth2_scopes = {'user': 'User access'}
 
 # NOTE: this path is hardcoded and correlates to repost.api.routes.auth.login
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/auth/token', scopes=oauth2_scopes)
 
+# Decoded claims of recently used tokens, kept no longer than the token expires
+token_cache = TTLCache('tokens', maxsize=config.auth_cache_size, ttl=config.auth_cache_ttl)
 
-def create_jwt_token(username: str, expire_delta: timedelta = timedelta(days=7), scopes: List[str] = None) -> str:
-    """Create JSON Web Token with a username as the subject"""
-    expire = datetime.utcnow() + expire_delta
 
-    data = {'sub': username, 'exp': expire, 'scopes': scopes or []}
+def create_jwt_token(username: str, user_id: int, expire_delta: timedelta = timedelta(days=7),
+                     scopes: List[str] = None) -> str:
+    """Create JSON Web Token with a username as the subject, and the ID of
+    the user
+    """
+    issued = datetime.utcnow()
+    expire = issued + expire_delta
+
+    data = {'sub': username, 'uid': user_id, 'iat': issued, 'exp': expire, 'scopes': scopes or []}
     jwt_token = jwt.encode(data, config.jwt_secret, algorithm=config.jwt_algorithm)
     return jwt_token
 
 
 def decode_jwt_token(jwt_token: str) -> dict:
     """Decode a JSON Web Token"""
-    return jwt.decode(jwt_token, key=config.jwt_secret, verify=config.jwt_algorithm)
+    payload = token_cache.get(jwt_token)
+    if payload is None:
+        payload = jwt.decode(jwt_token, key=config.jwt_secret, verify=config.jwt_algorithm)
+        token_cache.set(jwt_token, payload, expires=payload.get('exp'))
+
+    return payload
 
 
-async def authorize_user(security_scopes: SecurityScopes, jwt_token: str = Depends(oauth2_scheme)) -> str:
-    """Validate and return the username in the JSON Web Token."""
+async def authorize_user(security_scopes: SecurityScopes, jwt_token: str = Depends(oauth2_scheme)) -> dict:
+    """Validate and return the claims of the JSON Web Token."""
     try:
         payload = decode_jwt_token(jwt_token)
     except jwt.exceptions.ExpiredSignatureError:
@@ -45,4 +58,4 @@ async def authorize_user(security_scopes: SecurityScopes, jwt_token: str = Depen
         if scope not in scopes:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f'Missing scope \'{scope}\'')
 
-    return payload.get('sub')
+    return payload
@@ -0,0 +1,102 @@
+"""Fast serialization of response schemas.
+
+Returning ORM objects from a route validates them with the response
+model, which builds a GetterDict for every object, and then encodes the
+validated models again. Outgoing data is already trusted, so routes
+serialize ORM objects and records with a serializer compiled for the
+schema instead, and return the JSON with `orm_response`.
+"""
+
+import operator
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Tuple, Type, Union
+
+from fastapi import Response, status
+from fastapi.responses import UJSONResponse
+from pydantic import BaseModel
+
+from repost.metrics import add_time
+
+Serializer = Callable[[Any], Dict[str, Any]]
+
+_serializers: Dict[Tuple[Type[BaseModel], bool], Serializer] = {}
+
+
+def compile_serializer(schema: Type[BaseModel], record: bool = False) -> Serializer:
+    """Compile a function that converts an ORM object or a record to a
+    dict of JSON types with the fields of the schema.
+
+    Fields of ORM objects bound with `bind_orm_fields` are read from the
+    bound attribute or function. Every other field, and every field of a
+    record from `repost.records`, is read from the attribute of the same
+    name. Values are not validated.
+    """
+    bound_fields = {} if record else getattr(schema.__config__.getter_dict, 'bound_fields', {})
+
+    names, attributes, functions = [], [], []
+    for name in schema.__fields__:
+        value = bound_fields.get(name, name)
+        if type(value) is str:
+            names.append(name)
+            attributes.append(value)
+        else:
+            functions.append((name, value))
+
+    # A single attrgetter reads every attribute in one call, and returns
+    # a tuple as long as there are at least two attributes
+    get_attributes = operator.attrgetter(*attributes, *attributes[:1])
+    names = tuple(names)
+    datetimes = tuple(name for name, field in schema.__fields__.items() if field.type_ is datetime)
+
+    def serializer(obj: Any) -> Dict[str, Any]:
+        data = dict(zip(names, get_attributes(obj)))
+        for name, function in functions:
+            data[name] = function(obj)
+        for name in datetimes:
+            if data[name] is not None:
+                data[name] = data[name].isoformat()
+
+        return data
+
+    return serializer
+
+
+def _get_serializer(schema: Type[BaseModel], obj: Any) -> Serializer:
+    """Get the serializer of the schema for the type of the object."""
+    key = schema, isinstance(obj, tuple)
+    serializer = _serializers.get(key)
+    if serializer is None:
+        serializer = _serializers[key] = compile_serializer(*key)
+
+    return serializer
+
+
+def serialize(schema: Type[BaseModel], content: Union[Any, Iterable[Any]]) -> Any:
+    """Serialize an ORM object or record, or a list of them, with the
+    schema.
+    """
+    if isinstance(content, list):
+        if not content:
+            return []
+
+        serializer = _get_serializer(schema, content[0])
+        return [serializer(obj) for obj in content]
+
+    return _get_serializer(schema, content)(content)
+
+
+def orm_response(schema: Type[BaseModel], content: Union[Any, Iterable[Any]], response: Response = None,
+                 status_code: int = status.HTTP_200_OK) -> Response:
+    """Respond with the content serialized with the schema.
+
+    FastAPI does not add the headers of the route's response parameter
+    to returned responses, so pass it to include them.
+    """
+    start = time.perf_counter()
+    json_response = UJSONResponse(serialize(schema, content), status_code=status_code)
+    add_time('serialize', time.perf_counter() - start)
+    if response is not None:
+        json_response.headers.raw.extend(response.headers.raw)
+
+    return json_response
@@ -0,0 +1,237 @@
+"""Caches with hit and miss counters.
+
+`TTLCache` is an in-process cache. `response_cache` caches responses of
+GET routes in the backend set in the config, and entries are
+invalidated by tags whenever the data they include is written.
+"""
+
+import itertools
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+from repost import config
+
+# Every cache by name, so that their counters can be reported
+caches: Dict[str, Any] = {}
+
+# Tag of every cached response with posts, which is invalidated whenever a
+# resub or user is deleted, since the posts hidden by the deletion may be
+# too many to invalidate one by one
+deletions_tag = 'deletions'
+
+
+class TTLCache:
+    """Thread safe LRU cache where every entry expires after a time to live.
+
+    Entries can be given an earlier expiry time, e.g. the expiry of a
+    JSON Web Token, in seconds since the epoch. Named caches are added
+    to `caches`.
+    """
+
+    def __init__(self, name: Optional[str], maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+        if name is not None:
+            caches[name] = self
+
+    @property
+    def hit_ratio(self) -> float:
+        """Ratio of lookups that found an entry."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get the value of an entry that has not expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, expires: float = None, ttl: float = None):
+        """Add an entry, evicting the least recently used entry when full.
+
+        The entry expires after the given TTL, or the cache TTL by default.
+        """
+        expires_ttl = time.time() + (self.ttl if ttl is None else ttl)
+        expires = expires_ttl if expires is None else min(expires, expires_ttl)
+
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        """Remove an entry if it exists."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MemoryBackend:
+    """Response cache backend in the memory of this worker.
+
+    Other workers are not invalidated, so they may serve a stale response
+    until it expires.
+    """
+    blocking = False
+
+    def __init__(self, maxsize: int):
+        self._entries = TTLCache(None, maxsize=maxsize, ttl=0)
+        self._versions = OrderedDict()
+        self._versions_maxsize = maxsize * 10
+        self._lock = Lock()
+
+        # Evicted versions are replaced with new numbers, so that entries
+        # stored with an evicted version can never be valid again
+        self._next_version = itertools.count(1)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._entries.get(key)
+
+    def set(self, key: str, entry: dict, ttl: float):
+        self._entries.set(key, entry, ttl=ttl)
+
+    def versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        with self._lock:
+            versions = {}
+            for tag in tags:
+                if tag not in self._versions:
+                    self._versions[tag] = next(self._next_version)
+                    if len(self._versions) > self._versions_maxsize:
+                        self._versions.popitem(last=False)
+
+                self._versions.move_to_end(tag)
+                versions[tag] = self._versions[tag]
+
+            return versions
+
+    def invalidate(self, tags: Iterable[str]):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = next(self._next_version)
+                self._versions.move_to_end(tag)
+
+
+class RedisBackend:
+    """Response cache backend in Redis, shared by every worker.
+
+    Requires the `redis` package. Tag versions are stored without expiry,
+    so Redis must not be set to evict keys without an expiry.
+    """
+    blocking = True
+
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._redis.get(f'repost:response:{key}')
+        return json.loads(entry) if entry is not None else None
+
+    def set(self, key: str, entry: dict, ttl: float):
+        self._redis.set(f'repost:response:{key}', json.dumps(entry), px=int(ttl * 1000))
+
+    def versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        tags = list(tags)
+        values = self._redis.mget([f'repost:tag:{tag}' for tag in tags])
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+
+    def invalidate(self, tags: Iterable[str]):
+        pipeline = self._redis.pipeline(transaction=False)
+        for tag in tags:
+            pipeline.incr(f'repost:tag:{tag}')
+        pipeline.execute()
+
+
+class ResponseCache:
+    """Cache of responses that are invalidated by tags.
+
+    Every entry is stored with the version of each of its tags at the
+    time the response was created. Invalidating a tag changes its
+    version, which makes every entry with the tag invalid.
+    """
+
+    def __init__(self, name: str, backend: Any):
+        self.name = name
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+        caches[name] = self
+
+    @property
+    def hit_ratio(self) -> float:
+        """Ratio of cacheable requests that were served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: str) -> Optional[dict]:
+        """Get an entry if none of its tags were invalidated."""
+        entry = self.backend.get(key)
+        if entry is None or self.backend.versions(entry['tags']) != entry['tags']:
+            return None
+
+        self.hits += 1
+        return entry
+
+    def miss(self, tags: Iterable[str]) -> Dict[str, int]:
+        """Count a miss and get the current version of every tag.
+
+        The versions must be read before the response is created, so
+        that a write while creating it invalidates the new entry.
+        """
+        self.misses += 1
+        return self.backend.versions(tags)
+
+    def set(self, key: str, entry: dict, ttl: float):
+        """Add an entry with the dict of tag versions in entry['tags']."""
+        self.backend.set(key, entry, ttl)
+
+    def invalidate(self, tags: Iterable[str]):
+        """Invalidate every entry with any of the tags."""
+        self.backend.invalidate(tags)
+
+
+def _create_response_cache() -> Optional[ResponseCache]:
+    """Create the response cache with the backend set in the config."""
+    if config.response_cache == 'memory':
+        return ResponseCache('responses', MemoryBackend(maxsize=config.response_cache_size))
+    if config.response_cache == 'redis':
+        return ResponseCache('responses', RedisBackend(config.response_cache_url))
+
+    return None
+
+
+response_cache = _create_response_cache()
+
+
+def invalidate(*tags: str):
+    """Invalidate every cached response with any of the tags."""
+    if response_cache is not None:
+        response_cache.invalidate(tags)
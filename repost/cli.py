@@ -0,0 +1,158 @@
+"""Command line interface for maintenance tasks.
+
+Run `python -m repost.cli --help` for a list of commands.
+"""
+
+import argparse
+import sys
+from typing import List
+
+from repost import crud
+from repost.database import SessionLocal
+from repost.dataset import DatasetError, generate_dataset, import_dataset
+
+
+def recompute_scores(args: argparse.Namespace):
+    """Recompute the score columns of all posts and comments."""
+    db = SessionLocal()
+    try:
+        crud.recompute_scores(db)
+    finally:
+        db.close()
+
+    print('Recomputed scores of all posts and comments')
+
+
+def rebuild_comment_paths(args: argparse.Namespace):
+    """Rebuild the thread paths of all comments."""
+    db = SessionLocal()
+    try:
+        crud.rebuild_comment_paths(db)
+    finally:
+        db.close()
+
+    print('Rebuilt paths of all comments')
+
+
+def refresh_ranks(args: argparse.Namespace):
+    """Recompute the hot and rising ranks of all posts."""
+    db = SessionLocal()
+    try:
+        crud.refresh_ranks(db)
+    finally:
+        db.close()
+
+    print('Refreshed ranks of all posts')
+
+
+def rebuild_search_index(args: argparse.Namespace):
+    """Index every post and comment for search."""
+    db = SessionLocal()
+    try:
+        crud.rebuild_search_index(db)
+    finally:
+        db.close()
+
+    print('Rebuilt the search index of all posts and comments')
+
+
+def purge_deleted(args: argparse.Namespace):
+    """Purge the rows of deleted resubs and users now."""
+    db = SessionLocal()
+    try:
+        deleted = crud.purge_deleted(db)
+    finally:
+        db.close()
+
+    print(f'Purged {deleted} rows of deleted resubs and users')
+
+
+def _print_counts(loader: crud.BulkLoader):
+    for table, count in loader.counts.items():
+        print(f'Inserted {count} rows into {table}')
+
+
+def import_data(args: argparse.Namespace):
+    """Import users, resubs, posts, comments and votes from NDJSON."""
+    db = SessionLocal()
+    try:
+        loader = crud.BulkLoader(db, password=args.password, batch_size=args.batch_size)
+        with open(args.file, encoding='utf-8') if args.file != '-' else sys.stdin as lines:
+            import_dataset(loader, lines)
+    except DatasetError as error:
+        sys.exit(f'{args.file}: {error}')
+    finally:
+        db.close()
+
+    _print_counts(loader)
+
+
+def generate_data(args: argparse.Namespace):
+    """Generate a dataset with skewed popularity for load testing."""
+    db = SessionLocal()
+    try:
+        loader = crud.BulkLoader(db, password=args.password, batch_size=args.batch_size)
+        generate_dataset(loader, users=args.users, resubs=args.resubs, posts=args.posts, comments=args.comments,
+                         days=args.days, seed=args.seed)
+    finally:
+        db.close()
+
+    _print_counts(loader)
+
+
+def _positive(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive number')
+
+    return number
+
+
+def _add_loader_arguments(command: argparse.ArgumentParser):
+    command.add_argument('--password', default='password', help='Password of every created user')
+    command.add_argument('--batch-size', type=_positive, default=10000, help='Rows inserted at once')
+
+
+def main(argv: List[str] = None):
+    """Parse the arguments and run the given command."""
+    parser = argparse.ArgumentParser(prog='python -m repost.cli', description=__doc__)
+    commands = parser.add_subparsers(title='commands', dest='command')
+    commands.required = True
+
+    command = commands.add_parser('recompute-scores', help=recompute_scores.__doc__)
+    command.set_defaults(func=recompute_scores)
+
+    command = commands.add_parser('rebuild-comment-paths', help=rebuild_comment_paths.__doc__)
+    command.set_defaults(func=rebuild_comment_paths)
+
+    command = commands.add_parser('refresh-ranks', help=refresh_ranks.__doc__)
+    command.set_defaults(func=refresh_ranks)
+
+    command = commands.add_parser('rebuild-search-index', help=rebuild_search_index.__doc__)
+    command.set_defaults(func=rebuild_search_index)
+
+    command = commands.add_parser('purge-deleted', help=purge_deleted.__doc__)
+    command.set_defaults(func=purge_deleted)
+
+    command = commands.add_parser('import', help=import_data.__doc__,
+                                  description='Import NDJSON in the format described in repost.dataset.')
+    command.add_argument('file', help='NDJSON file to import, or - to read standard input')
+    _add_loader_arguments(command)
+    command.set_defaults(func=import_data)
+
+    command = commands.add_parser('generate', help=generate_data.__doc__)
+    command.add_argument('--users', type=_positive, default=1000)
+    command.add_argument('--resubs', type=_positive, default=50)
+    command.add_argument('--posts', type=int, default=10000)
+    command.add_argument('--comments', type=int, default=50000, help='Approximate number of comments')
+    command.add_argument('--days', type=float, default=30, help='Days over which the posts are created')
+    command.add_argument('--seed', type=int, help='Seed for a reproducible dataset')
+    _add_loader_arguments(command)
+    command.set_defaults(func=generate_data)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
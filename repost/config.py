@@ -2,9 +2,9 @@
 
 import os
 import secrets
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields
 from pathlib import Path
-from typing import List
+from typing import List, Any
 
 from dotenv import load_dotenv
 
@@ -19,6 +19,16 @@ def _format_key(key: str) -> str:
     return env_prefix + key.upper().lstrip('_')
 
 
+def _parse_value(value: str, value_type: type) -> Any:
+    """Parse the environment variable value as the given type."""
+    if value_type is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    if value_type in (int, float):
+        return value_type(value)
+
+    return value
+
+
 @dataclass
 class Config:
     """Definition and defaults for package configuration."""
@@ -26,12 +36,51 @@ class Config:
     jwt_secret: str = secrets.token_hex(32)
     jwt_algorithm: str = 'HS256'
     database_url: str = 'sqlite:///./repost.db'
+    pool_size: int = 5
+    pool_max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = -1
+    pool_pre_ping: bool = False
+    pool_lifo: bool = False
+    statement_timeout: float = 0.0
+    sqlite_profile: str = 'wal'
+    sqlite_cache_size: int = 16384
+    sqlite_mmap_size: int = 268435456
+    sqlite_busy_timeout: float = 5.0
     _origins: str = 'http://localhost;http://localhost:8080'
+    password_executor: str = 'thread'
+    password_workers: int = 4
+    password_queue_size: int = 64
+    auth_cache_size: int = 10000
+    auth_cache_ttl: float = 60.0
+    ranking_interval: float = 300.0
+    response_cache: str = 'memory'
+    response_cache_url: str = 'redis://localhost:6379/0'
+    response_cache_size: int = 10000
+    response_cache_ttl: float = 30.0
+    vote_write_behind: bool = False
+    vote_flush_interval: float = 1.0
+    purge_interval: float = 10.0
+    admission_control: bool = True
+    admission_read_limit: int = 32
+    admission_write_limit: int = 16
+    admission_auth_limit: int = 8
+    admission_queue_size: int = 64
+    admission_queue_timeout: float = 5.0
+    admission_retry_after: int = 1
+    admission_adaptive: bool = False
+    admission_latency_target: float = 0.5
+    _replica_urls: str = ''
+    replica_retry_interval: float = 30.0
 
     @property
     def origins(self) -> List[str]:
         return self._origins.split(';')
 
+    @property
+    def replica_urls(self) -> List[str]:
+        return [url for url in self._replica_urls.split(';') if url]
+
     def __init__(self):
         """Initialize and load the config instance."""
         # Initialize config file with defaults if it does not exist
@@ -42,8 +91,10 @@ class Config:
         load_dotenv(dotenv_path=env_path, verbose=True)
 
         # Add environment variables to configurations
-        for key, default in asdict(self).items():
-            setattr(self, key, os.getenv(_format_key(key), default))
+        for field in fields(self):
+            value = os.getenv(_format_key(field.name))
+            if value is not None:
+                setattr(self, field.name, _parse_value(value, field.type))
 
 
 config = Config()
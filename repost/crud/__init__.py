@@ -1,5 +1,17 @@
-from .comments import get_comments, get_comment, create_comment, update_comment, delete_comment, vote_comment
-from .posts import get_posts, get_post, create_post, update_post, delete_post, vote_post
+from .batch import vote_batch
+from .bulk import BulkLoader
+from .comments import get_comments, get_comments_by_ids, get_comment, get_comment_tree, get_comments_version, \
+    get_replies_version, create_comment, update_comment, delete_comment, vote_comment, vote_comments, \
+    write_comment_votes, rebuild_comment_paths
+from .export import ExportCursor, export_types, export_resub, export_user
+from .posts import post_sort_columns, get_posts, get_posts_by_ids, get_post, get_post_version, create_post, \
+    update_post, delete_post, vote_post, vote_posts, write_post_votes
+from .purge import purge_stages, enqueue_purge, purge_deleted
+from .ranking import refresh_ranks, refresh_rising_ranks
 from .resubs import get_resubs, get_resub, create_resub, update_resub, delete_resub
-from .users import get_user, create_user, update_user, delete_user, get_resubs_by_user, get_posts_by_user, \
-    get_comments_by_user
+from .scores import recompute_scores
+from .search import supports_search, index_posts, index_comments, unindex_posts, unindex_comments, \
+    rebuild_search_index, search_posts, search_comments
+from .users import UserIdentity, get_user, get_user_identity, create_user, update_user, delete_user, \
+    get_resubs_by_user, get_posts_by_user, get_comments_by_user
+from .votes import flush_votes
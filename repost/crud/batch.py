@@ -0,0 +1,30 @@
+from typing import Dict
+
+from sqlalchemy.orm import Session
+
+from repost.cache import invalidate
+from repost.crud.comments import vote_comments, write_comment_votes
+from repost.crud.posts import vote_posts, write_post_votes
+from repost.crud.votes import vote_buffer
+
+
+def vote_batch(db: Session, *, author_id: int, post_votes: Dict[int, int], comment_votes: Dict[int, int]):
+    """Write a user's votes keyed by post ID and comment ID in one
+    transaction.
+
+    Votes on posts and comments that do not exist are ignored. With
+    write-behind enabled, the votes are buffered instead.
+    """
+    post_votes = {(post_id, author_id): vote for post_id, vote in post_votes.items()}
+    comment_votes = {(comment_id, author_id): vote for comment_id, vote in comment_votes.items()}
+
+    if vote_buffer is not None:
+        for (post_id, _), vote in post_votes.items():
+            vote_buffer.add(vote_posts, post_id, author_id, vote)
+        for (comment_id, _), vote in comment_votes.items():
+            vote_buffer.add(vote_comments, comment_id, author_id, vote)
+        return
+
+    tags = write_post_votes(db, post_votes) + write_comment_votes(db, comment_votes)
+    db.commit()
+    invalidate(*tags)
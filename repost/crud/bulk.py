@@ -0,0 +1,191 @@
+"""Inserting many rows at once, e.g. when importing or generating data.
+
+Rows are buffered and inserted with one executemany per table, instead of
+adding, committing and refreshing one ORM object at a time. IDs are set
+by the loader instead of the database, so that rows referring to other
+rows are inserted without reading any IDs back.
+"""
+
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from repost.crud.comments import comment_path
+from repost.models import Comment, CommentVote, Post, PostVote, Resub, User
+from repost.password import password_context
+
+# Tables in the order their rows are inserted, so that foreign keys
+# always refer to rows that are already inserted
+_models = (User, Resub, Post, Comment, PostVote, CommentVote)
+
+# Column of the item that a vote of each vote model is on
+_vote_items = {PostVote: 'post_id', CommentVote: 'comment_id'}
+
+# Number of paths of added comments that are kept to add replies with.
+# The paths of other parents are read from the database
+_path_cache_size = 100000
+
+# First and last ID of a range of rows
+IdRange = Tuple[int, int]
+
+
+def _column_defaults(model: Any, now: datetime) -> Dict[str, Any]:
+    """Values of the columns of the model that are not given.
+
+    Every row of an executemany must have the same columns, so columns
+    with defaults in the database are given explicitly.
+    """
+    defaults = {}
+    for column in model.__table__.columns:
+        if column.key == 'id':
+            continue
+
+        if column.default is not None and column.default.is_scalar:
+            defaults[column.key] = column.default.arg
+        elif column.server_default is not None:
+            defaults[column.key] = now
+        else:
+            defaults[column.key] = None
+
+    return defaults
+
+
+class BulkLoader:
+    """Inserts users, resubs, posts, comments and votes in batches.
+
+    Every user is given the same password, which is hashed only once.
+    Comments added with `add_comment` are given their path and depth.
+    Scores and ranks are inserted as given, so either give them or run
+    `recompute_scores` and `refresh_ranks` over `id_ranges` after
+    loading.
+    """
+
+    def __init__(self, db: Session, *, password: str, batch_size: int = 10000):
+        self.db = db
+        self.batch_size = batch_size
+        self.now = datetime.now(timezone.utc)
+        self.hashed_password = password_context.hash(password)
+
+        # Users and resubs are referred to by name in imported data
+        self.user_ids: Dict[str, int] = dict(db.query(User.username, User.id))
+        self.resub_ids: Dict[str, int] = dict(db.query(Resub.name, Resub.id))
+
+        # Number of inserted rows by table name
+        self.counts = Counter()
+
+        # Range of the IDs of the added rows by model, where the range of a
+        # vote model is of the IDs of the voted items
+        self.id_ranges: Dict[Any, IdRange] = {}
+
+        self._next_ids = {model: (db.query(func.max(model.id)).scalar() or 0) + 1
+                          for model in (User, Resub, Post, Comment)}
+        self._defaults = {model: _column_defaults(model, self.now) for model in _models}
+        self._rows: Dict[Any, List[Dict[str, Any]]] = {model: [] for model in _models}
+        self._pending = 0
+        self._paths: Dict[int, Tuple[str, int]] = OrderedDict()
+
+    def next_id(self, model: Any) -> int:
+        """Get the ID the next added row of the model is given."""
+        return self._next_ids[model]
+
+    def add(self, model: Any, **columns: Any) -> int:
+        """Add a row of the model, and get its ID.
+
+        Rows of models with an ID are given the next ID unless one is
+        given. Columns that are not given are set to their defaults.
+        """
+        row = {**self._defaults[model], **columns}
+        if model in self._next_ids:
+            if row.get('id') is None:
+                row['id'] = self._next_ids[model]
+            self._next_ids[model] = max(self._next_ids[model], row['id'] + 1)
+
+        row_id = row[_vote_items[model]] if model in _vote_items else row['id']
+        first_id, last_id = self.id_ranges.get(model, (row_id, row_id))
+        self.id_ranges[model] = (min(first_id, row_id), max(last_id, row_id))
+
+        self._rows[model].append(row)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+        return row.get('id')
+
+    def add_user(self, username: str, **columns: Any) -> int:
+        """Add a user with the loader's password, and get its ID."""
+        columns.setdefault('hashed_password', self.hashed_password)
+        user_id = self.user_ids[username] = self.add(User, username=username, **columns)
+        return user_id
+
+    def add_resub(self, name: str, **columns: Any) -> int:
+        """Add a resub, and get its ID."""
+        resub_id = self.resub_ids[name] = self.add(Resub, name=name, **columns)
+        return resub_id
+
+    def add_comment(self, *, parent_comment_id: int = None, **columns: Any) -> int:
+        """Add a comment with its path and depth below its parent comment,
+        and get its ID.
+
+        The parent comment must be added or inserted before the comment,
+        or KeyError is raised.
+        """
+        comment_id = self.next_id(Comment) if columns.get('id') is None else columns['id']
+        parent_path, parent_depth = self._comment_path(parent_comment_id)
+        path, depth = comment_path(comment_id, parent_path), parent_depth + 1
+        self.add(Comment, **{**columns, 'id': comment_id}, parent_comment_id=parent_comment_id, path=path,
+                 depth=depth)
+
+        self._paths[comment_id] = path, depth
+        if len(self._paths) > _path_cache_size:
+            self._paths.popitem(last=False)
+
+        return comment_id
+
+    def _comment_path(self, comment_id: int = None) -> Tuple[str, int]:
+        """Get the path and depth of a comment, or of the level above the top
+        level comments when no comment is given.
+        """
+        if comment_id is None:
+            return '', -1
+
+        if comment_id in self._paths:
+            self._paths.move_to_end(comment_id)
+            return self._paths[comment_id]
+
+        # The comment may be added but not inserted yet
+        self.flush()
+        row = self.db.query(Comment.path, Comment.depth).filter_by(id=comment_id).first()
+        if row is None:
+            raise KeyError('parent_comment_id')
+
+        path, depth = row
+        return path or '', depth
+
+    def flush(self):
+        """Insert and commit every added row."""
+        for model, rows in self._rows.items():
+            if rows:
+                self.db.execute(model.__table__.insert(), rows)
+                self.counts[model.__tablename__] += len(rows)
+                rows.clear()
+
+        self.db.commit()
+        self._pending = 0
+
+    def finish(self):
+        """Insert every remaining row, and continue the ID sequences after
+        the inserted IDs.
+        """
+        self.flush()
+
+        # PostgreSQL sequences are not advanced by explicit IDs, unlike
+        # SQLite, which continues after the largest ID
+        if self.db.bind.dialect.name == 'postgresql':
+            for model in self._next_ids:
+                table = model.__tablename__
+                self.db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                     f"(SELECT coalesce(max(id), 1) FROM {table}))"))
+            self.db.commit()
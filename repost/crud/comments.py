@@ -1,19 +1,135 @@
-from typing import List, Any
+from typing import List, Any, Optional, Tuple
 
+from sqlalchemy import and_, bindparam, case, func, null, or_, select
 from sqlalchemy.orm import Session
 
-from repost.models import Comment, CommentVote
+from repost.crud.pagination import Keyset, paginate
+from repost.crud.search import index_comments, unindex_comments
+from repost.crud.statements import chunk_size, keep_edited
+from repost.crud.votes import Votes, apply_score_changes, vote_buffer, write_votes
+from repost.models import Comment, CommentVote, Post, User
+from repost.records import CommentRecord, comment_records, visible_comments, visible_posts
 
 
-def get_comments(db: Session, post_id: int, offset: int = 0, limit: int = 100) -> List[Comment]:
-    """Get all comments in a post with the specified ID."""
-    return db.query(Comment).filter_by(parent_post_id=post_id).order_by(Comment.created.desc()).offset(offset).limit(
-        limit).all()
+def get_comments(db: Session, post_id: int, after: Keyset = None, offset: int = 0,
+                 limit: int = 100) -> List[CommentRecord]:
+    """Get records of all comments in a post with the specified ID."""
+    return paginate(comment_records(db.query(Comment).filter_by(parent_post_id=post_id)), Comment, Comment.created,
+                    after=after, offset=offset, limit=limit)
+
+
+def get_comments_by_ids(db: Session, *, comment_ids: List[int]) -> List[CommentRecord]:
+    """Get records of the comments with the given IDs in the same order.
+
+    Comments that do not exist are left out.
+    """
+    comments = {comment.id: comment
+                for comment in comment_records(db.query(Comment).filter(Comment.id.in_(comment_ids)))}
+    return [comments[comment_id] for comment_id in dict.fromkeys(comment_ids) if comment_id in comments]
 
 
 def get_comment(db: Session, comment_id: int) -> Comment:
-    """Get a comment with the the specified ID."""
-    return db.query(Comment).filter_by(id=comment_id).first()
+    """Get a comment with the the specified ID, unless its resub, its
+    author or the author of its post is deleted.
+    """
+    return visible_comments(db.query(Comment)).filter(Comment.id == comment_id).first()
+
+
+def get_comments_version(db: Session, *, post_id: int) -> Optional[int]:
+    """Get the version of the comments in a post, without loading them."""
+    return visible_posts(db.query(Post.comments_version)).filter(Post.id == post_id).scalar()
+
+
+def get_replies_version(db: Session, *, comment_id: int) -> Optional[int]:
+    """Get the version of the comments in the post of a comment."""
+    return visible_comments(db.query(Post.comments_version).select_from(Comment)).filter(
+        Comment.id == comment_id).scalar()
+
+
+def increment_comments_versions(db: Session, post_ids: Any):
+    """Increment the version of the comments in the posts with the given
+    IDs, or in the posts selected by a subquery of IDs.
+    """
+    db.query(Post).filter(Post.id.in_(post_ids)).update(
+        keep_edited(Post, {Post.comments_version: Post.comments_version + 1}), synchronize_session=False)
+
+
+def comment_path(comment_id: int, parent_path: str = '') -> str:
+    """Get the materialized path of a comment below the given parent path.
+
+    IDs are zero padded so that paths sort in the same order as the IDs.
+    """
+    return f'{parent_path}{comment_id:010d}/'
+
+
+# Length of the path of a top level comment, which every level of replies
+# adds to the path
+_path_segment_length = len(comment_path(0))
+
+
+def _subtree(path: str, include_root: bool = False) -> Tuple[Any, Any]:
+    """Get the conditions of the comments below the comment with the given
+    path, and optionally of the comment itself.
+
+    Every path below a path starts with it, and is less than the path with
+    its trailing '/' replaced by the next character.
+    """
+    return Comment.path >= path if include_root else Comment.path > path, Comment.path < path[:-1] + '0'
+
+
+def comment_tree_base_depth(parent: Optional[Comment]) -> int:
+    """Get the depth that levels of replies in a tree are counted from,
+    which is the depth of the parent comment, or of the top level comments
+    in a post.
+    """
+    return 0 if parent is None else parent.depth
+
+
+def get_comment_tree(db: Session, *, post_id: int, parent: Comment = None, depth: int, limit: int,
+                     offset: int = 0) -> List[Tuple[Comment, int]]:
+    """Get a page of the comments in a post, or of the replies to a parent
+    comment, with the given number of levels of replies below the top
+    level comments or the parent, and the number of replies to the parent
+    of every comment.
+
+    The `offset` and `limit` apply to the top level comments, and at most
+    `limit` replies to every comment are included. One more level of
+    replies is included, only to be counted. Comments are ordered by
+    path, so every comment comes after its parent and replies are ordered
+    by when they were created. Top level comments by deleted users are
+    left out, and replies by deleted users are included but not counted.
+    """
+    if parent is not None and parent.path is None:
+        return []
+
+    # The page of top level comments, which are the roots of the threads
+    top_depth = 0 if parent is None else parent.depth + 1
+    top_level = db.query(Comment.path).join(Comment.author).filter(
+        Comment.parent_post_id == post_id, Comment.depth == top_depth, User.deleted.is_(None))
+    if parent is not None:
+        top_level = top_level.filter(*_subtree(parent.path))
+    paths = [path for path, in top_level.order_by(Comment.path).offset(offset).limit(limit)]
+    if not paths:
+        return []
+
+    # The rank of a comment's ancestor at every level among the ancestor's
+    # siblings, from the paths of the ancestor and its parent, which are
+    # the prefixes of the comment's path. Comments above the level are
+    # ranked apart. The comments with an ancestor past the limit are left
+    # out without loading them
+    last_depth = comment_tree_base_depth(parent) + depth + 1
+    ranks = [func.dense_rank().over(
+        partition_by=[func.substr(Comment.path, 1, _path_segment_length * level), Comment.depth < level],
+        order_by=func.substr(Comment.path, 1, _path_segment_length * (level + 1)))
+        for level in range(top_depth + 1, last_depth + 1)]
+    replies = func.count(case([(User.deleted.is_(None), 1)])).over(partition_by=Comment.parent_comment_id)
+    ranked = select([Comment.id, replies.label('replies'), *(rank.label(f'rank_{i}') for i, rank in enumerate(ranks))],
+                    from_obj=Comment.__table__.join(User.__table__, Comment.author_id == User.id)).where(and_(
+        Comment.parent_post_id == post_id, Comment.depth <= last_depth,
+        or_(*(and_(*_subtree(path, include_root=True)) for path in paths)))).alias('ranked')
+
+    return db.query(Comment, ranked.c.replies).join(ranked, ranked.c.id == Comment.id).filter(
+        *(ranked.c[f'rank_{i}'] <= limit for i in range(len(ranks)))).order_by(Comment.path).all()
 
 
 def create_comment(db: Session, *, author_id: int, parent_post_id: int, parent_resub_id: int,
@@ -23,15 +139,52 @@ def create_comment(db: Session, *, author_id: int, parent_post_id: int, parent_r
                          parent_resub_id=parent_resub_id, content=content)
     db.add(db_comment)
 
+    # The path includes the comment's own ID, which is assigned on flush.
+    # Setting it is not an edit, like the updates of `keep_edited`
+    db.flush()
+    db_comment.edited = None
+    if parent_comment_id is None:
+        db_comment.path = comment_path(db_comment.id)
+    else:
+        parent_path, parent_depth = db.query(Comment.path, Comment.depth).filter_by(id=parent_comment_id).one()
+        db_comment.path = comment_path(db_comment.id, parent_path or '')
+        db_comment.depth = parent_depth + 1
+
+    index_comments(db, [db_comment.id])
+    increment_comments_versions(db, [parent_post_id])
     db.commit()
     db.refresh(db_comment)
     return db_comment
 
 
+def detach_replies(db: Session, *, comment_id: int, post_id: int, path: Optional[str], depth: int):
+    """Make the replies to a comment top level comments, and move the path
+    and depth of their threads to the top level, without committing.
+    """
+    replies = Comment.parent_comment_id == comment_id
+    if path is None:
+        db.query(Comment).filter(replies).update(keep_edited(Comment, {Comment.parent_comment_id: None}),
+                                                 synchronize_session=False)
+        return
+
+    # Paths below the comment start with its path, which is cut off
+    db.query(Comment).filter(Comment.parent_post_id == post_id, *_subtree(path)).update(keep_edited(Comment, {
+        Comment.parent_comment_id: case([(replies, null())], else_=Comment.parent_comment_id),
+        Comment.path: func.substr(Comment.path, len(path) + 1), Comment.depth: Comment.depth - depth - 1}),
+        synchronize_session=False)
+
+
 def delete_comment(db: Session, comment_id: int):
-    """Delete the comment with the given ID."""
-    db_comment = db.query(Comment).filter_by(id=comment_id).first()
-    db.delete(db_comment)
+    """Delete the comment with the given ID, and keep its replies as top
+    level comments.
+    """
+    post_id, path, depth = db.query(Comment.parent_post_id, Comment.path, Comment.depth).filter_by(
+        id=comment_id).one()
+    increment_comments_versions(db, [post_id])
+    detach_replies(db, comment_id=comment_id, post_id=post_id, path=path, depth=depth)
+    db.query(CommentVote).filter_by(comment_id=comment_id).delete(synchronize_session=False)
+    unindex_comments(db, [comment_id])
+    db.query(Comment).filter_by(id=comment_id).delete(synchronize_session=False)
     db.commit()
 
 
@@ -41,21 +194,84 @@ def update_comment(db: Session, comment_id: int, **columns: Any) -> Comment:
     Enter any `repost.models.Comment` column to update in `**columns`.
     """
     db.query(Comment).filter_by(id=comment_id).update(columns)
+    if 'content' in columns:
+        index_comments(db, [comment_id])
+    increment_comments_versions(db, select([Comment.parent_post_id]).where(Comment.id == comment_id))
     db.commit()
 
     return get_comment(db, comment_id=comment_id)
 
 
-def vote_comment(db: Session, *, comment_id: int, author_id: int, vote: int):
-    """Update a user's vote on a comment."""
-    db_vote = db.query(CommentVote).filter_by(comment_id=comment_id, author_id=author_id).first()
-    if db_vote:
-        if vote == 0:
-            db.delete(db_vote)
-        else:
-            db_vote.vote = vote
-    elif vote != 0:
-        db.add(CommentVote(comment_id=comment_id, author_id=author_id, vote=vote))
+def rebuild_comment_paths(db: Session, batch_size: int = 1000):
+    """Rebuild the path and depth of every comment from its parent comment,
+    in batches of comments ordered by post.
+
+    Used to backfill the path column of existing comments.
+    """
+    statement = Comment.__table__.update().where(Comment.id == bindparam('comment_id')).values(
+        keep_edited(Comment, {'path': bindparam('path'), 'depth': bindparam('depth')}))
+
+    # Paths of the comments in the current post
+    paths = {}
+    post_id, comment_id = 0, 0
+    while True:
+        after = or_(Comment.parent_post_id > post_id, and_(Comment.parent_post_id == post_id, Comment.id > comment_id))
+        comments = db.query(Comment.id, Comment.parent_post_id, Comment.parent_comment_id).filter(after).order_by(
+            Comment.parent_post_id, Comment.id).limit(batch_size).all()
+        if not comments:
+            break
+
+        updates = []
+        for comment_id, parent_post_id, parent_comment_id in comments:
+            if parent_post_id != post_id:
+                paths.clear()
+                post_id = parent_post_id
+
+            # Replies are always created after their parent, so the parent's
+            # path is known by the time a reply is reached
+            parent_path, parent_depth = paths.get(parent_comment_id, ('', -1))
+            path, depth = comment_path(comment_id, parent_path), parent_depth + 1
+            paths[comment_id] = path, depth
+            updates.append({'comment_id': comment_id, 'path': path, 'depth': depth})
 
+        db.execute(statement, updates)
+        db.commit()
+
+
+def write_comment_votes(db: Session, votes: Votes) -> List[str]:
+    """Write votes keyed by (comment ID, author ID) without committing.
+
+    The scores of the comments are adjusted in the same transaction.
+    Returns the cache tags to invalidate after committing.
+    """
+    changes = write_votes(db, Comment, CommentVote, CommentVote.comment_id, votes, visible=visible_comments)
+    apply_score_changes(db, Comment, changes)
+
+    # Increment the version of every post with a changed score at once
+    comment_ids = list(changes)
+    for i in range(0, len(comment_ids), chunk_size):
+        increment_comments_versions(db, select([Comment.parent_post_id]).where(
+            Comment.id.in_(comment_ids[i:i + chunk_size])))
+
+    # No cached responses include comments
+    return []
+
+
+def vote_comments(db: Session, votes: Votes):
+    """Write votes keyed by (comment ID, author ID) in one transaction."""
+    write_comment_votes(db, votes)
     db.commit()
-    return db.query(Comment).filter_by(id=comment_id).first()
+
+
+def vote_comment(db: Session, *, comment_id: int, author_id: int, vote: int) -> Comment:
+    """Update a user's vote on a comment.
+
+    With write-behind enabled, the vote is buffered and the returned
+    comment does not include it yet.
+    """
+    if vote_buffer is not None:
+        vote_buffer.add(vote_comments, comment_id, author_id, vote)
+    else:
+        vote_comments(db, {(comment_id, author_id): vote})
+
+    return get_comment(db, comment_id=comment_id)
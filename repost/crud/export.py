@@ -0,0 +1,59 @@
+"""Exporting every post and comment of a resub or a user.
+
+Exports are read in batches with `yield_per`, which also streams the rows
+with a server-side cursor on drivers that support one (e.g. psycopg2), so
+memory use does not grow with the size of the export. Items are exported
+by type and then by ID, so an export can be resumed after any item.
+"""
+
+from typing import Any, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Query, Session
+
+from repost.models import Comment, Post
+from repost.records import comment_records, post_records
+
+# Position in an export as the (type, ID) of the last exported item
+ExportCursor = Tuple[str, int]
+
+# Types of exported items in the order they are exported
+export_types = ('post', 'comment')
+
+# Number of rows fetched from the database at once
+_batch_size = 500
+
+
+def _export(sections: List[Tuple[str, Any, Query]], after: Optional[ExportCursor]) -> Iterator[Tuple[str, Any]]:
+    """Export the records of every (type, model, query) section after the
+    cursor.
+    """
+    start = 0
+    if after is not None:
+        start = [item_type for item_type, _, _ in sections].index(after[0])
+
+    for item_type, model, query in sections[start:]:
+        if after is not None and item_type == after[0]:
+            query = query.filter(model.id > after[1])
+
+        for record in query.order_by(model.id).yield_per(_batch_size):
+            yield item_type, record
+
+
+def export_resub(db: Session, *, resub_id: int, after: ExportCursor = None) -> Iterator[Tuple[str, Any]]:
+    """Export records of every post and comment in a resub as (type,
+    record) pairs.
+    """
+    return _export([
+        ('post', Post, post_records(db.query(Post).filter(Post.parent_resub_id == resub_id))),
+        ('comment', Comment, comment_records(db.query(Comment).filter(Comment.parent_resub_id == resub_id))),
+    ], after)
+
+
+def export_user(db: Session, *, user_id: int, after: ExportCursor = None) -> Iterator[Tuple[str, Any]]:
+    """Export records of every post and comment by a user as (type,
+    record) pairs.
+    """
+    return _export([
+        ('post', Post, post_records(db.query(Post).filter(Post.author_id == user_id))),
+        ('comment', Comment, comment_records(db.query(Comment).filter(Comment.author_id == user_id))),
+    ], after)
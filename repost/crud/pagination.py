@@ -0,0 +1,28 @@
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, func, literal, or_, select
+from sqlalchemy.orm import Query, aliased
+
+Keyset = Tuple[Any, int]
+
+
+def paginate(query: Query, model: Any, column: Any, *, after: Optional[Keyset] = None, offset: int = 0,
+             limit: int = 100) -> List[Any]:
+    """Get a page of the query ordered by the column and ID descending.
+
+    When `after` is given, the page starts after the item with the given
+    (column value, ID) keyset instead of skipping `offset` rows.
+    """
+    if after is not None:
+        value, item_id = after
+
+        # Compare with the stored value of the keyset item, since the value
+        # in the keyset may be formatted differently than the database
+        # stores it (e.g. datetimes in SQLite). The value is only used when
+        # the item no longer exists.
+        previous = aliased(model)
+        anchor = func.coalesce(select([getattr(previous, column.key)]).where(previous.id == item_id).as_scalar(),
+                               literal(value))
+        query = query.filter(or_(column < anchor, and_(column == anchor, model.id < item_id)))
+
+    return query.order_by(column.desc(), model.id.desc()).offset(offset).limit(limit).all()
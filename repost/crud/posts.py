@@ -1,29 +1,80 @@
-from typing import Optional, Any, List
+from datetime import datetime, timezone
+from typing import Optional, Any, List, Tuple
 
 from sqlalchemy.orm import Session
 
-from repost.models import Post, PostVote
+from repost.cache import invalidate
+from repost.crud.pagination import Keyset, paginate
+from repost.crud.ranking import hot_rank, rising_window, update_ranks
+from repost.crud.search import index_posts, unindex_posts
+from repost.crud.votes import Votes, apply_score_changes, vote_buffer, write_votes
+from repost.models import Post, PostVote, Resub
+from repost.records import PostRecord, post_records, visible_posts
+
+# Column that posts are ordered by for every sort
+post_sort_columns = {
+    'new': Post.created,
+    'hot': Post.hot_rank,
+    'top': Post.score,
+    'rising': Post.rising_rank,
+}
+
+
+def get_posts(db: Session, *, parent_resub_id: int, sort: str = 'new', since: datetime = None,
+              after: Keyset = None, offset: int = 0, limit: int = 100) -> List[PostRecord]:
+    """Get records of all posts in a resub.
+
+    Posts are sorted by one of the columns in `post_sort_columns`, and
+    can be limited to posts created since the given time. Rising posts
+    are always limited to the rising window.
+    """
+    if sort == 'rising':
+        rising_since = datetime.now(timezone.utc) - rising_window
+        since = max(since, rising_since) if since else rising_since
+
+    query = db.query(Post).filter_by(parent_resub_id=parent_resub_id)
+    if since is not None:
+        query = query.filter(Post.created >= since)
+
+    return paginate(post_records(query), Post, post_sort_columns[sort], after=after, offset=offset, limit=limit)
 
 
-def get_posts(db: Session, *, parent_resub_id: int, offset: int = 0, limit: int = 100) -> List[Post]:
-    """Get all posts in a resub."""
-    return db.query(Post).filter_by(parent_resub_id=parent_resub_id).order_by(Post.created.desc()).offset(offset).limit(
-        limit).all()
+def get_posts_by_ids(db: Session, *, post_ids: List[int]) -> List[PostRecord]:
+    """Get records of the posts with the given IDs in the same order.
+
+    Posts that do not exist are left out.
+    """
+    posts = {post.id: post for post in post_records(db.query(Post).filter(Post.id.in_(post_ids)))}
+    return [posts[post_id] for post_id in dict.fromkeys(post_ids) if post_id in posts]
 
 
 def get_post(db: Session, *, post_id: int) -> Optional[Post]:
-    """Get the post with the given ID."""
-    return db.query(Post).filter_by(id=post_id).first()
+    """Get the post with the given ID, unless its resub or author is
+    deleted.
+    """
+    return visible_posts(db.query(Post)).filter(Post.id == post_id).first()
+
+
+def get_post_version(db: Session, *, post_id: int) -> Optional[Tuple]:
+    """Get the columns that change whenever the post changes, without
+    loading the post.
+    """
+    return visible_posts(db.query(Post.created, Post.edited, Post.upvotes, Post.downvotes)).filter(
+        Post.id == post_id).first()
 
 
 def create_post(db: Session, *, author_id: int, parent_resub_id: int, title: str, url: str = None,
                 content: str = None) -> Post:
     """Create a new post with the specified owner."""
-    db_post = Post(author_id=author_id, parent_resub_id=parent_resub_id, title=title, url=url, content=content)
+    db_post = Post(author_id=author_id, parent_resub_id=parent_resub_id, title=title, url=url, content=content,
+                   hot_rank=hot_rank(0, datetime.now(timezone.utc)))
     db.add(db_post)
+    db.flush()
+    index_posts(db, [db_post.id])
 
     db.commit()
     db.refresh(db_post)
+    invalidate(f'resub-posts:{db_post.parent_resub.name}')
     return db_post
 
 
@@ -33,28 +84,59 @@ def update_post(db: Session, *, post_id: int, **columns: Any) -> Post:
     Enter any `repost.models.Post` column to update in `**columns`.
     """
     db.query(Post).filter_by(id=post_id).update(columns)
+    if columns.keys() & {'title', 'content'}:
+        index_posts(db, [post_id])
     db.commit()
 
-    return get_post(db, post_id=post_id)
+    db_post = get_post(db, post_id=post_id)
+    invalidate(f'post:{post_id}', f'resub-posts:{db_post.parent_resub.name}')
+    return db_post
 
 
 def delete_post(db: Session, *, post_id: int):
     """Delete the post with the given ID."""
     db_post = db.query(Post).filter_by(id=post_id).first()
+    resub_name = db_post.parent_resub.name
     db.delete(db_post)
+    unindex_posts(db, [post_id])
     db.commit()
+    invalidate(f'post:{post_id}', f'resub-posts:{resub_name}')
 
 
-def vote_post(db: Session, *, post_id: int, author_id: int, vote: int):
-    """Update a user's vote on a post."""
-    db_vote = db.query(PostVote).filter_by(post_id=post_id, author_id=author_id).first()
-    if db_vote:
-        if vote == 0:
-            db.delete(db_vote)
-        else:
-            db_vote.vote = vote
-    elif vote != 0:
-        db.add(PostVote(post_id=post_id, author_id=author_id, vote=vote))
+def write_post_votes(db: Session, votes: Votes) -> List[str]:
+    """Write votes keyed by (post ID, author ID) without committing.
 
+    The scores and ranks of the posts are adjusted in the same
+    transaction. Returns the cache tags to invalidate after committing.
+    """
+    changes = write_votes(db, Post, PostVote, PostVote.post_id, votes, visible=visible_posts)
+    apply_score_changes(db, Post, changes)
+    if not changes:
+        return []
+
+    posts = db.query(Post.id, Post.score, Post.created, Resub.name).join(Post.parent_resub).filter(
+        Post.id.in_(list(changes))).all()
+    update_ranks(db, [(post_id, score, created) for post_id, score, created, _ in posts])
+
+    return [tag for post_id, _, _, resub_name in posts for tag in (f'post:{post_id}', f'resub-posts:{resub_name}')]
+
+
+def vote_posts(db: Session, votes: Votes):
+    """Write votes keyed by (post ID, author ID) in one transaction."""
+    tags = write_post_votes(db, votes)
     db.commit()
-    return db.query(Post).filter_by(id=post_id).first()
+    invalidate(*tags)
+
+
+def vote_post(db: Session, *, post_id: int, author_id: int, vote: int) -> Post:
+    """Update a user's vote on a post.
+
+    With write-behind enabled, the vote is buffered and the returned
+    post does not include it yet.
+    """
+    if vote_buffer is not None:
+        vote_buffer.add(vote_posts, post_id, author_id, vote)
+    else:
+        vote_posts(db, {(post_id, author_id): vote})
+
+    return get_post(db, post_id=post_id)
@@ -0,0 +1,196 @@
+"""Purging the rows of deleted resubs and users.
+
+Deleting a resub or a user only marks it as deleted, which hides it,
+and everything in the resub or by the user, at once. A purge job then
+removes the rows in chunks of short transactions, so that a large resub
+never holds locks for long, and the job's stage keeps its progress
+across restarts. `repost.tasks` runs `purge_deleted` periodically.
+
+Every stage deletes the children of its rows before the rows, so that
+no foreign key is left dangling, and comments are deleted newest first
+so that replies go before their parents. Replies by others to purged
+comments are kept and detached, like replies to a deleted comment.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Tuple
+
+from sqlalchemy import literal, or_, select
+from sqlalchemy.orm import Session
+
+from repost import config
+from repost.crud.comments import detach_replies, increment_comments_versions
+from repost.crud.search import unindex_comments, unindex_posts
+from repost.crud.statements import chunk_size
+from repost.crud.votes import apply_score_changes
+from repost.models import Comment, CommentVote, Post, PostVote, PurgeJob, Resub, User
+
+# How long a worker holds a job between chunks before another worker may
+# take the job over
+_lease = timedelta(minutes=5)
+
+
+def enqueue_purge(db: Session, target: str, model: Any, condition: Any):
+    """Add a purge job for every row of the target's model that matches the
+    condition, without committing.
+    """
+    db.execute(PurgeJob.__table__.insert().from_select(
+        ['target', 'target_id', 'stage'],
+        select([literal(target), model.id, literal(purge_stages[target][0])]).where(condition)))
+
+
+def _purge_comments(db: Session, condition: Any, batch_size: int) -> int:
+    """Delete a chunk of the comments matching the condition with their
+    votes, and get the number of deleted rows.
+    """
+    rows = db.query(Comment.id, Comment.parent_post_id, Comment.path, Comment.depth).filter(condition).order_by(
+        Comment.id.desc()).limit(batch_size).all()
+    if not rows:
+        return 0
+
+    comment_ids = [row.id for row in rows]
+    deleted = db.query(CommentVote).filter(CommentVote.comment_id.in_(comment_ids)).delete(
+        synchronize_session=False)
+
+    # Replies are newer than their parents, so the threads of the replies
+    # are moved before the paths of their parents change
+    parents = {parent_id for parent_id, in db.query(Comment.parent_comment_id).filter(
+        Comment.parent_comment_id.in_(comment_ids), Comment.id.notin_(comment_ids)).distinct()}
+    for row in rows:
+        if row.id in parents:
+            detach_replies(db, comment_id=row.id, post_id=row.parent_post_id, path=row.path, depth=row.depth)
+
+    unindex_comments(db, comment_ids)
+    deleted += db.query(Comment).filter(Comment.id.in_(comment_ids)).delete(synchronize_session=False)
+    increment_comments_versions(db, {row.parent_post_id for row in rows})
+    return deleted
+
+
+def _purge_posts(db: Session, condition: Any, batch_size: int) -> int:
+    """Delete a chunk of the posts matching the condition with their
+    votes, and get the number of deleted rows.
+
+    The comments of the posts must already be deleted.
+    """
+    post_ids = [post_id for post_id, in db.query(Post.id).filter(condition).order_by(Post.id.desc()).limit(
+        batch_size)]
+    if not post_ids:
+        return 0
+
+    deleted = db.query(PostVote).filter(PostVote.post_id.in_(post_ids)).delete(synchronize_session=False)
+    unindex_posts(db, post_ids)
+    deleted += db.query(Post).filter(Post.id.in_(post_ids)).delete(synchronize_session=False)
+    return deleted
+
+
+def _purge_votes(db: Session, model: Any, vote_model: Any, item_column: Any, user_id: int, batch_size: int) -> int:
+    """Delete a chunk of a user's votes on items of the model, and take
+    them out of the scores of the items.
+    """
+    votes = db.query(item_column, vote_model.vote).filter(vote_model.author_id == user_id).limit(batch_size).all()
+    if not votes:
+        return 0
+
+    changes = {item_id: (-vote, -(vote > 0), -(vote < 0)) for item_id, vote in votes}
+    apply_score_changes(db, model, {item_id: change for item_id, change in changes.items() if any(change)})
+    return db.query(vote_model).filter(vote_model.author_id == user_id, item_column.in_(list(changes))).delete(
+        synchronize_session=False)
+
+
+def _user_posts(user_id: int) -> Any:
+    return select([Post.id]).where(Post.author_id == user_id)
+
+
+def _delete_resub(db: Session, resub_id: int) -> bool:
+    db.query(Resub).filter_by(id=resub_id).delete(synchronize_session=False)
+    return True
+
+
+def _delete_user(db: Session, user_id: int) -> bool:
+    # The user's resubs are purged by their own jobs, and are waited for
+    if db.query(Resub.id).filter_by(owner_id=user_id).first() is not None:
+        return False
+
+    # The username is taken until the identities of the user cached by
+    # every worker expire, so that no identity outlives its user
+    cached_since = datetime.now(timezone.utc) - timedelta(seconds=config.auth_cache_ttl)
+    if db.query(User.id).filter(User.id == user_id, User.deleted > cached_since).first() is not None:
+        return False
+
+    db.query(User).filter_by(id=user_id).delete(synchronize_session=False)
+    return True
+
+
+# Stages of each target in order. Every stage but the last deletes chunks
+# of rows with its function, which is given the target ID and batch size
+purge_stages: Dict[str, Tuple[str, ...]] = {
+    'resub': ('comments', 'posts', 'resub'),
+    'user': ('comments', 'posts', 'post_votes', 'comment_votes', 'user'),
+}
+_purge_chunk: Dict[Tuple[str, str], Callable[[Session, int, int], int]] = {
+    ('resub', 'comments'): lambda db, resub_id, n: _purge_comments(db, Comment.parent_resub_id == resub_id, n),
+    ('resub', 'posts'): lambda db, resub_id, n: _purge_posts(db, Post.parent_resub_id == resub_id, n),
+    ('user', 'comments'): lambda db, user_id, n: _purge_comments(
+        db, or_(Comment.author_id == user_id, Comment.parent_post_id.in_(_user_posts(user_id))), n),
+    ('user', 'posts'): lambda db, user_id, n: _purge_posts(db, Post.author_id == user_id, n),
+    ('user', 'post_votes'): lambda db, user_id, n: _purge_votes(db, Post, PostVote, PostVote.post_id, user_id, n),
+    ('user', 'comment_votes'): lambda db, user_id, n: _purge_votes(
+        db, Comment, CommentVote, CommentVote.comment_id, user_id, n),
+}
+
+# Function that deletes the target row in the last stage, or gets False
+# when the row cannot be deleted yet
+_delete_target: Dict[str, Callable[[Session, int], bool]] = {
+    'resub': _delete_resub,
+    'user': _delete_user,
+}
+
+
+def _claim(db: Session, job_id: int) -> bool:
+    """Take the lease on the job, unless another worker holds it."""
+    now = datetime.now(timezone.utc)
+    claimed = db.query(PurgeJob).filter(PurgeJob.id == job_id, or_(
+        PurgeJob.locked_until.is_(None), PurgeJob.locked_until < now)).update(
+        {PurgeJob.locked_until: now + _lease}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def _run_job(db: Session, job_id: int, batch_size: int) -> int:
+    """Run the stages of a claimed job, one chunk per transaction, and get
+    the number of deleted rows.
+    """
+    job = db.query(PurgeJob).filter_by(id=job_id).one()
+    stages = purge_stages[job.target]
+    deleted = 0
+    while job.stage != stages[-1]:
+        chunk = _purge_chunk[job.target, job.stage](db, job.target_id, batch_size)
+        if chunk:
+            job.deleted_rows += chunk
+            deleted += chunk
+        else:
+            job.stage = stages[stages.index(job.stage) + 1]
+
+        job.locked_until = datetime.now(timezone.utc) + _lease
+        db.commit()
+
+    if _delete_target[job.target](db, job.target_id):
+        db.delete(job)
+        deleted += 1
+    else:
+        job.locked_until = None
+
+    db.commit()
+    return deleted
+
+
+def purge_deleted(db: Session, batch_size: int = chunk_size) -> int:
+    """Run every purge job that no other worker is running, oldest first,
+    and get the number of deleted rows.
+    """
+    deleted = 0
+    for job_id, in db.query(PurgeJob.id).order_by(PurgeJob.id).all():
+        if _claim(db, job_id):
+            deleted += _run_job(db, job_id, batch_size)
+
+    return deleted
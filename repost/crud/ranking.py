@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+from math import log10
+from typing import Iterable, Tuple
+
+from sqlalchemy import and_, bindparam
+from sqlalchemy.orm import Session
+
+from repost.crud.statements import keep_edited
+from repost.models import Post
+
+# Posts are only ranked as rising while they are this new
+rising_window = timedelta(days=1)
+
+_epoch = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def _utc(time: datetime) -> datetime:
+    """Timezone aware time, where naive times are in UTC (e.g. from SQLite)."""
+    return time if time.tzinfo else time.replace(tzinfo=timezone.utc)
+
+
+def hot_rank(score: int, created: datetime) -> float:
+    """Rank of a post by score and age.
+
+    A post created 12.5 hours later ranks the same as one with ten times
+    the score. The rank does not change over time, so it only needs to
+    be updated when the score changes.
+    """
+    sign = (score > 0) - (score < 0)
+    return sign * log10(max(abs(score), 1)) + (_utc(created) - _epoch).total_seconds() / 45000
+
+
+def rising_rank(score: int, created: datetime, now: datetime = None) -> float:
+    """Rank of a new post by score, decaying with age.
+
+    The rank changes over time, so it is refreshed periodically by
+    `refresh_ranks`.
+    """
+    hours = max(((now or datetime.now(timezone.utc)) - _utc(created)).total_seconds() / 3600, 0)
+    return score / (hours + 2) ** 1.5
+
+
+def update_ranks(db: Session, posts: Iterable[Tuple[int, int, datetime]], now: datetime = None):
+    """Update the ranks of posts from their (ID, score, created) rows.
+
+    A post is only updated while it still has the score it was ranked by.
+    A vote since the score was read updates the ranks itself, so they are
+    not overwritten with ranks of the older score.
+    """
+    now = now or datetime.now(timezone.utc)
+    updates = [{'post_id': post_id, 'ranked_score': score, 'hot_rank': hot_rank(score, created),
+                'rising_rank': rising_rank(score, created, now)} for post_id, score, created in posts]
+    if not updates:
+        return
+
+    statement = Post.__table__.update().where(and_(
+        Post.id == bindparam('post_id'), Post.score == bindparam('ranked_score'))).values(keep_edited(Post, {
+            'hot_rank': bindparam('hot_rank'), 'rising_rank': bindparam('rising_rank')}))
+    db.execute(statement, updates)
+
+
+def refresh_ranks(db: Session, *, since: datetime = None, id_range: Tuple[int, int] = None, batch_size: int = 1000):
+    """Recompute the ranks of every post created since the given time, or
+    with an ID in the given range, in batches of posts.
+
+    Posts older than the rising window are not listed as rising, so the
+    ranks only need to be refreshed within the window to account for
+    decay. Refresh every post to backfill or repair the ranks. Posts
+    voted on between reading a batch and writing it keep the ranks of the
+    vote.
+    """
+    query = db.query(Post.id, Post.score, Post.created)
+    if since is not None:
+        query = query.filter(Post.created >= since)
+    if id_range is not None:
+        query = query.filter(Post.id.between(*id_range))
+
+    now = datetime.now(timezone.utc)
+    last_id = 0
+    while True:
+        posts = query.filter(Post.id > last_id).order_by(Post.id).limit(batch_size).all()
+        if not posts:
+            break
+
+        update_ranks(db, posts, now)
+        db.commit()
+        last_id = posts[-1].id
+
+
+def refresh_rising_ranks(db: Session):
+    """Recompute the ranks of posts within the rising window."""
+    refresh_ranks(db, since=datetime.now(timezone.utc) - rising_window)
@@ -1,18 +1,32 @@
 from typing import Any, List, Optional
 
+from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
 
+from repost.cache import deletions_tag, invalidate
+from repost.crud.pagination import Keyset, paginate
+from repost.crud.purge import enqueue_purge
+from repost.crud.statements import keep_edited
 from repost.models import Resub
+from repost.records import ResubRecord, resub_records
 
 
-def get_resubs(db: Session, offset: int = 0, limit: int = 100) -> List[Resub]:
-    """Get all resubs."""
-    return db.query(Resub).order_by(Resub.created.desc()).offset(offset).limit(limit).all()
+def get_resubs(db: Session, after: Keyset = None, offset: int = 0, limit: int = 100) -> List[ResubRecord]:
+    """Get records of all resubs."""
+    return paginate(resub_records(db.query(Resub)), Resub, Resub.created, after=after, offset=offset, limit=limit)
 
 
-def get_resub(db: Session, *, name: str) -> Optional[Resub]:
-    """Get the resub with the given name."""
-    return db.query(Resub).filter(Resub.name == name).first()
+def get_resub(db: Session, *, name: str, include_deleted: bool = False) -> Optional[Resub]:
+    """Get the resub with the given name.
+
+    A deleted resub keeps its name until it is purged, and is only
+    included when `include_deleted` is set.
+    """
+    query = db.query(Resub).filter(Resub.name == name)
+    if not include_deleted:
+        query = query.filter(Resub.deleted.is_(None))
+
+    return query.first()
 
 
 def create_resub(db: Session, *, owner_id: int, name: str, description: str) -> Resub:
@@ -22,6 +36,7 @@ def create_resub(db: Session, *, owner_id: int, name: str, description: str) ->
 
     db.commit()
     db.refresh(db_resub)
+    invalidate(f'resub:{name}')
     return db_resub
 
 
@@ -32,11 +47,22 @@ def update_resub(db: Session, *, name: str, **columns: Any) -> Resub:
     """
     db.query(Resub).filter(Resub.name == name).update(columns)
     db.commit()
+    invalidate(f'resub:{name}')
 
     return get_resub(db, name=name)
 
 
 def delete_resub(db: Session, *, name: str):
-    """Delete the resub with the given name."""
-    db.query(Resub).filter(Resub.name == name).delete()
+    """Delete the resub with the given name.
+
+    The resub is hidden at once, and its posts and comments are purged in
+    the background by `repost.crud.purge_deleted`. Every comment in the
+    resub is in one of its posts, which are hidden with their comments, so
+    no comments version is incremented.
+    """
+    resub = and_(Resub.name == name, Resub.deleted.is_(None))
+    enqueue_purge(db, 'resub', Resub, resub)
+
+    db.query(Resub).filter(resub).update(keep_edited(Resub, {Resub.deleted: func.now()}), synchronize_session=False)
     db.commit()
+    invalidate(f'resub:{name}', deletions_tag)
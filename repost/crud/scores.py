@@ -0,0 +1,39 @@
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import func, select, and_
+from sqlalchemy.orm import Session
+
+from repost.crud.statements import keep_edited
+from repost.models import Post, PostVote, Comment, CommentVote
+
+
+def _recompute(db: Session, model: Any, vote_model: Any, item_id: Any, id_range: Tuple[int, int], batch_size: int):
+    """Recompute the score columns of the rows in `model` within the ID
+    range from `vote_model`, committing every batch of IDs.
+    """
+
+    def total(column, *conditions):
+        return select([func.coalesce(column, 0)]).where(and_(item_id == model.id, *conditions)).as_scalar()
+
+    first_id, last_id = id_range
+    for batch_id in range(first_id, last_id + 1, batch_size):
+        db.query(model).filter(model.id.between(batch_id, min(batch_id + batch_size - 1, last_id))).update(
+            keep_edited(model, {model.score: total(func.sum(vote_model.vote)),
+                                model.upvotes: total(func.count(), vote_model.vote > 0),
+                                model.downvotes: total(func.count(), vote_model.vote < 0)}),
+            synchronize_session=False)
+        db.commit()
+
+
+def recompute_scores(db: Session, *, id_ranges: Dict[Any, Tuple[int, int]] = None, batch_size: int = 10000):
+    """Recompute the score of posts and comments from their votes.
+
+    Only the posts and comments in the given ID ranges of `Post` and
+    `Comment` are recomputed, or every post and comment by default. Used
+    to backfill the score columns and to repair any drift.
+    """
+    for model, vote_model, item_id in ((Post, PostVote, PostVote.post_id),
+                                       (Comment, CommentVote, CommentVote.comment_id)):
+        id_range = (1, db.query(func.max(model.id)).scalar() or 0) if id_ranges is None else id_ranges.get(model)
+        if id_range is not None:
+            _recompute(db, model, vote_model, item_id, id_range, batch_size)
@@ -0,0 +1,164 @@
+"""Full-text search of posts and comments.
+
+The crud functions that write posts and comments update the index in
+`repost.models.search` in the same transaction. Data inserted in bulk
+is indexed with `rebuild_search_index`.
+
+Results are ranked by relevance, with BM25 on SQLite and `ts_rank` on
+PostgreSQL, and paginated by (rank, ID) keysets. Ranks depend on the
+rest of the index, so an item whose rank changed between two pages may
+be skipped or repeated.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Float, and_, cast, func, literal_column, or_, select, text
+from sqlalchemy.orm import Query, Session
+
+from repost.crud.pagination import Keyset
+from repost.models import Comment, Post, Resub, comments_search, posts_search, text_search_config
+from repost.records import CommentRecord, PostRecord, comment_records, post_records
+
+# Words of a query, which are quoted for SQLite so that the FTS5 query
+# syntax is not used
+_word_pattern = re.compile(r'\w+')
+
+# Weight of title matches relative to content matches in SQLite ranks
+_title_weight = 2.0
+
+
+def supports_search(db: Session) -> bool:
+    """Whether the database has a search index."""
+    return db.bind.dialect.name in ('sqlite', 'postgresql')
+
+
+def _index(db: Session, model: Any, condition: Any):
+    """Index the items of the model that match the condition."""
+    dialect = db.bind.dialect.name
+    if dialect == 'sqlite':
+        if model is Post:
+            columns = [Post.id, Post.title, func.coalesce(Post.content, '')]
+            index = posts_search
+        else:
+            columns = [Comment.id, func.coalesce(Comment.content, '')]
+            index = comments_search
+
+        db.execute(index.insert().prefix_with('OR REPLACE').from_select(
+            [column.key for column in index.columns], select(columns).where(condition)))
+    elif dialect == 'postgresql':
+        if model is Post:
+            document = (f"setweight(to_tsvector('{text_search_config}', coalesce(title, '')), 'A') || "
+                        f"setweight(to_tsvector('{text_search_config}', coalesce(content, '')), 'B')")
+        else:
+            document = f"to_tsvector('{text_search_config}', coalesce(content, ''))"
+
+        # The column is not mapped, so the update is textual, which never
+        # sets edited by onupdate
+        condition = condition.compile(dialect=db.bind.dialect, compile_kwargs={'literal_binds': True})
+        db.execute(text(f'UPDATE {model.__tablename__} SET search_vector = {document} WHERE {condition}'))
+
+
+def index_posts(db: Session, post_ids: Iterable[int]):
+    """Index the title and content of the posts without committing."""
+    _index(db, Post, Post.id.in_(list(post_ids)))
+
+
+def index_comments(db: Session, comment_ids: Iterable[int]):
+    """Index the content of the comments without committing."""
+    _index(db, Comment, Comment.id.in_(list(comment_ids)))
+
+
+def unindex_posts(db: Session, post_ids: Iterable[int]):
+    """Remove the posts from the index without committing.
+
+    Only SQLite keeps the index apart from the posts.
+    """
+    if db.bind.dialect.name == 'sqlite':
+        db.execute(posts_search.delete().where(posts_search.c.rowid.in_(list(post_ids))))
+
+
+def unindex_comments(db: Session, comment_ids: Iterable[int]):
+    """Remove the comments from the index without committing.
+
+    Only SQLite keeps the index apart from the comments.
+    """
+    if db.bind.dialect.name == 'sqlite':
+        db.execute(comments_search.delete().where(comments_search.c.rowid.in_(list(comment_ids))))
+
+
+def rebuild_search_index(db: Session, *, id_ranges: Dict[Any, Tuple[int, int]] = None, batch_size: int = 10000):
+    """Index posts and comments, in batches of ID ranges.
+
+    Only the posts and comments in the given ID ranges of `Post` and
+    `Comment` are indexed, or every post and comment by default, which
+    rebuilds the index. Used to index existing and bulk inserted posts
+    and comments.
+    """
+    if id_ranges is None:
+        if db.bind.dialect.name == 'sqlite':
+            db.execute(posts_search.delete())
+            db.execute(comments_search.delete())
+
+        id_ranges = {model: (1, db.query(func.max(model.id)).scalar() or 0) for model in (Post, Comment)}
+
+    for model in (Post, Comment):
+        if model not in id_ranges:
+            continue
+
+        first_id, last_id = id_ranges[model]
+        for batch_id in range(first_id, last_id + 1, batch_size):
+            _index(db, model, model.id.between(batch_id, min(batch_id + batch_size - 1, last_id)))
+            db.commit()
+
+    db.commit()
+
+
+def _search(db: Session, model: Any, records: Query, *, query: str, resub_name: Optional[str],
+            after: Optional[Keyset], offset: int, limit: int) -> List[Tuple[Any, float]]:
+    dialect = db.bind.dialect.name
+    if dialect == 'sqlite':
+        words = _word_pattern.findall(query)
+        if not words:
+            return []
+
+        index = posts_search if model is Post else comments_search
+        weights = (_title_weight, 1.0) if model is Post else ()
+        # BM25 is lower for better matches
+        rank = -func.bm25(literal_column(index.name), *weights)
+        records = records.join(index, index.c.rowid == model.id).filter(
+            literal_column(index.name).op('MATCH')(' '.join(f'"{word}"' for word in words)))
+    else:
+        tsquery = func.plainto_tsquery(text_search_config, query)
+        vector = literal_column(f'{model.__tablename__}.search_vector')
+        # ts_rank is a real, which is cast so that ranks in keysets are
+        # compared exactly
+        rank = cast(func.ts_rank(vector, tsquery), Float(precision=53))
+        records = records.filter(vector.op('@@')(tsquery))
+
+    if resub_name is not None:
+        records = records.filter(Resub.name == resub_name)
+
+    if after is not None:
+        value, item_id = after
+        records = records.filter(or_(rank < value, and_(rank == value, model.id < item_id)))
+
+    return records.add_columns(rank).order_by(rank.desc(), model.id.desc()).offset(offset).limit(limit).all()
+
+
+def search_posts(db: Session, *, query: str, resub_name: str = None, after: Keyset = None, offset: int = 0,
+                 limit: int = 100) -> List[Tuple[PostRecord, float]]:
+    """Get records of the posts matching every word of the query, with
+    their ranks, ordered by rank.
+    """
+    return _search(db, Post, post_records(db.query(Post)), query=query, resub_name=resub_name, after=after,
+                   offset=offset, limit=limit)
+
+
+def search_comments(db: Session, *, query: str, resub_name: str = None, after: Keyset = None, offset: int = 0,
+                    limit: int = 100) -> List[Tuple[CommentRecord, float]]:
+    """Get records of the comments matching every word of the query,
+    with their ranks, ordered by rank.
+    """
+    return _search(db, Comment, comment_records(db.query(Comment)), query=query, resub_name=resub_name,
+                   after=after, offset=offset, limit=limit)
@@ -0,0 +1,19 @@
+"""Shared parts of the statements of the crud functions."""
+
+from typing import Any, Dict
+
+# Number of IDs in every IN clause, or of rows written at once by ID, below
+# the SQLite variable limit
+chunk_size = 400
+
+
+def keep_edited(model: Any, values: Dict[Any, Any]) -> Dict[Any, Any]:
+    """Add the edited column of the model, set to itself, to the values of
+    an update.
+
+    The edited column is set by onupdate whenever a row is updated, but
+    only edits by the author should set it. Updates of denormalized or
+    derived columns, such as scores, ranks, paths and versions, and
+    deletions, keep it as it is with these values.
+    """
+    return {**values, model.edited: model.edited}
@@ -1,21 +1,77 @@
-from typing import Any, List
+from datetime import timezone
+from typing import Any, List, NamedTuple, Optional
 
+from sqlalchemy import and_, func, select
 from sqlalchemy.orm import Session
 
+from repost import config
+from repost.cache import TTLCache, deletions_tag, invalidate
+from repost.crud.comments import increment_comments_versions
+from repost.crud.pagination import Keyset, paginate
+from repost.crud.purge import enqueue_purge
+from repost.crud.statements import keep_edited
 from repost.models import User, Comment, Post, Resub
-from repost.password import hash_password
+from repost.records import CommentRecord, PostRecord, ResubRecord, comment_records, post_records, \
+    resub_records
 
 
-def get_user(db: Session, *, username: str) -> User:
-    """Get the user with the given username."""
-    return db.query(User).filter_by(username=username).first()
+class UserIdentity(NamedTuple):
+    """The identifying columns of a user."""
+    id: int
+    username: str
+    # UTC timestamp of when the user was created
+    created: float
 
 
-def create_user(db: Session, *, username: str, password: str) -> User:
-    """Create a new user in the database."""
-    db_user = User(username=username, hashed_password=hash_password(password))
+# Identities of recently authorized users by user ID
+identity_cache = TTLCache('identities', maxsize=config.auth_cache_size, ttl=config.auth_cache_ttl)
+
+
+def get_user(db: Session, *, username: str, include_deleted: bool = False) -> User:
+    """Get the user with the given username.
+
+    A deleted user keeps its username until it is purged, and is only
+    included when `include_deleted` is set.
+    """
+    query = db.query(User).filter_by(username=username)
+    if not include_deleted:
+        query = query.filter(User.deleted.is_(None))
+
+    return query.first()
+
+
+def get_user_identity(db: Session, *, user_id: int) -> Optional[UserIdentity]:
+    """Get the identity of the user with the given ID.
+
+    Identities are cached by ID, since a username is free again once its
+    user is purged. The cache entry is removed when the user is deleted,
+    but other workers keep theirs until it expires. An ID can be used
+    again by SQLite as well, so tokens must be checked against the
+    `created` timestamp of the identity.
+    """
+    identity = identity_cache.get(user_id)
+    if identity is None:
+        row = db.query(User.id, User.username, User.created).filter(User.id == user_id,
+                                                                    User.deleted.is_(None)).first()
+        if not row:
+            return None
+
+        # SQLite returns UTC timestamps without a timezone
+        created = row.created if row.created.tzinfo else row.created.replace(tzinfo=timezone.utc)
+        identity = UserIdentity(row.id, row.username, created.timestamp())
+        identity_cache.set(user_id, identity)
+
+    return identity
+
+
+def create_user(db: Session, *, username: str, hashed_password: str) -> User:
+    """Create a new user with a password hashed by
+    `repost.password.hash_password` in the database.
+    """
+    db_user = User(username=username, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
+    invalidate(f'user:{username}')
 
     db.refresh(db_user)
     return db_user
@@ -28,27 +84,55 @@ def update_user(db: Session, *, username: str, **columns: Any) -> User:
     """
     db.query(User).filter_by(username=username).update(columns)
     db.commit()
+    invalidate(f'user:{username}')
 
     return get_user(db, username=username)
 
 
 def delete_user(db: Session, *, username: str):
-    """Delete the user with the given username."""
-    db.query(User).filter_by(username=username).delete()
+    """Delete the user with the given username, and the resubs the user
+    owns.
+
+    The user and the resubs are hidden at once, and everything in the
+    resubs or by the user, including votes, is purged in the background by
+    `repost.crud.purge_deleted`. The comments version of every post the
+    user commented on is incremented, since the user's comments are left
+    out of its comments at once.
+    """
+    user_id = db.query(User.id).filter(User.username == username, User.deleted.is_(None)).scalar()
+    if user_id is None:
+        return
+
+    resubs = and_(Resub.owner_id == user_id, Resub.deleted.is_(None))
+    resub_names = [name for name, in db.query(Resub.name).filter(resubs)]
+    enqueue_purge(db, 'resub', Resub, resubs)
+    enqueue_purge(db, 'user', User, User.id == user_id)
+
+    db.query(Resub).filter(resubs).update(keep_edited(Resub, {Resub.deleted: func.now()}), synchronize_session=False)
+    db.query(User).filter_by(id=user_id).update(keep_edited(User, {User.deleted: func.now()}),
+                                                synchronize_session=False)
+    increment_comments_versions(db, select([Comment.parent_post_id]).where(Comment.author_id == user_id))
     db.commit()
+    identity_cache.pop(user_id)
+    invalidate(f'user:{username}', deletions_tag, *(f'resub:{name}' for name in resub_names))
 
 
-def get_resubs_by_user(db: Session, user_id: int, offset: int = 0, limit: int = 100) -> List[Resub]:
-    """Get all resubs by a user with the specified ID."""
-    return db.query(Resub).filter_by(owner_id=user_id).order_by(Resub.created.desc()).offset(offset).limit(limit).all()
+def get_resubs_by_user(db: Session, user_id: int, after: Keyset = None, offset: int = 0,
+                       limit: int = 100) -> List[ResubRecord]:
+    """Get records of all resubs by a user with the specified ID."""
+    return paginate(resub_records(db.query(Resub).filter_by(owner_id=user_id)), Resub, Resub.created, after=after,
+                    offset=offset, limit=limit)
 
 
-def get_posts_by_user(db: Session, user_id: int, offset: int = 0, limit: int = 100) -> List[Post]:
-    """Get all posts by a user with the specified ID."""
-    return db.query(Post).filter_by(author_id=user_id).order_by(Post.created.desc()).offset(offset).limit(limit).all()
+def get_posts_by_user(db: Session, user_id: int, after: Keyset = None, offset: int = 0,
+                      limit: int = 100) -> List[PostRecord]:
+    """Get records of all posts by a user with the specified ID."""
+    return paginate(post_records(db.query(Post).filter_by(author_id=user_id)), Post, Post.created, after=after,
+                    offset=offset, limit=limit)
 
 
-def get_comments_by_user(db: Session, user_id: int, offset: int = 0, limit: int = 100) -> List[Comment]:
-    """Get all comments by a user with the specified ID."""
-    return db.query(Comment).filter_by(author_id=user_id).order_by(Comment.created.desc()).offset(offset).limit(
-        limit).all()
+def get_comments_by_user(db: Session, user_id: int, after: Keyset = None, offset: int = 0,
+                         limit: int = 100) -> List[CommentRecord]:
+    """Get records of all comments by a user with the specified ID."""
+    return paginate(comment_records(db.query(Comment).filter_by(author_id=user_id)), Comment, Comment.created,
+                    after=after, offset=offset, limit=limit)
@@ -0,0 +1,176 @@
+"""Writing votes on posts and comments.
+
+Votes are written with an upsert, which both PostgreSQL and SQLite 3.24
+or newer support, so concurrent votes by a user never conflict on insert.
+The voted items are locked before the previous votes are read, so that
+concurrent votes on an item wait for each other instead of computing
+score changes from the same previous vote.
+
+When write-behind is enabled in the config, votes are kept in
+`vote_buffer` and written in bulk by `flush_votes`, which
+`repost.tasks` runs periodically and when the server shuts down. A
+buffered vote is lost if the worker crashes before the next flush, and
+a failed flush is retried on the next one.
+"""
+
+from collections import defaultdict
+from threading import Lock
+from typing import Any, Callable, Dict, Set, Tuple
+
+from sqlalchemy import and_, bindparam, select, text
+from sqlalchemy.orm import Query, Session
+
+from repost import config
+from repost.crud.statements import chunk_size, keep_edited
+
+# Votes keyed by (item ID, author ID)
+Votes = Dict[Tuple[int, int], int]
+
+# Change in (score, upvotes, downvotes) keyed by item ID
+ScoreChanges = Dict[int, Tuple[int, int, int]]
+
+
+def _chunks(votes: Votes):
+    keys = list(votes)
+    for i in range(0, len(keys), chunk_size):
+        yield keys[i:i + chunk_size]
+
+
+def _lock_items(db: Session, model: Any, item_ids: Set[int]):
+    """Lock the items of the model with the given IDs until the end of the
+    transaction, and send the session's later reads to the primary.
+    """
+    if db.bind.dialect.name == 'sqlite':
+        # SQLite has no row locks. Its transactions start at the first write,
+        # which locks the whole database, so touch the items without
+        # changing them
+        db.execute(model.__table__.update().where(model.id.in_(item_ids)).values(keep_edited(model, {})))
+    else:
+        # Lock in order of ID, so that concurrent batches never deadlock
+        db.execute(select([model.id]).where(model.id.in_(item_ids)).order_by(model.id).with_for_update())
+
+
+def write_votes(db: Session, model: Any, vote_model: Any, item_column: Any, votes: Votes,
+                visible: Callable[[Query], Query]) -> ScoreChanges:
+    """Write votes on items of the model, and get the change in score of
+    every item.
+
+    Votes on items that do not exist, or that the visible filter leaves
+    out of a query of items, are ignored, and a vote of 0 removes the
+    vote. The changes are relative to the previous votes
+    read in the same transaction.
+    """
+    table = vote_model.__table__
+    upsert = text(f'INSERT INTO {table.name} ({item_column.key}, author_id, vote) '
+                  f'VALUES (:item_id, :author_id, :vote) '
+                  f'ON CONFLICT ({item_column.key}, author_id) DO UPDATE SET vote = excluded.vote')
+    delete = table.delete().where(and_(item_column == bindparam('item_id'),
+                                       vote_model.author_id == bindparam('author_id')))
+
+    changes = {}
+    for keys in _chunks(votes):
+        item_ids = {item_id for item_id, _ in keys}
+        author_ids = {author_id for _, author_id in keys}
+
+        # Read which items exist, and the previous votes, in one query once
+        # no concurrent vote on the items can change them
+        _lock_items(db, model, item_ids)
+        rows = visible(db.query(model.id, vote_model.author_id, vote_model.vote).outerjoin(
+            vote_model, and_(item_column == model.id, vote_model.author_id.in_(author_ids)))).filter(
+            model.id.in_(item_ids))
+
+        existing = set()
+        previous_votes = {}
+        for item_id, author_id, vote in rows:
+            existing.add(item_id)
+            if author_id is not None:
+                previous_votes[item_id, author_id] = vote
+
+        upserts, deletes = [], []
+        for item_id, author_id in keys:
+            if item_id not in existing:
+                continue
+
+            vote = votes[item_id, author_id]
+            previous = previous_votes.get((item_id, author_id), 0)
+            (upserts if vote else deletes).append({'item_id': item_id, 'author_id': author_id, 'vote': vote})
+
+            score, upvotes, downvotes = changes.get(item_id, (0, 0, 0))
+            changes[item_id] = (score + vote - previous, upvotes + (vote > 0) - (previous > 0),
+                                downvotes + (vote < 0) - (previous < 0))
+
+        if upserts:
+            db.execute(upsert, upserts)
+        if deletes:
+            db.execute(delete, deletes)
+
+    return {item_id: change for item_id, change in changes.items() if any(change)}
+
+
+def apply_score_changes(db: Session, model: Any, changes: ScoreChanges):
+    """Add the changes to the score columns of the model.
+
+    The updates are relative to the stored values, so they are atomic
+    with concurrent votes.
+    """
+    if not changes:
+        return
+
+    statement = model.__table__.update().where(model.id == bindparam('item_id')).values(keep_edited(model, {
+        'score': model.score + bindparam('score_change'), 'upvotes': model.upvotes + bindparam('upvotes_change'),
+        'downvotes': model.downvotes + bindparam('downvotes_change')}))
+    db.execute(statement, [{'item_id': item_id, 'score_change': score, 'upvotes_change': upvotes,
+                            'downvotes_change': downvotes}
+                           for item_id, (score, upvotes, downvotes) in changes.items()])
+
+
+class VoteBuffer:
+    """Votes waiting to be written in bulk.
+
+    A later vote by a user on an item replaces the earlier one, so every
+    flush writes at most one vote per user and item.
+    """
+
+    def __init__(self):
+        self._votes: Dict[Callable, Votes] = defaultdict(dict)
+        self._lock = Lock()
+
+    def add(self, write: Callable[[Session, Votes], Any], item_id: int, author_id: int, vote: int):
+        """Add a vote that is written with the given bulk write function."""
+        with self._lock:
+            self._votes[write][item_id, author_id] = vote
+
+    def flush(self, db: Session):
+        """Write every buffered vote.
+
+        Votes that fail to be written are buffered again, unless the user
+        voted on the item again in the meantime.
+        """
+        with self._lock:
+            buffered, self._votes = self._votes, defaultdict(dict)
+
+        while buffered:
+            write, votes = next(iter(buffered.items()))
+            try:
+                write(db, votes)
+            except Exception:
+                db.rollback()
+                with self._lock:
+                    for write, votes in buffered.items():
+                        for key, vote in votes.items():
+                            self._votes[write].setdefault(key, vote)
+                raise
+
+            del buffered[write]
+
+    def __len__(self) -> int:
+        return sum(len(votes) for votes in self._votes.values())
+
+
+vote_buffer = VoteBuffer() if config.vote_write_behind else None
+
+
+def flush_votes(db: Session):
+    """Write every vote buffered by write-behind."""
+    if vote_buffer is not None:
+        vote_buffer.flush(db)
@@ -1,21 +1,213 @@
-from sqlalchemy import create_engine
+import logging
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import SelectBase
 
 from repost import config
+from repost.metrics import instrument_engine
+
+logger = logging.getLogger(__name__)
+
+
+def _pool_options() -> Dict[str, Any]:
+    """Options of a QueuePool from the config."""
+    return {'pool_size': config.pool_size, 'max_overflow': config.pool_max_overflow,
+            'pool_timeout': config.pool_timeout, 'pool_recycle': config.pool_recycle,
+            'pool_pre_ping': config.pool_pre_ping, 'pool_use_lifo': config.pool_lifo}
+
+
+def _create_engine(name: str, database_url: str, warn_saturated: bool = True, **kwargs: Any) -> Engine:
+    url = make_url(database_url)
+    connect_args = {}
+
+    # SQLite driver only allows one thread by default to prevent multiple
+    # connections, but internally we are opening multiple connections so
+    # multiple threads can be used
+    if url.drivername == 'sqlite':
+        connect_args['check_same_thread'] = False
+
+    # The statement timeout is a connection option, so that rolling back
+    # a transaction does not reset it
+    if url.get_driver_name() == 'psycopg2' and config.statement_timeout > 0:
+        connect_args['options'] = f'-c statement_timeout={int(config.statement_timeout * 1000)}'
+
+    # SQLite engines use a pool without these options, unless given one
+    if url.get_backend_name() != 'sqlite' or kwargs.get('poolclass') is QueuePool:
+        kwargs = {**_pool_options(), **kwargs}
+
+    new_engine = create_engine(url, connect_args=connect_args, **kwargs)
+    instrument_engine(new_engine, name, warn_saturated=warn_saturated)
+    return new_engine
+
+
+def _is_sqlite_file(database_url: str) -> bool:
+    url = make_url(database_url)
+    return url.drivername == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def _apply_wal_profile(sqlite_engine: Engine, read_only: bool):
+    """Set the pragmas of the WAL profile on every new connection of the
+    engine.
+    """
+
+    @event.listens_for(sqlite_engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # Wait for locks of other processes first, since switching to WAL
+        # takes a lock once
+        cursor.execute(f'PRAGMA busy_timeout = {int(config.sqlite_busy_timeout * 1000)}')
+        cursor.execute('PRAGMA journal_mode = WAL')
+        cursor.execute('PRAGMA synchronous = NORMAL')
+        cursor.execute(f'PRAGMA cache_size = -{config.sqlite_cache_size}')
+        cursor.execute(f'PRAGMA mmap_size = {config.sqlite_mmap_size}')
+        if read_only:
+            cursor.execute('PRAGMA query_only = ON')
+        cursor.close()
+
+
+# With the WAL profile, writes to a SQLite file wait for the one writer
+# connection instead of failing with "database is locked", and sessions
+# read from read-only connections until they write. Readers never block
+# each other in WAL mode, so the number of readers is not limited. Every
+# write saturates the writer's pool, so that is not logged
+reader: Optional[Engine] = None
+if config.sqlite_profile == 'wal' and _is_sqlite_file(config.database_url):
+    engine = _create_engine('primary', config.database_url, warn_saturated=False, poolclass=QueuePool, pool_size=1,
+                            max_overflow=0)
+    reader = _create_engine('reader', config.database_url, poolclass=QueuePool, max_overflow=-1)
+    _apply_wal_profile(engine, read_only=False)
+    _apply_wal_profile(reader, read_only=True)
+else:
+    engine = _create_engine('primary', config.database_url)
+
+
+class Replicas:
+    """Read replicas that read-only sessions are balanced across.
+
+    A replica that cannot be connected to, or whose connection is lost, is
+    skipped for the retry interval, and the next read-only session after
+    that tries it again.
+    """
+
+    def __init__(self, engines: List[Engine], retry_interval: float):
+        self.engines = engines
+        self.retry_interval = retry_interval
+        self._failed: Dict[Engine, float] = {}
+        self._next = 0
+        self._lock = Lock()
+
+        for replica in engines:
+            self._watch(replica)
+
+    def _watch(self, replica: Engine):
+        @event.listens_for(replica, 'handle_error')
+        def handle_error(context):
+            if context.is_disconnect:
+                self.mark_failed(replica)
+
+    def choose(self) -> Optional[Engine]:
+        """The next healthy replica, or None when every replica failed."""
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.engines)):
+                replica = self.engines[self._next % len(self.engines)]
+                self._next += 1
+                if self._failed.get(replica, 0) <= now:
+                    return replica
+
+        return None
+
+    def mark_failed(self, replica: Engine):
+        """Skip the replica for the retry interval."""
+        with self._lock:
+            self._failed[replica] = time.monotonic() + self.retry_interval
+        logger.warning(f'Replica {replica.url!r} failed, retrying in {self.retry_interval} seconds')
+
+
+replicas = Replicas([_create_engine(f'replica{i}', url) for i, url in enumerate(config.replica_urls)],
+                    config.replica_retry_interval)
+
+
+class RoutingSession(Session):
+    """Session that reads from a replica until it writes.
+
+    Anything but a SELECT, such as a flush, an update, textual SQL or a
+    SELECT FOR UPDATE, is sent to the primary, and every statement after
+    it is too, so that the session reads its own writes. The reader is a
+    pool of read-only connections to the primary itself, such as those of
+    the WAL profile, so it is current and is used again once the writing
+    transaction ends.
+    """
+
+    def __init__(self, replica: Engine = None, reader: Engine = None, **kwargs):
+        super().__init__(**kwargs)
+        self.replica = replica
+        self.reader = reader
+        self._wrote = False
+        self._writing = False
+
+    def get_bind(self, mapper=None, clause=None):
+        locks = getattr(clause, '_for_update_arg', None) is not None
+        if self._writing or self._flushing or locks or not (clause is None or isinstance(clause, SelectBase)):
+            self._wrote = self._writing = True
+        elif self.replica is not None and not self._wrote:
+            return self.replica
+        elif self.reader is not None:
+            return self.reader
+
+        return super().get_bind(mapper, clause)
+
+    def commit(self):
+        super().commit()
+        self._writing = False
+
+    def rollback(self):
+        super().rollback()
+        self._writing = False
+
+    def close(self):
+        super().close()
+        self._writing = False
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine, reader=reader)
+
+
+def open_session(read_only: bool = False) -> Session:
+    """Open a session, and check out its connection.
 
-url = make_url(config.database_url)
-connect_args = {}
+    Read-only sessions read from a healthy replica when any are
+    configured, and fail over to the next replica, then the primary,
+    when a replica cannot be connected to.
+    """
+    replica = replicas.choose() if read_only else None
+    while replica is not None:
+        session = SessionLocal(replica=replica)
+        try:
+            session.connection()
+            return session
+        except DBAPIError:
+            session.close()
+            replicas.mark_failed(replica)
+            replica = replicas.choose()
 
-# SQLite driver only allows one thread by default to prevent multiple
-# connections, but internally we are opening multiple connections so
-# multiple threads can be used
-if url.drivername == 'sqlite':
-    connect_args['check_same_thread'] = False
+    session = SessionLocal()
+    try:
+        session.connection()
+    except DBAPIError:
+        session.close()
+        raise
 
-engine = create_engine(url, connect_args=connect_args)
+    return session
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
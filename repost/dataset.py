@@ -0,0 +1,228 @@
+"""Importing and generating datasets in bulk.
+
+Imported data is newline-delimited JSON, with one object per line of the
+item's `type` and its `data`, which is the format of the export endpoints
+in `repost.api.export`. The types and their data are:
+
+- user: username, and optionally bio, avatar_url and hashed_password
+- resub: name, description and owner_username
+- post: parent_resub_name, author_username, title, and optionally id,
+  url, content and created
+- comment: parent_resub_name, parent_post_id, author_username, content,
+  and optionally id, parent_comment_id and created
+- vote: post_id or comment_id, author_username and vote
+
+Items must come after the items they refer to, and votes must be unique
+for every user and post or comment.
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from repost import crud
+from repost.crud.comments import comment_path
+from repost.crud.ranking import hot_rank, rising_rank
+from repost.models import Comment, CommentVote, Post, PostVote, Resub, User
+
+# Shape of the votes, where lower alphas have more items with many votes
+_post_vote_alpha = 1.2
+_comment_vote_alpha = 1.8
+
+# Chance that a generated comment replies to another comment, and the
+# deepest a reply is generated
+_reply_probability = 0.7
+_max_depth = 30
+
+
+class DatasetError(Exception):
+    """Raised when a line of imported data is invalid."""
+
+    def __init__(self, line_number: int, message: str):
+        super().__init__(f'Line {line_number}: {message}')
+
+
+def _time(value: str = None) -> datetime:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _created(data: Dict[str, Any]) -> Dict[str, Any]:
+    """The created column of the item, unless it is not given."""
+    created = _time(data.get('created'))
+    return {'created': created} if created else {}
+
+
+def _import_user(loader: crud.BulkLoader, data: Dict[str, Any]):
+    columns = {key: data[key] for key in ('bio', 'avatar_url', 'hashed_password') if data.get(key)}
+    loader.add_user(data['username'], **columns, **_created(data))
+
+
+def _import_resub(loader: crud.BulkLoader, data: Dict[str, Any]):
+    loader.add_resub(data['name'], description=data.get('description'),
+                     owner_id=loader.user_ids[data['owner_username']], **_created(data))
+
+
+def _import_post(loader: crud.BulkLoader, data: Dict[str, Any]):
+    loader.add(Post, id=data.get('id'), title=data['title'], url=data.get('url'), content=data.get('content'),
+               author_id=loader.user_ids[data['author_username']],
+               parent_resub_id=loader.resub_ids[data['parent_resub_name']], **_created(data))
+
+
+def _import_comment(loader: crud.BulkLoader, data: Dict[str, Any]):
+    loader.add_comment(id=data.get('id'), content=data['content'], author_id=loader.user_ids[data['author_username']],
+                       parent_resub_id=loader.resub_ids[data['parent_resub_name']],
+                       parent_post_id=data['parent_post_id'], parent_comment_id=data.get('parent_comment_id'),
+                       **_created(data))
+
+
+def _import_vote(loader: crud.BulkLoader, data: Dict[str, Any]):
+    author_id = loader.user_ids[data['author_username']]
+    if data.get('post_id') is not None:
+        loader.add(PostVote, post_id=data['post_id'], author_id=author_id, vote=data['vote'])
+    else:
+        loader.add(CommentVote, comment_id=data['comment_id'], author_id=author_id, vote=data['vote'])
+
+
+_importers: Dict[str, Callable[[crud.BulkLoader, Dict[str, Any]], None]] = {
+    'user': _import_user,
+    'resub': _import_resub,
+    'post': _import_post,
+    'comment': _import_comment,
+    'vote': _import_vote,
+}
+
+
+def _span(*id_ranges: Optional[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """Get the ID range that spans the given ranges, or None if every range
+    is None.
+    """
+    id_ranges = [id_range for id_range in id_ranges if id_range is not None]
+    if not id_ranges:
+        return None
+
+    return min(first_id for first_id, _ in id_ranges), max(last_id for _, last_id in id_ranges)
+
+
+def import_dataset(loader: crud.BulkLoader, lines: Iterable[str]):
+    """Import the items in the lines of NDJSON.
+
+    Comment paths are computed as the comments are added. The scores,
+    ranks and search index of the imported posts and comments, and of
+    the posts and comments with imported votes, are computed after all of
+    them are inserted.
+    """
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+
+        try:
+            item = json.loads(line)
+            importer = _importers[item['type']]
+        except (ValueError, KeyError, TypeError):
+            raise DatasetError(line_number, 'Expected an object with a type of ' + ', '.join(_importers))
+
+        try:
+            importer(loader, item['data'])
+        except KeyError as error:
+            raise DatasetError(line_number, f'Missing or unknown {error.args[0]!r} in {item["type"]}')
+        except (ValueError, TypeError) as error:
+            raise DatasetError(line_number, str(error))
+
+    loader.finish()
+    inserted = {model: loader.id_ranges[model] for model in (Post, Comment) if model in loader.id_ranges}
+    scored = {model: _span(loader.id_ranges.get(model), loader.id_ranges.get(vote_model))
+              for model, vote_model in ((Post, PostVote), (Comment, CommentVote))}
+    scored = {model: id_range for model, id_range in scored.items() if id_range is not None}
+
+    crud.recompute_scores(loader.db, id_ranges=scored)
+    if Post in scored:
+        crud.refresh_ranks(loader.db, id_range=scored[Post])
+    crud.rebuild_search_index(loader.db, id_ranges=inserted)
+
+
+def _skewed(rng: random.Random, n: int) -> int:
+    """Random index below n, where index k is picked about 1 / (k + 1) as
+    often as index 0, like the popularity of users and resubs.
+    """
+    return min(int(n ** rng.random()) - 1, n - 1)
+
+
+def _votes(rng: random.Random, user_ids: range, alpha: float) -> List[Tuple[int, int]]:
+    """Random (author ID, vote) votes, where the number of votes follows a
+    power law and most votes are upvotes.
+    """
+    count = min(int(rng.paretovariate(alpha)) - 1, len(user_ids))
+    return [(author_id, 1 if rng.random() < 0.8 else -1) for author_id in rng.sample(user_ids, count)]
+
+
+def _scores(votes: List[Tuple[int, int]]) -> Dict[str, int]:
+    upvotes = sum(vote > 0 for _, vote in votes)
+    return {'score': upvotes - (len(votes) - upvotes), 'upvotes': upvotes, 'downvotes': len(votes) - upvotes}
+
+
+def generate_dataset(loader: crud.BulkLoader, *, users: int, resubs: int, posts: int, comments: int, days: float = 30,
+                     seed: int = None):
+    """Generate a dataset where a few users, resubs and posts have most of
+    the content and votes.
+
+    Posts are created over the given number of days before now. The
+    number of comments is approximate, and most comments reply to one of
+    the latest comments in the post, so some threads are deep. Scores,
+    comment paths and ranks are computed as the items are generated, and
+    the search index of the generated items after all of them are
+    inserted.
+    """
+    rng = random.Random(seed)
+    start = loader.now - timedelta(days=days)
+
+    first_user_id = loader.next_id(User)
+    for user_id in range(first_user_id, first_user_id + users):
+        loader.add_user(f'user{user_id}', created=start)
+    user_ids = range(first_user_id, first_user_id + users)
+
+    first_resub_id = loader.next_id(Resub)
+    for resub_id in range(first_resub_id, first_resub_id + resubs):
+        loader.add_resub(f'resub{resub_id}', description=f'Resub {resub_id}',
+                         owner_id=user_ids[_skewed(rng, users)], created=start)
+    resub_ids = range(first_resub_id, first_resub_id + resubs)
+
+    comments_per_post = comments / posts if posts else 0
+    for i in range(posts):
+        created = start + timedelta(days=days * (i + rng.random()) / posts)
+        resub_id = resub_ids[_skewed(rng, resubs)]
+        votes = _votes(rng, user_ids, _post_vote_alpha)
+        scores = _scores(votes)
+        post_id = loader.add(Post, title=f'Post {i}', content='Generated post',
+                             author_id=user_ids[_skewed(rng, users)], parent_resub_id=resub_id, created=created,
+                             **scores, hot_rank=hot_rank(scores['score'], created),
+                             rising_rank=rising_rank(scores['score'], created, loader.now))
+        for author_id, vote in votes:
+            loader.add(PostVote, post_id=post_id, author_id=author_id, vote=vote)
+
+        # Pareto(1.5) - 1 has a mean of 2, and rounding up at random keeps
+        # the mean of the number of comments
+        count = int(comments_per_post * (rng.paretovariate(1.5) - 1) / 2 + rng.random())
+        thread = []
+        comment_created = created
+        for _ in range(count):
+            comment_created = min(comment_created + timedelta(minutes=rng.expovariate(1 / 30)), loader.now)
+            parent_id, parent_path, parent_depth = None, '', -1
+            if thread and rng.random() < _reply_probability:
+                parent_id, parent_path, parent_depth = rng.choice(thread[-5:])
+
+            comment_id = loader.next_id(Comment)
+            path, depth = comment_path(comment_id, parent_path), parent_depth + 1
+            votes = _votes(rng, user_ids, _comment_vote_alpha)
+            loader.add(Comment, id=comment_id, content='Generated comment', author_id=user_ids[_skewed(rng, users)],
+                       parent_resub_id=resub_id, parent_post_id=post_id, parent_comment_id=parent_id,
+                       created=comment_created, path=path, depth=depth, **_scores(votes))
+            for author_id, vote in votes:
+                loader.add(CommentVote, comment_id=comment_id, author_id=author_id, vote=vote)
+
+            if depth < _max_depth:
+                thread.append((comment_id, path, depth))
+
+    loader.finish()
+    crud.rebuild_search_index(loader.db, id_ranges={model: loader.id_ranges[model] for model in (Post, Comment)
+                                                    if model in loader.id_ranges})
@@ -6,23 +6,55 @@ Authors: pckv, EspenK, jonsondrem
 """
 __version__ = '0.0.1'
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 
 from repost import models, config
 from repost.api import api_router
+from repost.api.admission import AdmissionMiddleware
+from repost.api.caching import ResponseCacheMiddleware, cache_header
+from repost.api.etags import ETagMiddleware, NotModified
+from repost.api.metrics import MetricsMiddleware
+from repost.api.pagination import next_cursor_header
 from repost.database import engine
+from repost.password import PasswordPoolFull
+from repost.tasks import start_tasks, stop_tasks
 
 app = FastAPI(title='Repost', version=__version__, description=__doc__,
               docs_url='/api/swagger', redoc_url='/api/docs')
 app.include_router(api_router, prefix='/api')
+app.add_event_handler('startup', start_tasks)
+app.add_event_handler('shutdown', stop_tasks)
 
+# Added before CORS so that cached responses also get CORS headers, and
+# ETags are added before responses are cached. Cached responses are
+# served without admission, and metrics include both cached and rejected
+# responses
+app.add_middleware(ETagMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ResponseCacheMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=config.origins,
     allow_credentials=True,
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=[next_cursor_header, cache_header, 'ETag', 'Server-Timing'],
 )
 
+
+@app.exception_handler(NotModified)
+async def not_modified_handler(request: Request, exc: NotModified):
+    """Respond without a body when the client already has the current response."""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': exc.etag})
+
+
+@app.exception_handler(PasswordPoolFull)
+async def password_pool_full_handler(request: Request, exc: PasswordPoolFull):
+    """Reject requests that need a password while the password pool is full."""
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'},
+                        content={'detail': 'Too many password requests, try again later'})
+
 models.Base.metadata.create_all(bind=engine)
@@ -0,0 +1,267 @@
+"""Metrics of requests, caches and connection pools in the Prometheus
+text format.
+
+The time a request spends waiting to be admitted, on database queries,
+waiting for a pooled connection and serializing the response is recorded in the
+`RequestTimings` of the request, which `repost.api.metrics` sets for
+every request. Metrics are kept by each worker process.
+"""
+
+import logging
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from repost.cache import caches
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Seconds between logging that the same pool is saturated
+_saturation_log_interval = 60.0
+
+
+class RequestTimings:
+    """Number of queries and seconds spent on each part of a request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+
+# Timings of the current request, which are shared with the threads that
+# run its dependencies and route, since they run in a copy of the context
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar('current_timings', default=None)
+
+
+def add_time(part: str, seconds: float):
+    """Add time spent on a part of the current request, if any."""
+    timings = current_timings.get()
+    if timings is not None:
+        timings.seconds[part] += seconds
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Counter with labels."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Labels, float] = defaultdict(float)
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(labels.items())
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{_format_labels(labels)} {_format_value(value)}'
+
+
+class Histogram:
+    """Histogram with labels and fixed buckets."""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float]):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        # Count in every bucket, the sum and the count by labels
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(labels.items())
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 2)
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+        for labels, counts in values:
+            for bound, count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{_format_labels(labels + (("le", _format_value(bound)),))} {count}'
+            yield f'{self.name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {counts[-1]}'
+            yield f'{self.name}_sum{_format_labels(labels)} {_format_value(counts[-2])}'
+            yield f'{self.name}_count{_format_labels(labels)} {counts[-1]}'
+
+
+_second_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+requests_total = Counter('repost_requests_total', 'Requests by route template and status code.')
+request_seconds = Histogram('repost_request_duration_seconds', 'Time to respond to requests.', _second_buckets)
+request_queries = Histogram('repost_request_queries', 'Database queries of requests.', (0, 1, 2, 3, 5, 10, 20, 50, 100))
+request_db_seconds = Histogram('repost_request_db_seconds', 'Time spent on database queries in requests.',
+                               _second_buckets)
+request_pool_seconds = Histogram('repost_request_pool_wait_seconds',
+                                 'Time spent waiting for a database connection from the pool in requests.',
+                                 _second_buckets)
+request_serialization_seconds = Histogram('repost_request_serialization_seconds',
+                                          'Time spent serializing responses.', _second_buckets)
+pool_saturations = Counter('repost_db_pool_saturated_total',
+                           'Connections checked out that left no connection for the next checkout.')
+admission_rejections = Counter('repost_admission_rejected_total',
+                               'Requests rejected by admission control by request class.')
+
+metrics = [requests_total, request_seconds, request_queries, request_db_seconds, request_pool_seconds,
+           request_serialization_seconds, pool_saturations, admission_rejections]
+
+
+def observe_request(timings: RequestTimings, seconds: float, *, method: str, route: str, status: int):
+    """Record the timings of a finished request."""
+    requests_total.inc(method=method, route=route, status=str(status))
+    request_seconds.observe(seconds, method=method, route=route)
+    request_queries.observe(timings.queries, method=method, route=route)
+    request_db_seconds.observe(timings.seconds['db'], method=method, route=route)
+    request_pool_seconds.observe(timings.seconds['pool'], method=method, route=route)
+    request_serialization_seconds.observe(timings.seconds['serialize'], method=method, route=route)
+
+
+# Metrics of every cache in repost.cache.caches
+_cache_metrics = (
+    ('repost_cache_hits_total', 'counter', 'Cache hits.', lambda cache: cache.hits),
+    ('repost_cache_misses_total', 'counter', 'Cache misses.', lambda cache: cache.misses),
+    ('repost_cache_hit_ratio', 'gauge', 'Ratio of cache lookups that were hits.', lambda cache: cache.hit_ratio),
+)
+
+
+def _render_caches() -> Iterable[str]:
+    for name, kind, description, value in _cache_metrics:
+        yield f'# HELP {name} {description}'
+        yield f'# TYPE {name} {kind}'
+        for cache_name, cache in caches.items():
+            yield f'{name}{_format_labels((("cache", cache_name),))} {_format_value(value(cache))}'
+
+
+# Instrumented engines with a QueuePool by name, whose pools are replaced
+# when an engine is disposed
+pooled_engines: Dict[str, Engine] = {}
+
+# Metrics of the pool of every engine in pooled_engines
+_pool_metrics = (
+    ('repost_db_pool_size', 'Connections the pool keeps open.', lambda pool: pool.size()),
+    ('repost_db_pool_checked_out', 'Connections in use.', lambda pool: pool.checkedout()),
+    ('repost_db_pool_overflow', 'Connections open beyond the pool size.', lambda pool: max(pool.overflow(), 0)),
+    ('repost_db_pool_max_overflow', 'Connections the pool may open beyond its size, or -1 for no limit.',
+     lambda pool: pool._max_overflow),
+)
+
+
+def _render_pools() -> Iterable[str]:
+    for name, description, value in _pool_metrics:
+        yield f'# HELP {name} {description}'
+        yield f'# TYPE {name} gauge'
+        for pool_name, engine in pooled_engines.items():
+            yield f'{name}{_format_labels((("pool", pool_name),))} {_format_value(value(engine.pool))}'
+
+
+# Admission limiters of repost.api.admission by request class
+admission_limiters: Dict[str, Any] = {}
+
+# Metrics of every limiter in admission_limiters
+_admission_metrics = (
+    ('repost_admission_limit', 'Requests admitted at once.', lambda limiter: limiter.limit),
+    ('repost_admission_active', 'Requests admitted and running.', lambda limiter: limiter.active),
+    ('repost_admission_queued', 'Requests waiting to be admitted.', lambda limiter: limiter.queued),
+)
+
+
+def _render_admission() -> Iterable[str]:
+    for name, description, value in _admission_metrics:
+        yield f'# HELP {name} {description}'
+        yield f'# TYPE {name} gauge'
+        for request_class, limiter in admission_limiters.items():
+            yield f'{name}{_format_labels((("request_class", request_class),))} {_format_value(value(limiter))}'
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text format."""
+    lines = [line for metric in metrics for line in metric.render()]
+    lines.extend(_render_caches())
+    lines.extend(_render_pools())
+    lines.extend(_render_admission())
+    return '\n'.join(lines) + '\n'
+
+
+def _watch_pool(name: str, engine: Engine, warn_saturated: bool):
+    """Count checkouts that leave the pool of the engine without
+    connections, so that the next checkout waits for one to be returned,
+    and log them unless the pool is expected to be saturated.
+    """
+    pooled_engines[name] = engine
+    last_logged = 0.0
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        nonlocal last_logged
+        pool = engine.pool
+        if pool._max_overflow < 0 or pool.checkedout() < pool.size() + pool._max_overflow:
+            return
+
+        pool_saturations.inc(pool=name)
+        now = time.monotonic()
+        if warn_saturated and now - last_logged >= _saturation_log_interval:
+            last_logged = now
+            logger.warning(f'Connection pool {name!r} is saturated with {pool.checkedout()} connections checked '
+                           f'out, and further checkouts wait up to {pool.timeout()} seconds')
+
+
+def instrument_engine(engine: Engine, name: str, warn_saturated: bool = True):
+    """Count the queries of the engine and time them in the current
+    request, and watch its pool under the given name.
+    """
+    if isinstance(engine.pool, QueuePool):
+        _watch_pool(name, engine, warn_saturated)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        timings = current_timings.get()
+        if timings is not None:
+            timings.queries += 1
+            timings.seconds['db'] += elapsed
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
@@ -2,5 +2,7 @@ from repost.database import Base
 
 from .comment import Comment, CommentVote
 from .post import Post, PostVote
+from .purge import PurgeJob
 from .resub import Resub
 from .user import User
+from .search import posts_search, comments_search, text_search_config
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, func
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, func, Index
 from sqlalchemy.orm import relationship
 
 from . import Base
@@ -6,19 +6,37 @@ from . import Base
 
 class Comment(Base):
     __tablename__ = 'comments'
+    __table_args__ = (
+        # Keyset pagination of comments in a post and by a user
+        Index('ix_comments_parent_post_id_created_id', 'parent_post_id', 'created', 'id'),
+        Index('ix_comments_author_id_created_id', 'author_id', 'created', 'id'),
+        # Range queries of threads in a post
+        Index('ix_comments_parent_post_id_path', 'parent_post_id', 'path'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String)
     created = Column(DateTime(timezone=True), server_default=func.now())
     edited = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Denormalized vote totals, maintained by repost.crud on every vote
+    score = Column(Integer, nullable=False, default=0, server_default='0')
+    upvotes = Column(Integer, nullable=False, default=0, server_default='0')
+    downvotes = Column(Integer, nullable=False, default=0, server_default='0')
+
     author_id = Column(Integer, ForeignKey('users.id'))
     parent_resub_id = Column(Integer, ForeignKey('resubs.id'))
     parent_post_id = Column(Integer, ForeignKey('posts.id'))
     parent_comment_id = Column(Integer, ForeignKey('comments.id'), nullable=True)
 
-    author = relationship('User', back_populates='comments')
-    parent_resub = relationship('Resub', back_populates='comments')
+    # Materialized path of the IDs from the top level comment down to this
+    # comment, so that a thread sorts in order and a subtree is a range
+    path = Column(String, nullable=True)
+    depth = Column(Integer, nullable=False, default=0, server_default='0')
+
+    # Joined eagerly since every serialized comment includes them
+    author = relationship('User', back_populates='comments', lazy='joined')
+    parent_resub = relationship('Resub', back_populates='comments', lazy='joined')
     parent_post = relationship('Post', back_populates='comments')
     replies = relationship('Comment')
     votes = relationship('CommentVote', cascade='delete')
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, func, Table
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, func, Table, Index, Float
 from sqlalchemy.orm import relationship
 
 from . import Base
@@ -6,6 +6,15 @@ from . import Base
 
 class Post(Base):
     __tablename__ = 'posts'
+    __table_args__ = (
+        # Keyset pagination of posts in a resub and by a user
+        Index('ix_posts_parent_resub_id_created_id', 'parent_resub_id', 'created', 'id'),
+        Index('ix_posts_author_id_created_id', 'author_id', 'created', 'id'),
+        # Ranked listings of posts in a resub
+        Index('ix_posts_parent_resub_id_hot_rank_id', 'parent_resub_id', 'hot_rank', 'id'),
+        Index('ix_posts_parent_resub_id_score_id', 'parent_resub_id', 'score', 'id'),
+        Index('ix_posts_parent_resub_id_rising_rank_id', 'parent_resub_id', 'rising_rank', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
@@ -14,11 +23,25 @@ class Post(Base):
     created = Column(DateTime(timezone=True), server_default=func.now())
     edited = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Denormalized vote totals, maintained by repost.crud on every vote
+    score = Column(Integer, nullable=False, default=0, server_default='0')
+    upvotes = Column(Integer, nullable=False, default=0, server_default='0')
+    downvotes = Column(Integer, nullable=False, default=0, server_default='0')
+
+    # Precomputed ranks, see repost.crud.ranking
+    hot_rank = Column(Float, nullable=False, default=0, server_default='0')
+    rising_rank = Column(Float, nullable=False, default=0, server_default='0')
+
+    # Incremented by repost.crud on every change to the comments of the
+    # post, so that comment listings have a cheap version for ETags
+    comments_version = Column(Integer, nullable=False, default=0, server_default='0')
+
     author_id = Column(Integer, ForeignKey('users.id'))
     parent_resub_id = Column(Integer, ForeignKey('resubs.id'))
 
-    author = relationship('User', back_populates='posts')
-    parent_resub = relationship('Resub', back_populates='posts')
+    # Joined eagerly since every serialized post includes them
+    author = relationship('User', back_populates='posts', lazy='joined')
+    parent_resub = relationship('Resub', back_populates='posts', lazy='joined')
     comments = relationship('Comment', back_populates='parent_post')
     votes = relationship('PostVote', cascade='delete')
 
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, DateTime, func
+
+from . import Base
+
+
+class PurgeJob(Base):
+    """Removal of the rows of a deleted resub or user, which
+    `repost.crud.purge_deleted` runs in chunks.
+
+    The job is removed when it is done, so the remaining jobs are the
+    progress of every purge.
+    """
+    __tablename__ = 'purge_jobs'
+
+    id = Column(Integer, primary_key=True, index=True)
+    target = Column(String, nullable=False)
+    target_id = Column(Integer, nullable=False)
+    created = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Stage the purge is at, and the number of rows it has deleted so far
+    stage = Column(String, nullable=False)
+    deleted_rows = Column(Integer, nullable=False, default=0, server_default='0')
+
+    # Purging worker's lease on the job, after which another worker takes
+    # over the job
+    locked_until = Column(DateTime(timezone=True), nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, func, DateTime
+from sqlalchemy import Column, ForeignKey, Integer, String, func, DateTime, Index
 from sqlalchemy.orm import relationship
 
 from . import Base
@@ -6,6 +6,11 @@ from . import Base
 
 class Resub(Base):
     __tablename__ = 'resubs'
+    __table_args__ = (
+        # Keyset pagination of all resubs and by a user
+        Index('ix_resubs_created_id', 'created', 'id'),
+        Index('ix_resubs_owner_id_created_id', 'owner_id', 'created', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
@@ -13,8 +18,12 @@ class Resub(Base):
     created = Column(DateTime(timezone=True), server_default=func.now())
     edited = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Set when the resub is deleted, until its posts and comments are purged
+    deleted = Column(DateTime(timezone=True), nullable=True)
+
     owner_id = Column(Integer, ForeignKey('users.id'))
 
-    owner = relationship('User', back_populates='resubs')
+    # Joined eagerly since every serialized resub includes it
+    owner = relationship('User', back_populates='resubs', lazy='joined')
     posts = relationship('Post', back_populates='parent_resub')
     comments = relationship('Comment', back_populates='parent_resub')
@@ -0,0 +1,39 @@
+"""Full-text search index of posts and comments.
+
+On SQLite, the index is the FTS5 tables `posts_search` and
+`comments_search`, whose rowids are the IDs of the posts and comments. On
+PostgreSQL, it is a `search_vector` tsvector column with a GIN index in
+the posts and comments tables. Neither can be declared with the models,
+so both are created after the tables by `create_all`, and are kept in
+sync by `repost.crud.search`.
+"""
+
+from sqlalchemy import event, inspect
+from sqlalchemy.sql import column, table
+
+from . import Base
+
+# Tables of the SQLite index, for building queries
+posts_search = table('posts_search', column('rowid'), column('title'), column('content'))
+comments_search = table('comments_search', column('rowid'), column('content'))
+
+# Text search configuration of the PostgreSQL index
+text_search_config = 'english'
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_search_index(target, connection, **kwargs):
+    """Create the index of the database if it does not exist."""
+    if connection.dialect.name == 'sqlite':
+        connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS posts_search "
+                           "USING fts5(title, content, tokenize='porter unicode61')")
+        connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS comments_search "
+                           "USING fts5(content, tokenize='porter unicode61')")
+    elif connection.dialect.name == 'postgresql':
+        for table_name in ('posts', 'comments'):
+            # Only alter the table when the column is missing, since that
+            # locks the table
+            if 'search_vector' not in {c['name'] for c in inspect(connection).get_columns(table_name)}:
+                connection.execute(f'ALTER TABLE {table_name} ADD COLUMN search_vector tsvector')
+            connection.execute(f'CREATE INDEX IF NOT EXISTS ix_{table_name}_search_vector '
+                               f'ON {table_name} USING gin (search_vector)')
@@ -14,6 +14,9 @@ class User(Base):
     created = Column(DateTime(timezone=True), server_default=func.now())
     edited = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Set when the user is deleted, until everything by the user is purged
+    deleted = Column(DateTime(timezone=True), nullable=True)
+
     hashed_password = Column(String)
 
     resubs = relationship('Resub', back_populates='owner')
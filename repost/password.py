@@ -1,15 +1,73 @@
-"""Password hashing functions."""
+"""Password hashing functions.
+
+Hashing is deliberately slow, so it runs in a pool of workers, which
+the routes that need a password await on the event loop. Waiting in the
+threadpool instead would hold its threads, which every route that uses
+a session needs. The number of passwords waiting in the pool is
+bounded, and when the pool is full `PasswordPoolFull` is raised instead
+of queueing any more.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, TypeVar
 
 from passlib.context import CryptContext
 
+from repost import config
+
+T = TypeVar('T')
+
 password_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 
-def hash_password(password: str) -> str:
-    """Hash the given password using the context scheme."""
+class PasswordPoolFull(Exception):
+    """Raised when the password pool has no room for more work."""
+
+
+def _create_executor() -> Executor:
+    """Create the pool of workers set in the config."""
+    if config.password_executor == 'process':
+        return ProcessPoolExecutor(max_workers=config.password_workers)
+
+    return ThreadPoolExecutor(max_workers=config.password_workers, thread_name_prefix='password')
+
+
+password_executor = _create_executor()
+
+# Passwords being hashed or waiting to be hashed. They are only counted
+# on the event loop, so the count needs no lock
+_pending = 0
+
+
+async def _run_in_pool(func: Callable[..., T], *args) -> T:
+    """Run the function in the password pool, and wait for the result
+    without holding a thread of the threadpool.
+    """
+    global _pending
+    if _pending >= config.password_workers + config.password_queue_size:
+        raise PasswordPoolFull()
+
+    _pending += 1
+    try:
+        return await asyncio.get_event_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        _pending -= 1
+
+
+def _hash_password(password: str) -> str:
     return password_context.hash(password)
 
 
-def verify_password(password: str, hashed_password: str) -> bool:
-    """Compare the given password with the given hashed password."""
+def _verify_password(password: str, hashed_password: str) -> bool:
     return password_context.verify(password, hashed_password)
+
+
+async def hash_password(password: str) -> str:
+    """Hash the given password using the context scheme."""
+    return await _run_in_pool(_hash_password, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    """Compare the given password with the given hashed password."""
+    return await _run_in_pool(_verify_password, password, hashed_password)
@@ -0,0 +1,114 @@
+"""Read models of posts, comments and resubs in list endpoints.
+
+A record is a named tuple of only the columns its response schema
+includes, with the schema's field names. Pages of records are selected
+with a join instead of loading ORM entities into the session, since
+listed items are never modified. Items in deleted resubs or by deleted
+users, and comments in posts by deleted users, are left out until they
+are purged, by the same filters that single items are read and voted on
+with.
+"""
+
+from datetime import datetime
+from typing import NamedTuple, Optional, Type
+
+from sqlalchemy.orm import Bundle, Query, aliased
+
+from repost.models import Comment, Post, Resub, User
+
+
+# Author of the post that a comment is in
+_post_author = aliased(User, name='post_authors')
+
+
+def visible_posts(query: Query) -> Query:
+    """Leave posts in deleted resubs or by deleted users out of a query of
+    posts.
+    """
+    return query.join(Post.author).join(Post.parent_resub).filter(User.deleted.is_(None), Resub.deleted.is_(None))
+
+
+def visible_comments(query: Query) -> Query:
+    """Leave comments in deleted resubs, by deleted users or in posts by
+    deleted users out of a query of comments.
+    """
+    return query.join(Comment.author).join(Comment.parent_resub).join(Comment.parent_post).join(
+        _post_author, Post.author).filter(User.deleted.is_(None), Resub.deleted.is_(None),
+                                          _post_author.deleted.is_(None))
+
+
+class RecordBundle(Bundle):
+    """Bundle of columns that are loaded as a record."""
+    single_entity = True
+
+    def __init__(self, record: Type[NamedTuple], *columns):
+        super().__init__(record.__name__, *columns)
+        self.record = record
+
+    def create_row_processor(self, query, procs, labels):
+        make = self.record._make
+        return lambda row: make([proc(row) for proc in procs])
+
+
+class PostRecord(NamedTuple):
+    id: int
+    parent_resub_name: str
+    title: str
+    url: Optional[str]
+    content: Optional[str]
+    author_username: str
+    created: datetime
+    edited: Optional[datetime]
+    votes: int
+    upvotes: int
+    downvotes: int
+    hot_rank: float
+    rising_rank: float
+
+    @property
+    def score(self) -> int:
+        """Alias of votes, for keysets of posts ordered by score."""
+        return self.votes
+
+
+class CommentRecord(NamedTuple):
+    id: int
+    parent_resub_name: str
+    parent_post_id: int
+    parent_comment_id: Optional[int]
+    content: str
+    author_username: str
+    created: datetime
+    edited: Optional[datetime]
+    votes: int
+    upvotes: int
+    downvotes: int
+
+
+class ResubRecord(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    owner_username: str
+    created: datetime
+    edited: Optional[datetime]
+
+
+def post_records(query: Query) -> Query:
+    """Select post records instead of posts in a query of posts."""
+    return visible_posts(query).with_entities(RecordBundle(
+        PostRecord, Post.id, Resub.name, Post.title, Post.url, Post.content, User.username, Post.created, Post.edited,
+        Post.score, Post.upvotes, Post.downvotes, Post.hot_rank, Post.rising_rank))
+
+
+def comment_records(query: Query) -> Query:
+    """Select comment records instead of comments in a query of comments."""
+    return visible_comments(query).with_entities(RecordBundle(
+        CommentRecord, Comment.id, Resub.name, Comment.parent_post_id, Comment.parent_comment_id, Comment.content,
+        User.username, Comment.created, Comment.edited, Comment.score, Comment.upvotes, Comment.downvotes))
+
+
+def resub_records(query: Query) -> Query:
+    """Select resub records instead of resubs in a query of resubs."""
+    return query.join(Resub.owner).filter(Resub.deleted.is_(None)).with_entities(RecordBundle(
+        ResubRecord, Resub.id, Resub.name, Resub.description, User.username, Resub.created, Resub.edited))
@@ -0,0 +1,73 @@
+"""Periodic background tasks.
+
+Every worker runs the tasks, so a task must be safe to run concurrently
+with the same task in other workers.
+"""
+
+import asyncio
+import logging
+from typing import Callable, List
+
+from fastapi.concurrency import run_in_threadpool
+
+from repost import crud, config
+from repost.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+_running: List[asyncio.Task] = []
+
+
+async def _run_periodically(task: Callable[[], None], interval: float):
+    """Run the task in the threadpool every interval seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(task)
+        except Exception:
+            logger.exception(f'Periodic task {task.__name__} failed')
+
+
+def refresh_rising_ranks():
+    """Refresh the ranks of posts that decay over time."""
+    db = SessionLocal()
+    try:
+        crud.refresh_rising_ranks(db)
+    finally:
+        db.close()
+
+
+def flush_votes():
+    """Write the votes buffered by write-behind."""
+    db = SessionLocal()
+    try:
+        crud.flush_votes(db)
+    finally:
+        db.close()
+
+
+def purge_deleted():
+    """Purge the rows of deleted resubs and users in chunks."""
+    db = SessionLocal()
+    try:
+        crud.purge_deleted(db)
+    finally:
+        db.close()
+
+
+async def start_tasks():
+    """Start every periodic task."""
+    _running.append(asyncio.ensure_future(_run_periodically(refresh_rising_ranks, config.ranking_interval)))
+    _running.append(asyncio.ensure_future(_run_periodically(purge_deleted, config.purge_interval)))
+    if config.vote_write_behind:
+        _running.append(asyncio.ensure_future(_run_periodically(flush_votes, config.vote_flush_interval)))
+
+
+async def stop_tasks():
+    """Stop every periodic task, and write the votes that are left."""
+    for task in _running:
+        task.cancel()
+
+    _running.clear()
+    if config.vote_write_behind:
+        await run_in_threadpool(flush_votes)
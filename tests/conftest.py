@@ -0,0 +1,77 @@
+"""Shared setup of the tests, which run against a temporary SQLite file.
+
+The config is read once when repost is imported, so the environment is
+set before any test module imports it. Caches and write-behind are
+disabled, so that every request reads the database, and tests that need
+them enable them with `monkeypatch`.
+"""
+
+import os
+import shutil
+import tempfile
+from itertools import count
+
+import pytest
+
+_directory = tempfile.mkdtemp()
+os.environ['REPOST_DATABASE_URL'] = f'sqlite:///{_directory}/repost.db'
+os.environ['REPOST_RESPONSE_CACHE'] = 'none'
+os.environ['REPOST_AUTH_CACHE_TTL'] = '0'
+os.environ['REPOST_VOTE_WRITE_BEHIND'] = 'false'
+
+# The config writes its defaults to config.env in the working directory
+_cwd = os.getcwd()
+os.chdir(_directory)
+try:
+    from repost import cache, crud, models
+    from repost.api import caching
+    from repost.database import SessionLocal
+finally:
+    os.chdir(_cwd)
+
+_names = count(1)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_directory, ignore_errors=True)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def unique():
+    """Get a function that makes names unique across the tests, which
+    share the database, and apart from the names of the query budget
+    fixture.
+    """
+    return lambda prefix: f'{prefix}_{next(_names)}'
+
+
+@pytest.fixture
+def resub(db, unique) -> models.Resub:
+    """A resub owned by a new user."""
+    owner = models.User(username=unique('owner'), hashed_password='')
+    db.add(owner)
+    db.commit()
+    return crud.create_resub(db, owner_id=owner.id, name=unique('r'), description='Resub')
+
+
+@pytest.fixture
+def cache_backend():
+    """Backend of the response cache."""
+    return cache.MemoryBackend(maxsize=100)
+
+
+@pytest.fixture
+def response_cache(monkeypatch, cache_backend) -> cache.ResponseCache:
+    """Cache responses in the cache backend."""
+    monkeypatch.setitem(cache.caches, 'responses', None)
+    response_cache = cache.ResponseCache('responses', cache_backend)
+    for module in (cache, caching):
+        monkeypatch.setattr(module, 'response_cache', response_cache)
+    return response_cache
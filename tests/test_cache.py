@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+
+import pytest
+from starlette.testclient import TestClient
+
+from repost import app, cache, crud, models
+from repost.cache import deletions_tag
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def cache_backend(request, monkeypatch):
+    """Every backend of the response cache, where Redis is faked in
+    memory.
+    """
+    if request.param == 'memory':
+        return cache.MemoryBackend(maxsize=100)
+
+    import redis
+
+    monkeypatch.setattr(redis.Redis, 'from_url', lambda url: fakeredis.FakeRedis())
+    return cache.RedisBackend('redis://localhost:6379/0')
+
+
+@pytest.fixture
+def invalidated(monkeypatch, response_cache):
+    """Tags invalidated in the response cache."""
+    tags = set()
+    invalidate = response_cache.backend.invalidate
+
+    def record(invalidated_tags):
+        invalidated_tags = list(invalidated_tags)
+        tags.update(invalidated_tags)
+        invalidate(invalidated_tags)
+
+    monkeypatch.setattr(response_cache.backend, 'invalidate', record)
+    return tags
+
+
+@pytest.fixture
+def world(db, unique, resub):
+    """A resub with a post and a comment, and a user who is in none of
+    them.
+    """
+    owner = db.query(models.User).filter_by(id=resub.owner_id).one()
+    user = crud.create_user(db, username=unique('user'), hashed_password='')
+    post = crud.create_post(db, author_id=owner.id, parent_resub_id=resub.id, title='Post')
+    comment = crud.create_comment(db, author_id=owner.id, parent_post_id=post.id, parent_resub_id=resub.id,
+                                  content='Comment')
+    return SimpleNamespace(owner=owner.username, user_id=user.id, user=user.username, resub_id=resub.id,
+                           resub=resub.name, post_id=post.id, comment_id=comment.id)
+
+
+# Write in the world, and the tags it must invalidate
+writes = {
+    'create_user': (lambda db, w: crud.create_user(db, username=f'{w.user}_new', hashed_password=''),
+                    lambda w: {f'user:{w.user}_new'}),
+    'update_user': (lambda db, w: crud.update_user(db, username=w.user, bio='Bio'), lambda w: {f'user:{w.user}'}),
+    'delete_user': (lambda db, w: crud.delete_user(db, username=w.user), lambda w: {f'user:{w.user}', deletions_tag}),
+    'delete_resub_owner': (lambda db, w: crud.delete_user(db, username=w.owner),
+                           lambda w: {f'user:{w.owner}', f'resub:{w.resub}', deletions_tag}),
+    'create_resub': (lambda db, w: crud.create_resub(db, owner_id=w.user_id, name=f'{w.resub}_new', description=''),
+                     lambda w: {f'resub:{w.resub}_new'}),
+    'update_resub': (lambda db, w: crud.update_resub(db, name=w.resub, description='Edited'),
+                     lambda w: {f'resub:{w.resub}'}),
+    'delete_resub': (lambda db, w: crud.delete_resub(db, name=w.resub), lambda w: {f'resub:{w.resub}', deletions_tag}),
+    'create_post': (lambda db, w: crud.create_post(db, author_id=w.user_id, parent_resub_id=w.resub_id, title='New'),
+                    lambda w: {f'resub-posts:{w.resub}'}),
+    'update_post': (lambda db, w: crud.update_post(db, post_id=w.post_id, title='Edited'),
+                    lambda w: {f'post:{w.post_id}', f'resub-posts:{w.resub}'}),
+    'delete_post': (lambda db, w: crud.delete_post(db, post_id=w.post_id),
+                    lambda w: {f'post:{w.post_id}', f'resub-posts:{w.resub}'}),
+    'vote_post': (lambda db, w: crud.vote_post(db, post_id=w.post_id, author_id=w.user_id, vote=1),
+                  lambda w: {f'post:{w.post_id}', f'resub-posts:{w.resub}'}),
+    'vote_batch': (lambda db, w: crud.vote_batch(db, author_id=w.user_id, post_votes={w.post_id: -1},
+                                                 comment_votes={w.comment_id: 1}),
+                   lambda w: {f'post:{w.post_id}', f'resub-posts:{w.resub}'}),
+    # No cached responses include comments
+    'create_comment': (lambda db, w: crud.create_comment(db, author_id=w.user_id, parent_post_id=w.post_id,
+                                                         parent_resub_id=w.resub_id, content='New'),
+                       lambda w: set()),
+    'update_comment': (lambda db, w: crud.update_comment(db, w.comment_id, content='Edited'), lambda w: set()),
+    'delete_comment': (lambda db, w: crud.delete_comment(db, w.comment_id), lambda w: set()),
+    'vote_comment': (lambda db, w: crud.vote_comment(db, comment_id=w.comment_id, author_id=w.user_id, vote=1),
+                     lambda w: set()),
+}
+
+
+@pytest.mark.parametrize('write', list(writes))
+def test_writes_invalidate_their_tags(db, world, invalidated, write):
+    write, tags = writes[write]
+    invalidated.clear()
+    write(db, world)
+    assert invalidated == tags(world)
+
+
+def test_entry_invalidated_before_it_is_set_is_not_served(response_cache, unique):
+    tag, key = unique('tag'), unique('key')
+    entry = {'status': 200, 'headers': [], 'body': ''}
+
+    # The tag is invalidated while the response is created
+    tag_versions = response_cache.miss([tag])
+    response_cache.invalidate([tag])
+    response_cache.set(key, {**entry, 'tags': tag_versions}, ttl=60)
+    assert response_cache.get(key) is None
+
+    tag_versions = response_cache.miss([tag])
+    response_cache.set(key, {**entry, 'tags': tag_versions}, ttl=60)
+    assert response_cache.get(key) is not None
+
+    response_cache.invalidate([unique('tag')])
+    assert response_cache.get(key) is not None
+    response_cache.invalidate([tag])
+    assert response_cache.get(key) is None
+
+
+def test_edited_post_is_not_served_from_cache(db, world, response_cache):
+    client = TestClient(app)
+    urls = [f'/api/posts/{world.post_id}', f'/api/resubs/{world.resub}/posts']
+    for url in urls:
+        assert client.get(url).headers['X-Cache'] == 'MISS'
+        assert client.get(url).headers['X-Cache'] == 'HIT'
+
+    crud.update_post(db, post_id=world.post_id, title='Edited')
+    post = client.get(urls[0])
+    assert post.headers['X-Cache'] == 'MISS'
+    assert post.json()['title'] == 'Edited'
+    assert client.get(urls[1]).json()[0]['title'] == 'Edited'
+    assert client.get(urls[0]).headers['X-Cache'] == 'HIT'
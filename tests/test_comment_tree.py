@@ -0,0 +1,112 @@
+import pytest
+from starlette.testclient import TestClient
+
+from repost import app, crud, models
+from repost.crud.comments import comment_path
+
+
+@pytest.fixture
+def thread(db, resub):
+    """A post with a chain of six comments, each replying to the last."""
+    post = crud.create_post(db, author_id=resub.owner_id, parent_resub_id=resub.id, title='Post')
+    comment_ids = []
+    for _ in range(6):
+        comment = crud.create_comment(db, author_id=resub.owner_id, parent_post_id=post.id, parent_resub_id=resub.id,
+                                      parent_comment_id=comment_ids[-1] if comment_ids else None, content='Comment')
+        comment_ids.append(comment.id)
+    return post.id, comment_ids
+
+
+def chain(trees):
+    """Get the IDs along the first replies of a tree, and the more_replies
+    of the last one.
+    """
+    ids = []
+    while trees:
+        ids.append(trees[0]['id'])
+        more_replies = trees[0]['more_replies']
+        trees = trees[0]['replies']
+    return ids, more_replies
+
+
+@pytest.mark.parametrize('depth', [1, 2, 3])
+def test_trees_count_levels_of_replies_alike(thread, depth):
+    post_id, comment_ids = thread
+    client = TestClient(app)
+
+    # The post tree has the top level comment and depth levels of replies
+    response = client.get(f'/api/posts/{post_id}/comments/tree', params={'depth': depth})
+    assert response.status_code == 200
+    assert chain(response.json()) == (comment_ids[:depth + 1], 1)
+
+    # The tree of a comment has depth levels of replies to it, wherever it is
+    for parent in (0, 1):
+        response = client.get(f'/api/comments/{comment_ids[parent]}/tree', params={'depth': depth})
+        assert response.status_code == 200
+        assert chain(response.json()) == (comment_ids[parent + 1:parent + depth + 1], 1)
+
+
+def threads(db, comment_ids):
+    """Get the parent, path, depth and edited time of the comments."""
+    db.expire_all()
+    comments = db.query(models.Comment).filter(models.Comment.id.in_(comment_ids))
+    return {comment.id: (comment.parent_comment_id, comment.path, comment.depth, comment.edited)
+            for comment in comments}
+
+
+def test_deleting_comment_moves_replies_to_top_level(db, thread):
+    post_id, comment_ids = thread
+    crud.delete_comment(db, comment_ids[1])
+
+    first, second = comment_path(comment_ids[2]), comment_path(comment_ids[3], comment_path(comment_ids[2]))
+    assert threads(db, comment_ids[2:4]) == {comment_ids[2]: (None, first, 0, None),
+                                             comment_ids[3]: (comment_ids[2], second, 1, None)}
+
+    response = TestClient(app).get(f'/api/posts/{post_id}/comments/tree', params={'depth': 1})
+    assert [(tree['id'], [reply['id'] for reply in tree['replies']]) for tree in response.json()] == [
+        (comment_ids[0], []), (comment_ids[2], [comment_ids[3]])]
+
+
+def test_purging_user_moves_replies_to_top_level(db, unique, resub, thread):
+    post_id, comment_ids = thread
+    user = crud.create_user(db, username=unique('purged'), hashed_password='')
+    comment = crud.create_comment(db, author_id=user.id, parent_post_id=post_id, parent_resub_id=resub.id,
+                                  parent_comment_id=comment_ids[0], content='Comment')
+    reply = crud.create_comment(db, author_id=resub.owner_id, parent_post_id=post_id, parent_resub_id=resub.id,
+                                parent_comment_id=comment.id, content='Reply')
+    comment_id, reply_id = comment.id, reply.id
+    crud.delete_user(db, username=user.username)
+    crud.purge_deleted(db)
+
+    assert threads(db, [comment_id, reply_id]) == {reply_id: (None, comment_path(reply_id), 0, None)}
+
+
+def test_tree_pages_are_limited_in_the_query(db, unique, resub):
+    post = crud.create_post(db, author_id=resub.owner_id, parent_resub_id=resub.id, title='Post')
+    deleted = crud.create_user(db, username=unique('deleted'), hashed_password='')
+
+    def comment(parent_id=None, author_id=resub.owner_id):
+        return crud.create_comment(db, author_id=author_id, parent_post_id=post.id, parent_resub_id=resub.id,
+                                   parent_comment_id=parent_id, content='Comment').id
+
+    a, b, c = comment(), comment(), comment()
+    a1, a2, a3 = comment(a), comment(a), comment(a)
+    a1x, a3x = comment(a1), comment(a3)
+    b1, b2 = comment(b, deleted.id), comment(b)
+    crud.delete_user(db, username=deleted.username)
+
+    # Comments past the limit of their level, and their replies, are not loaded
+    rows = crud.get_comment_tree(db, post_id=post.id, depth=1, limit=2)
+    assert {comment.id for comment, _ in rows} == {a, b, a1, a2, b1, b2, a1x}
+
+    response = TestClient(app).get(f'/api/posts/{post.id}/comments/tree', params={'depth': 1, 'limit': 2})
+    trees = [(tree['id'], tree['more_replies'], [(reply['id'], reply['more_replies']) for reply in tree['replies']])
+             for tree in response.json()]
+    assert trees == [(a, 1, [(a1, 1), (a2, 0)]), (b, 0, [(b2, 0)])]
+
+    rows = crud.get_comment_tree(db, post_id=post.id, depth=1, limit=2, offset=2)
+    assert [comment.id for comment, _ in rows] == [c]
+
+    parent = db.query(models.Comment).filter_by(id=a).one()
+    rows = crud.get_comment_tree(db, post_id=post.id, parent=parent, depth=1, limit=1, offset=2)
+    assert [comment.id for comment, _ in rows] == [a3, a3x]
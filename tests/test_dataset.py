@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from repost import crud, models
+from repost.crud.comments import comment_path
+from repost.dataset import DatasetError, import_dataset
+
+
+def lines(*items):
+    return [json.dumps({'type': item_type, 'data': data}) for item_type, data in items]
+
+
+@pytest.fixture
+def existing(db, resub):
+    """A post with a score that does not match its votes, and a newer post
+    with a comment.
+    """
+    other = crud.create_post(db, author_id=resub.owner_id, parent_resub_id=resub.id, title='Other')
+    post = crud.create_post(db, author_id=resub.owner_id, parent_resub_id=resub.id, title='Post')
+    comment = crud.create_comment(db, author_id=resub.owner_id, parent_post_id=post.id, parent_resub_id=resub.id,
+                                  content='Comment')
+    db.query(models.Post).filter_by(id=other.id).update({models.Post.score: 7}, synchronize_session=False)
+    db.commit()
+    return post.id, comment.id, comment.path, other.id
+
+
+def test_import_computes_only_imported_items(db, unique, resub, existing):
+    post_id, comment_id, path, other_id = existing
+    username, word = unique('imported'), unique('word')
+    loader = crud.BulkLoader(db, password='password')
+    first_post_id, first_comment_id = loader.next_id(models.Post), loader.next_id(models.Comment)
+    import_dataset(loader, lines(
+        ('user', {'username': username}),
+        ('post', {'parent_resub_name': resub.name, 'author_username': username, 'title': f'Post with {word}'}),
+        ('comment', {'parent_resub_name': resub.name, 'parent_post_id': first_post_id, 'author_username': username,
+                     'content': 'Comment'}),
+        ('comment', {'parent_resub_name': resub.name, 'parent_post_id': first_post_id, 'author_username': username,
+                     'parent_comment_id': first_comment_id, 'content': 'Reply'}),
+        ('comment', {'parent_resub_name': resub.name, 'parent_post_id': post_id, 'author_username': username,
+                     'parent_comment_id': comment_id, 'content': 'Reply'}),
+        ('vote', {'post_id': first_post_id, 'author_username': username, 'vote': 1}),
+        ('vote', {'post_id': post_id, 'author_username': username, 'vote': -1}),
+        ('vote', {'comment_id': comment_id, 'author_username': username, 'vote': 1}),
+    ))
+
+    # Paths are computed below imported and existing parents
+    db.expire_all()
+    comments = {comment.id: (comment.path, comment.depth) for comment in db.query(models.Comment).filter(
+        models.Comment.id >= first_comment_id)}
+    first_path = comment_path(first_comment_id)
+    assert comments == {first_comment_id: (first_path, 0),
+                        first_comment_id + 1: (comment_path(first_comment_id + 1, first_path), 1),
+                        first_comment_id + 2: (comment_path(first_comment_id + 2, path), 1)}
+
+    # Scores are computed from the first voted or imported item on
+    scores = dict(db.query(models.Post.id, models.Post.score).filter(models.Post.id.in_(
+        [first_post_id, post_id, other_id])))
+    assert scores == {first_post_id: 1, post_id: -1, other_id: 7}
+    assert db.query(models.Comment.score).filter_by(id=comment_id).scalar() == 1
+    assert db.query(models.Post.hot_rank).filter_by(id=first_post_id).scalar() > 0
+
+    assert [record.id for record, _ in crud.search_posts(db, query=word)] == [first_post_id]
+
+
+def test_import_rejects_unknown_parent_comment(db, unique, resub, existing):
+    post_id, comment_id, _, _ = existing
+    username = unique('imported')
+    with pytest.raises(DatasetError, match="Line 2: Missing or unknown 'parent_comment_id' in comment"):
+        import_dataset(crud.BulkLoader(db, password='password'), lines(
+            ('user', {'username': username}),
+            ('comment', {'parent_resub_name': resub.name, 'parent_post_id': post_id, 'author_username': username,
+                         'parent_comment_id': comment_id + 1000, 'content': 'Reply'}),
+        ))
+
+
+def test_rebuild_comment_paths_in_batches(db, resub, existing):
+    post_id, comment_id, _, _ = existing
+    reply = crud.create_comment(db, author_id=resub.owner_id, parent_post_id=post_id, parent_resub_id=resub.id,
+                                parent_comment_id=comment_id, content='Reply')
+    expected = {comment_id: (comment_path(comment_id), 0),
+                reply.id: (comment_path(reply.id, comment_path(comment_id)), 1)}
+    db.query(models.Comment).filter(models.Comment.parent_post_id == post_id).update(
+        {models.Comment.path: None, models.Comment.depth: 0}, synchronize_session=False)
+    db.commit()
+
+    crud.rebuild_comment_paths(db, batch_size=1)
+    db.expire_all()
+    assert {comment.id: (comment.path, comment.depth)
+            for comment in db.query(models.Comment).filter_by(parent_post_id=post_id)} == expected
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from starlette.testclient import TestClient
+
+from repost import app, config, crud, models
+from repost.cache import TTLCache
+from repost.password import password_context
+
+password = 'password'
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def login(db, client, unique):
+    """Get a function that creates a user, with a unique or the given
+    username, and gets the user and its authorization header.
+    """
+    hashed_password = password_context.hash(password)
+
+    def create(prefix: str, username: str = None):
+        user = crud.create_user(db, username=username or unique(prefix), hashed_password=hashed_password)
+        response = client.post('/api/auth/token', data={'username': user.username, 'password': password,
+                                                        'client_id': config.client_id})
+        return user, {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+    return create
+
+
+def test_comments_in_posts_of_deleted_users_are_hidden(db, client, login, resub, unique):
+    poster, poster_auth = login('poster')
+    commenter, commenter_auth = login('commenter')
+    post = crud.create_post(db, author_id=poster.id, parent_resub_id=resub.id, title='Post')
+    word = unique('word')
+    comment = crud.create_comment(db, author_id=commenter.id, parent_post_id=post.id, parent_resub_id=resub.id,
+                                  content=f'Comment with {word}')
+    comment_id = comment.id
+
+    assert client.get('/api/comments/', params={'ids': comment_id}).json() != []
+    assert client.delete('/api/users/me', headers=poster_auth).status_code == 204
+
+    assert client.get('/api/comments/', params={'ids': comment_id}).json() == []
+    assert client.get(f'/api/users/{commenter.username}/comments').json() == []
+    assert client.get('/api/search/', params={'q': word, 'type': 'comment'}).json() == []
+    assert client.get(f'/api/comments/{comment_id}/tree').status_code == 404
+    assert client.post(f'/api/comments/{comment_id}', json={'content': 'Reply'},
+                       headers=commenter_auth).status_code == 404
+    assert client.patch(f'/api/comments/{comment_id}/vote/1', headers=commenter_auth).status_code == 404
+
+    response = client.post('/api/votes/batch', json={'comments': [{'id': comment_id, 'vote': 1}]},
+                           headers=commenter_auth)
+    assert response.status_code == 204
+    db.expire_all()
+    assert db.query(models.CommentVote).filter_by(comment_id=comment_id).count() == 0
+    assert db.query(models.Comment.score).filter_by(id=comment_id).scalar() == 0
+
+
+@pytest.mark.parametrize('deleted', ['resub', 'author'])
+def test_deleting_invalidates_cached_posts(db, client, login, response_cache, unique, deleted):
+    owner, owner_auth = login('owner')
+    author, author_auth = login('author')
+    resub = crud.create_resub(db, owner_id=owner.id, name=unique('r'), description='Resub')
+    post = crud.create_post(db, author_id=author.id, parent_resub_id=resub.id, title='Post')
+    other_resub = crud.create_resub(db, owner_id=owner.id, name=unique('r'), description='Resub')
+    other_post = crud.create_post(db, author_id=author.id, parent_resub_id=other_resub.id, title='Post')
+
+    first = client.get(f'/api/posts/{post.id}')
+    assert first.headers['X-Cache'] == 'MISS'
+    etag = first.headers['ETag']
+    assert client.get(f'/api/posts/{post.id}').headers['X-Cache'] == 'HIT'
+    assert len(client.get(f'/api/resubs/{other_resub.name}/posts').json()) == 1
+
+    if deleted == 'resub':
+        assert client.delete(f'/api/resubs/{resub.name}', headers=owner_auth).status_code == 204
+    else:
+        assert client.delete('/api/users/me', headers=author_auth).status_code == 204
+
+    assert client.get(f'/api/posts/{post.id}').status_code == 404
+    assert client.get(f'/api/posts/{post.id}', headers={'If-None-Match': etag}).status_code == 404
+    if deleted == 'author':
+        assert client.get(f'/api/posts/{other_post.id}').status_code == 404
+        assert client.get(f'/api/resubs/{other_resub.name}/posts').json() == []
+
+
+@pytest.mark.parametrize('deleted', ['resub', 'commenter'])
+def test_deleting_changes_comments_etags(db, client, login, unique, deleted):
+    owner, owner_auth = login('owner')
+    commenter, commenter_auth = login('commenter')
+    resub = crud.create_resub(db, owner_id=owner.id, name=unique('r'), description='Resub')
+    post = crud.create_post(db, author_id=owner.id, parent_resub_id=resub.id, title='Post')
+    comment = crud.create_comment(db, author_id=owner.id, parent_post_id=post.id, parent_resub_id=resub.id,
+                                  content='Comment')
+    crud.create_comment(db, author_id=commenter.id, parent_post_id=post.id, parent_resub_id=resub.id,
+                        parent_comment_id=comment.id, content='Reply')
+    urls = [f'/api/posts/{post.id}/comments', f'/api/comments/{comment.id}/tree']
+    etags = {url: client.get(url).headers['ETag'] for url in urls}
+    assert len(client.get(urls[0]).json()) == 2
+
+    if deleted == 'resub':
+        assert client.delete(f'/api/resubs/{resub.name}', headers=owner_auth).status_code == 204
+        for url in urls:
+            assert client.get(url, headers={'If-None-Match': etags[url]}).status_code == 404
+    else:
+        assert client.delete('/api/users/me', headers=commenter_auth).status_code == 204
+        for url in urls:
+            response = client.get(url, headers={'If-None-Match': etags[url]})
+            assert response.status_code == 200
+            assert response.headers['ETag'] != etags[url]
+        assert len(client.get(urls[0]).json()) == 1
+
+
+def test_recycled_username_resolves_to_its_new_user(db, client, login, monkeypatch):
+    identities = TTLCache('identities', maxsize=100, ttl=60)
+    monkeypatch.setattr(crud.users, 'identity_cache', identities)
+    user, auth = login('recycled')
+    username = user.username
+    # A newer user, so that SQLite does not use the ID of the user again
+    login('newer')
+    assert client.get('/api/users/me', headers=auth).status_code == 200
+
+    # Another worker deletes the user, so this worker keeps its identity,
+    # and the username is not purged until the identity expires
+    monkeypatch.setattr(identities, 'pop', lambda key: None)
+    crud.delete_user(db, username=username)
+    monkeypatch.setattr(config, 'auth_cache_ttl', 60)
+    crud.purge_deleted(db)
+    assert db.query(models.User).filter_by(username=username).count() == 1
+
+    monkeypatch.setattr(config, 'auth_cache_ttl', 0)
+    crud.purge_deleted(db)
+    new_user, new_auth = login('recycled', username=username)
+    response = client.post('/api/resubs/', json={'name': f'{username}_resub', 'description': 'Resub'},
+                           headers=new_auth)
+    assert response.status_code == 201
+    assert db.query(models.Resub.owner_id).filter_by(name=f'{username}_resub').scalar() == new_user.id
+
+
+def test_tokens_issued_before_their_user_are_rejected(db, client, login):
+    user, auth = login('early')
+    assert client.get('/api/users/me', headers=auth).status_code == 200
+
+    def get_me(**claims):
+        token = jwt.encode({'sub': user.username, 'exp': datetime.utcnow() + timedelta(days=1), 'scopes': ['user'],
+                            **claims}, config.jwt_secret, algorithm=config.jwt_algorithm).decode()
+        return client.get('/api/users/me', headers={'Authorization': f'Bearer {token}'})
+
+    assert get_me(uid=user.id, iat=datetime.utcnow() - timedelta(minutes=1)).status_code == 401
+    assert get_me(iat=datetime.utcnow()).status_code == 401
+    assert get_me(uid=user.id, iat=datetime.utcnow()).status_code == 200
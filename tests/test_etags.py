@@ -0,0 +1,32 @@
+from starlette.testclient import TestClient
+
+from repost import app, crud
+
+
+def test_cached_post_is_not_modified_after_write_during_request(db, monkeypatch, resub, response_cache):
+    post = crud.create_post(db, author_id=resub.owner_id, parent_resub_id=resub.id, title='Post')
+    client = TestClient(app)
+    etag = client.get(f'/api/posts/{post.id}').headers['ETag']
+    response_cache.invalidate([f'post:{post.id}'])
+
+    # The post is edited once the next request has read its ETag
+    get_post_version = crud.get_post_version
+
+    def get_version_then_edit(db, *, post_id):
+        version = get_post_version(db, post_id=post_id)
+        monkeypatch.setattr(crud, 'get_post_version', get_post_version)
+        crud.update_post(db, post_id=post_id, title='Edited')
+        return version
+
+    monkeypatch.setattr(crud, 'get_post_version', get_version_then_edit)
+    response = client.get(f'/api/posts/{post.id}')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.headers['ETag'] == etag
+
+    # The entry stored with the old ETag is invalid, so the client holding
+    # the old post gets the edited one
+    response = client.get(f'/api/posts/{post.id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.headers['ETag'] != etag
+    assert response.json()['title'] == 'Edited'
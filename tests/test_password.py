@@ -0,0 +1,29 @@
+import asyncio
+
+from starlette.testclient import TestClient
+
+from repost import app, config, password
+from repost.password import PasswordPoolFull, hash_password, verify_password
+
+
+def test_pool_rejects_passwords_over_its_size(monkeypatch):
+    monkeypatch.setattr(config, 'password_workers', 1)
+    monkeypatch.setattr(config, 'password_queue_size', 1)
+
+    async def hash_at_once():
+        return await asyncio.gather(*(hash_password('password') for _ in range(3)), return_exceptions=True)
+
+    first, second, third = asyncio.run(hash_at_once())
+    assert asyncio.run(verify_password('password', first))
+    assert isinstance(second, str)
+    assert isinstance(third, PasswordPoolFull)
+    assert password._pending == 0
+
+
+def test_full_pool_responds_service_unavailable(monkeypatch, unique):
+    monkeypatch.setattr(config, 'password_workers', 0)
+    monkeypatch.setattr(config, 'password_queue_size', 0)
+
+    response = TestClient(app).post('/api/users/', json={'username': unique('user'), 'password': 'password'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
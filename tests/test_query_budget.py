@@ -0,0 +1,245 @@
+"""Check the number of SQL statements of every route of the API.
+
+Calls every route in `repost.api.api_router` with a small dataset, grows
+the dataset, and calls every route again. A route fails when it issues
+more statements than its budget, or when its number of statements
+changes with the size of the data, which usually means an N+1 query
+through a lazy relationship. Failures list the statements of the route.
+
+Caches are disabled by the test config, so that every route is measured
+at its worst.
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+import pytest
+from sqlalchemy import event
+from starlette.testclient import TestClient
+
+from repost import app, config, crud, models
+from repost.api import api_router
+from repost.database import SessionLocal, engine, reader
+from repost.password import password_context
+
+# Number of items added around the fixture before each run
+sizes = (1, 10, 50)
+
+password = 'password'
+
+
+class Fixture:
+    """Users, a resub, a post and comments that routes are called for.
+
+    Growing the fixture adds users, resubs, posts, comments and votes
+    around the same items, so the same requests read more data. Every new
+    post gets a comment, and batch votes are on all of them, so that they
+    write to more posts as the fixture grows.
+    """
+
+    def __init__(self, client: TestClient):
+        self.client = client
+        self.db = SessionLocal()
+        self._count = 0
+
+        self.hashed_password = password_context.hash(password)
+        self.alice = crud.create_user(self.db, username='alice', hashed_password=self.hashed_password)
+        self.bob = crud.create_user(self.db, username='bob', hashed_password=self.hashed_password)
+        self.alice_auth = self.login('alice')
+        self.bob_auth = self.login('bob')
+
+        self.resub = crud.create_resub(self.db, owner_id=self.alice.id, name='budget', description='Budget resub')
+        self.post = self.new_post(self.bob)
+        self.comment = self.new_comment(self.bob)
+        self.reply = self.new_comment(self.alice, parent=self.comment)
+        self.posts = [self.post]
+        self.comments = [self.comment]
+
+    def unique(self, prefix: str) -> str:
+        self._count += 1
+        return f'{prefix}{self._count}'
+
+    def login(self, username: str) -> Dict[str, Any]:
+        response = self.client.post('/api/auth/token', data={'username': username, 'password': password,
+                                                             'client_id': config.client_id})
+        return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+    def new_user(self) -> Dict[str, Any]:
+        """Create a user, and get its authorization header."""
+        user = crud.create_user(self.db, username=self.unique('user'), hashed_password=self.hashed_password)
+        return self.login(user.username)
+
+    def new_resub(self) -> models.Resub:
+        return crud.create_resub(self.db, owner_id=self.alice.id, name=self.unique('resub'), description='Resub')
+
+    def new_post(self, author: models.User = None) -> models.Post:
+        return crud.create_post(self.db, author_id=(author or self.alice).id, parent_resub_id=self.resub.id,
+                                title=self.unique('Post '), content='Content')
+
+    def new_comment(self, author: models.User = None, parent: models.Comment = None,
+                    post: models.Post = None) -> models.Comment:
+        return crud.create_comment(self.db, author_id=(author or self.alice).id, parent_resub_id=self.resub.id,
+                                   parent_post_id=(post or self.post).id, parent_comment_id=parent and parent.id,
+                                   content='Comment')
+
+    def grow(self, size: int):
+        """Add the given number of voters, resubs, posts, comments and
+        replies around the fixture's items.
+        """
+        loader = crud.BulkLoader(self.db, password=password)
+        voters = [loader.add_user(self.unique('voter')) for _ in range(size)]
+        loader.finish()
+
+        for voter_id in voters:
+            crud.vote_post(self.db, post_id=self.post.id, author_id=voter_id, vote=1)
+            crud.vote_comment(self.db, comment_id=self.comment.id, author_id=voter_id, vote=1)
+
+        parent = self.reply
+        for i in range(size):
+            self.new_resub()
+            post = self.new_post(self.bob if i % 2 else self.alice)
+            self.posts.append(post)
+            self.comments.append(self.new_comment(self.alice, post=post))
+            self.new_comment(self.bob)
+            parent = self.new_comment(self.bob if i % 2 else self.alice, parent=parent)
+
+        self.db.expire_all()
+
+
+class Route(NamedTuple):
+    """Budget of a route, and how to build a request for it."""
+    budget: int
+    request: Callable[[Fixture], Dict[str, Any]]
+
+
+def _get(path: str, **kwargs: Any) -> Callable[[Fixture], Dict[str, Any]]:
+    return lambda fixture: {'url': path.format(fixture=fixture), **kwargs}
+
+
+# Maximum number of statements of every route, by method and route path
+routes: Dict[Tuple[str, str], Route] = {
+    ('POST', '/auth/token'): Route(1, lambda f: {'url': '/api/auth/token', 'data': {
+        'username': 'alice', 'password': password, 'client_id': config.client_id}}),
+    ('POST', '/users/'): Route(3, lambda f: {
+        'url': '/api/users/', 'json': {'username': f.unique('new'), 'password': password}}),
+    ('GET', '/users/me'): Route(2, lambda f: {'url': '/api/users/me', 'headers': f.alice_auth}),
+    ('PATCH', '/users/me'): Route(3, lambda f: {
+        'url': '/api/users/me', 'json': {'bio': 'Bio'}, 'headers': f.alice_auth}),
+    ('DELETE', '/users/me'): Route(8, lambda f: {'url': '/api/users/me', 'headers': f.new_user()}),
+    ('GET', '/users/{username}'): Route(1, _get('/api/users/alice')),
+    ('GET', '/users/{username}/resubs'): Route(2, _get('/api/users/alice/resubs')),
+    ('GET', '/users/{username}/posts'): Route(2, _get('/api/users/alice/posts')),
+    ('GET', '/users/{username}/comments'): Route(2, _get('/api/users/alice/comments')),
+    ('GET', '/users/{username}/export'): Route(3, _get('/api/users/alice/export')),
+    ('GET', '/resubs/'): Route(1, _get('/api/resubs/')),
+    ('POST', '/resubs/'): Route(4, lambda f: {'url': '/api/resubs/', 'headers': f.alice_auth, 'json': {
+        'name': f.unique('created'), 'description': 'Resub'}}),
+    ('GET', '/resubs/{resub}'): Route(1, _get('/api/resubs/budget')),
+    ('DELETE', '/resubs/{resub}'): Route(4, lambda f: {
+        'url': f'/api/resubs/{f.new_resub().name}', 'headers': f.alice_auth}),
+    ('PATCH', '/resubs/{resub}'): Route(4, lambda f: {
+        'url': '/api/resubs/budget', 'json': {'description': 'Edited'}, 'headers': f.alice_auth}),
+    ('GET', '/resubs/{resub}/posts'): Route(2, _get('/api/resubs/budget/posts', params={'sort': 'hot'})),
+    ('GET', '/resubs/{resub}/export'): Route(3, _get('/api/resubs/budget/export')),
+    ('POST', '/resubs/{resub}/posts'): Route(5, lambda f: {
+        'url': '/api/resubs/budget/posts', 'json': {'title': 'Created'}, 'headers': f.alice_auth}),
+    ('GET', '/posts/'): Route(1, lambda f: {
+        'url': '/api/posts/', 'params': [('ids', f.post.id), ('ids', f.post.id + 1)]}),
+    ('GET', '/posts/{post_id}'): Route(2, _get('/api/posts/{fixture.post.id}')),
+    ('DELETE', '/posts/{post_id}'): Route(7, lambda f: {
+        'url': f'/api/posts/{f.new_post().id}', 'headers': f.alice_auth}),
+    ('PATCH', '/posts/{post_id}'): Route(5, lambda f: {
+        'url': f'/api/posts/{f.post.id}', 'json': {'content': 'Edited'}, 'headers': f.bob_auth}),
+    ('PATCH', '/posts/{post_id}/vote/{vote}'): Route(9, lambda f: {
+        'url': f'/api/posts/{f.post.id}/vote/1', 'headers': f.new_user()}),
+    ('GET', '/posts/{post_id}/comments'): Route(3, _get('/api/posts/{fixture.post.id}/comments')),
+    ('GET', '/posts/{post_id}/comments/tree'): Route(4, _get('/api/posts/{fixture.post.id}/comments/tree')),
+    ('POST', '/posts/{post_id}/comments'): Route(7, lambda f: {
+        'url': f'/api/posts/{f.post.id}/comments', 'json': {'content': 'Created'}, 'headers': f.alice_auth}),
+    ('GET', '/comments/'): Route(1, lambda f: {'url': '/api/comments/', 'params': {'ids': f.comment.id}}),
+    ('POST', '/comments/{comment_id}'): Route(8, lambda f: {
+        'url': f'/api/comments/{f.comment.id}', 'json': {'content': 'Created'}, 'headers': f.alice_auth}),
+    ('DELETE', '/comments/{comment_id}'): Route(8, lambda f: {
+        'url': f'/api/comments/{f.new_comment().id}', 'headers': f.alice_auth}),
+    ('PATCH', '/comments/{comment_id}'): Route(7, lambda f: {
+        'url': f'/api/comments/{f.comment.id}', 'json': {'content': 'Edited'}, 'headers': f.bob_auth}),
+    ('PATCH', '/comments/{comment_id}/vote/{vote}'): Route(8, lambda f: {
+        'url': f'/api/comments/{f.comment.id}/vote/1', 'headers': f.new_user()}),
+    ('GET', '/comments/{comment_id}/tree'): Route(4, _get('/api/comments/{fixture.comment.id}/tree')),
+    ('POST', '/votes/batch'): Route(12, lambda f: {'url': '/api/votes/batch', 'headers': f.new_user(), 'json': {
+        'posts': [{'id': post.id, 'vote': 1} for post in f.posts],
+        'comments': [{'id': comment.id, 'vote': -1} for comment in f.comments]}}),
+    ('GET', '/search/'): Route(1, _get('/api/search/', params={'q': 'content', 'resub': 'budget'})),
+    ('GET', '/metrics/'): Route(0, _get('/api/metrics/')),
+}
+
+
+class StatementRecorder:
+    """Records the statements executed by the engines while enabled."""
+
+    def __init__(self):
+        self.enabled = False
+        self.statements: List[str] = []
+        self._engines = [recorded for recorded in (engine, reader) if recorded is not None]
+        for recorded in self._engines:
+            event.listen(recorded, 'before_cursor_execute', self._record)
+
+    def close(self):
+        for recorded in self._engines:
+            event.remove(recorded, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled:
+            self.statements.append(' '.join(statement.split()))
+
+    def measure(self, call: Callable[[], Any]) -> Tuple[Any, List[str]]:
+        self.statements = []
+        self.enabled = True
+        try:
+            return call(), self.statements
+        finally:
+            self.enabled = False
+
+
+def measure_routes(fixture: Fixture, recorder: StatementRecorder) -> Dict[Tuple[str, str], Tuple[int, List[str]]]:
+    """Call every route, and get the status code and statements of each."""
+    results = {}
+    for (method, path), route in routes.items():
+        request = route.request(fixture)
+        response, statements = recorder.measure(lambda: fixture.client.request(method, **request))
+        results[method, path] = response.status_code, statements
+
+    return results
+
+
+@pytest.fixture(scope='module')
+def runs() -> List[Dict[Tuple[str, str], Tuple[int, List[str]]]]:
+    """Measure every route once for every size the fixture grows by."""
+    recorder = StatementRecorder()
+    fixture = Fixture(TestClient(app))
+    try:
+        measured = []
+        for size in sizes:
+            fixture.grow(size)
+            measured.append(measure_routes(fixture, recorder))
+        yield measured
+    finally:
+        recorder.close()
+        fixture.db.close()
+
+
+def test_every_route_has_budget():
+    missing = [f'{method} {route.path}' for route in api_router.routes for method in sorted(route.methods)
+               if (method, route.path) not in routes]
+    assert not missing, 'Routes without a budget'
+
+
+@pytest.mark.parametrize('method, path', list(routes), ids=[f'{method} {path}' for method, path in routes])
+def test_route_within_budget(runs, method: str, path: str):
+    budget = routes[method, path].budget
+    codes = [run[method, path][0] for run in runs]
+    counts = [len(run[method, path][1]) for run in runs]
+    statements = '\n'.join(runs[-1][method, path][1])
+
+    assert all(code < 400 for code in codes), f'Status codes {codes}'
+    assert max(counts) <= budget, f'{counts} statements over budget of {budget}:\n{statements}'
+    assert len(set(counts)) == 1, f'{counts} statements grow with the data:\n{statements}'
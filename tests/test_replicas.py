@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from starlette.testclient import TestClient
+
+from repost import app, config, crud, database, models
+
+
+def sqlite_engine(path):
+    return create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+
+
+@pytest.fixture
+def replica(tmp_path):
+    """An engine of a replica file with a copy of the primary file, made
+    after the fixtures before it.
+    """
+    primary = sqlite3.connect(make_url(config.database_url).database)
+    copy = sqlite3.connect(str(tmp_path / 'replica.db'))
+    primary.backup(copy)
+    primary.close()
+    copy.close()
+
+    replica = sqlite_engine(tmp_path / 'replica.db')
+    yield replica
+    replica.dispose()
+
+
+@pytest.fixture
+def missing(tmp_path):
+    """An engine of a replica file that cannot be opened."""
+    return sqlite_engine(tmp_path / 'missing' / 'replica.db')
+
+
+@pytest.fixture
+def use_replicas(monkeypatch):
+    """Get a function that routes reads to the given replicas."""
+    def use(*engines):
+        replicas = database.Replicas(list(engines), retry_interval=60)
+        monkeypatch.setattr(database, 'replicas', replicas)
+        return replicas
+
+    return use
+
+
+@pytest.fixture
+def user(db, unique):
+    return crud.create_user(db, username=unique('user'), hashed_password='')
+
+
+def test_gets_read_the_replica(db, user, replica, use_replicas):
+    use_replicas(replica)
+    crud.update_user(db, username=user.username, bio='Primary')
+
+    client = TestClient(app)
+    assert client.get(f'/api/users/{user.username}').json()['bio'] is None
+
+
+def test_writes_go_to_the_primary(db, unique, user, replica, use_replicas):
+    use_replicas(replica)
+    username = unique('user')
+
+    response = TestClient(app).post('/api/users/', json={'username': username, 'password': 'password'})
+    assert response.status_code == 201
+    assert db.query(models.User).filter_by(username=username).count() == 1
+    assert replica.execute('SELECT count(*) FROM users WHERE username = ?', username).scalar() == 0
+
+    # A read-only session reads its own writes from the primary
+    session = database.open_session(read_only=True)
+    try:
+        assert session.get_bind() is replica
+        session.query(models.User).filter_by(username=user.username).update({models.User.bio: 'Written'},
+                                                                            synchronize_session=False)
+        assert session.get_bind() is not replica
+        assert session.query(models.User.bio).filter_by(username=user.username).scalar() == 'Written'
+    finally:
+        session.rollback()
+        session.close()
+
+
+def test_reads_fail_over(db, user, replica, missing, use_replicas):
+    crud.update_user(db, username=user.username, bio='Primary')
+    client = TestClient(app)
+
+    # Reads go to the next replica, and to the primary when every replica
+    # fails
+    replicas = use_replicas(missing, replica)
+    assert client.get(f'/api/users/{user.username}').json()['bio'] is None
+    assert replicas.choose() is replica
+
+    replicas = use_replicas(missing)
+    assert client.get(f'/api/users/{user.username}').json()['bio'] == 'Primary'
+    assert replicas.choose() is None
@@ -0,0 +1,163 @@
+import asyncio
+import random
+import threading
+
+import pytest
+
+from repost import config, crud, models, tasks
+from repost.crud import ranking, votes
+from repost.crud.votes import VoteBuffer
+from repost.database import SessionLocal
+
+
+@pytest.fixture
+def users(db, unique):
+    users = [models.User(username=unique('voter'), hashed_password='') for _ in range(4)]
+    db.add_all(users)
+    db.commit()
+    return [user.id for user in users]
+
+
+@pytest.fixture
+def post(db, resub):
+    return crud.create_post(db, author_id=resub.owner_id, parent_resub_id=resub.id, title='Post')
+
+
+@pytest.fixture
+def comment(db, resub, post):
+    return crud.create_comment(db, author_id=resub.owner_id, parent_post_id=post.id, parent_resub_id=resub.id,
+                               content='Comment')
+
+
+def scores(db, model, item_id):
+    db.expire_all()
+    return db.query(model.score, model.upvotes, model.downvotes).filter_by(id=item_id).one()
+
+
+def stored_scores(db, vote_model, item_column, item_id):
+    """Get the scores computed from the stored votes of an item."""
+    votes = [vote for vote, in db.query(vote_model.vote).filter(item_column == item_id)]
+    return sum(votes), sum(vote > 0 for vote in votes), sum(vote < 0 for vote in votes)
+
+
+def test_flush_writes_buffered_votes(db, users, post, comment):
+    buffer = VoteBuffer()
+    buffer.add(crud.vote_posts, post.id, users[0], 1)
+    buffer.add(crud.vote_posts, post.id, users[0], -1)
+    buffer.add(crud.vote_posts, post.id, users[1], 1)
+    buffer.add(crud.vote_comments, comment.id, users[0], 1)
+    assert len(buffer) == 3
+    assert scores(db, models.Post, post.id) == (0, 0, 0)
+
+    buffer.flush(db)
+    assert len(buffer) == 0
+    assert scores(db, models.Post, post.id) == (0, 1, 1)
+    assert scores(db, models.Comment, comment.id) == (1, 1, 0)
+
+
+def test_failed_flush_buffers_votes_again(db, users, post):
+    buffer = VoteBuffer()
+    down = True
+
+    def write(session, buffered):
+        if down:
+            # A vote on the same item during the flush replaces the failed one
+            buffer.add(write, post.id, users[0], -1)
+            raise RuntimeError('Database is down')
+        crud.vote_posts(session, buffered)
+
+    buffer.add(write, post.id, users[0], 1)
+    buffer.add(write, post.id, users[1], 1)
+    buffer.add(crud.vote_posts, post.id, users[2], 1)
+    with pytest.raises(RuntimeError):
+        buffer.flush(db)
+    assert len(buffer) == 3
+    assert scores(db, models.Post, post.id) == (0, 0, 0)
+
+    down = False
+    buffer.flush(db)
+    assert len(buffer) == 0
+    assert scores(db, models.Post, post.id) == (1, 2, 1)
+
+
+def test_stop_tasks_flushes_votes(db, monkeypatch, users, post, comment):
+    buffer = VoteBuffer()
+    monkeypatch.setattr(config, 'vote_write_behind', True)
+    for module in (votes, crud.posts, crud.comments):
+        monkeypatch.setattr(module, 'vote_buffer', buffer)
+
+    crud.vote_post(db, post_id=post.id, author_id=users[0], vote=1)
+    crud.vote_comment(db, comment_id=comment.id, author_id=users[0], vote=-1)
+    assert len(buffer) == 2
+    assert scores(db, models.Post, post.id) == (0, 0, 0)
+
+    asyncio.run(tasks.stop_tasks())
+    assert len(buffer) == 0
+    assert scores(db, models.Post, post.id) == (1, 1, 0)
+    assert scores(db, models.Comment, comment.id) == (-1, 0, 1)
+
+
+@pytest.mark.parametrize('model, vote_model, item_column, write', [
+    (models.Post, models.PostVote, models.PostVote.post_id, crud.vote_posts),
+    (models.Comment, models.CommentVote, models.CommentVote.comment_id, crud.vote_comments),
+], ids=['posts', 'comments'])
+def test_concurrent_votes_keep_scores_consistent(db, resub, users, model, vote_model, item_column, write):
+    posts = [crud.create_post(db, author_id=resub.owner_id, parent_resub_id=resub.id, title='Post')
+             for _ in range(10)]
+    if model is models.Comment:
+        items = [crud.create_comment(db, author_id=resub.owner_id, parent_post_id=post.id,
+                                     parent_resub_id=resub.id, content='Comment') for post in posts]
+    else:
+        items = posts
+    item_ids = [item.id for item in items]
+
+    # Two threads per user, so that identical and different votes by the
+    # same user race, along with votes by other users
+    rng = random.Random(1)
+    for item_id in item_ids:
+        thread_votes = [(user_id, rng.choice((1, 1, -1, 0))) for user_id in users for _ in range(2)]
+        barrier = threading.Barrier(len(thread_votes))
+        errors = []
+
+        def vote(author_id, value):
+            session = SessionLocal()
+            try:
+                barrier.wait()
+                write(session, {(item_id, author_id): value})
+            except Exception as error:
+                errors.append(error)
+            finally:
+                session.close()
+
+        threads = [threading.Thread(target=vote, args=args) for args in thread_votes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+
+    for item_id in item_ids:
+        assert tuple(scores(db, model, item_id)) == stored_scores(db, vote_model, item_column, item_id)
+
+
+def test_refreshing_ranks_keeps_ranks_of_votes_cast_meanwhile(db, monkeypatch, users, post):
+    post_id = post.id
+    update_ranks = ranking.update_ranks
+
+    def vote_then_update(session, posts, now=None):
+        # The vote lands after the refresh read the score of the post
+        vote_session = SessionLocal()
+        try:
+            crud.vote_posts(vote_session, {(post_id, users[0]): 1, (post_id, users[1]): 1})
+        finally:
+            vote_session.close()
+        update_ranks(session, posts, now)
+
+    monkeypatch.setattr(ranking, 'update_ranks', vote_then_update)
+    crud.refresh_ranks(db, id_range=(post_id, post_id))
+
+    db.expire_all()
+    score, hot, created = db.query(models.Post.score, models.Post.hot_rank, models.Post.created).filter_by(
+        id=post_id).one()
+    assert score == 2
+    assert hot == ranking.hot_rank(2, created)